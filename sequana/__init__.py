@@ -1,9 +1,15 @@
 
-import pkg_resources
+import sys
+
 try:
-    version = pkg_resources.require("sequana")[0].version
-except:
-    version = ">=0.9.3"
+    from importlib.metadata import version as _get_version
+    version = _get_version("sequana")
+except Exception:
+    try:
+        import pkg_resources
+        version = pkg_resources.require("sequana")[0].version
+    except:
+        version = ">=0.9.3"
 
 from easydev.logging_tools import Logging
 try:
@@ -19,33 +25,80 @@ sequana_config_path = configuration.user_config_dir
 # This must be import before all other modules (sequana_data function)
 from .datatools import sequana_data
 
-from .assembly import *
-from .adapters import AdapterReader, FindAdaptersFromDesign, Adapter
-from .bamtools import BAM, SAMFlags, SAM, CRAM
-from .bed import BED
-from .bedtools import GenomeCov
-from .cigar import Cigar
-from .coverage import Coverage
-from .expdesign import ExpDesignAdapter
-from .fastq import FastQ, FastQC, Identifier
-from .fasta import FastA
-from .gff3 import GFF3
-from .freebayes_vcf_filter import VCF_freebayes
-from .freebayes_bcf_filter import BCF_freebayes
-from .itol import ITOL
-from .kraken_builder import KrakenBuilder
-from .krona import KronaMerger
-from .kraken import KrakenResults, KrakenPipeline, KrakenAnalysis, KrakenDownload, KrakenSequential
-from .pacbio import PacbioSubreads
-from .phred import Quality
-from .rnadiff import RNADiffResults
-from .running_median import RunningMedian
-from .snaketools import *
-from .snpeff import SnpEff
-from .sequence import DNA, RNA, Sequence, Repeats
-from .trf import TRF
-
-# The standalone app
-from . import scripts
+# All other classes are exported lazily: the submodule (and its dependencies
+# such as pysam, pandas or snakemake) is only imported when the class is used
+# for the first time, which keeps "import sequana" and the standalone
+# applications fast to start. Keys are submodules, values the exported names.
+from sequana.lazyimports import LazyImport
+
+_lazy_exports = {
+    "assembly": ["BUSCO"],
+    "adapters": ["AdapterReader", "FindAdaptersFromDesign", "Adapter",
+                 "AdapterScanner"],
+    "bamtools": ["BAM", "SAMFlags", "SAM", "CRAM"],
+    "bed": ["BED"],
+    "bedtools": ["GenomeCov"],
+    "cigar": ["Cigar"],
+    "coverage": ["Coverage"],
+    "expdesign": ["ExpDesignAdapter"],
+    "fastq": ["FastQ", "FastQC", "Identifier"],
+    "fasta": ["FastA"],
+    "gff3": ["GFF3"],
+    "freebayes_vcf_filter": ["VCF_freebayes"],
+    "freebayes_bcf_filter": ["BCF_freebayes"],
+    "itol": ["ITOL"],
+    "kraken_builder": ["KrakenBuilder"],
+    "krona": ["KronaMerger"],
+    "kraken": ["KrakenResults", "KrakenPipeline", "KrakenAnalysis",
+               "KrakenDownload", "KrakenSequential"],
+    "pacbio": ["PacbioSubreads"],
+    "phred": ["Quality"],
+    "rnadiff": ["RNADiffResults"],
+    "running_median": ["RunningMedian"],
+    "snaketools": ["DOTParser", "FastQFactory", "FileFactory", "Module",
+                   "PipelineManager", "PipelineManagerGeneric",
+                   "SnakeMakeStats", "SequanaConfig", "modules",
+                   "pipeline_names"],
+    "snpeff": ["SnpEff"],
+    "sequence": ["DNA", "RNA", "Sequence", "Repeats"],
+    "trf": ["TRF"],
+}
+
+_lazy_names = {name: module for module, names in _lazy_exports.items()
+               for name in names}
+_lazy_modules = {module: LazyImport("sequana." + module)
+                 for module in _lazy_exports}
+
+__all__ = ["version", "logger", "configuration", "sequana_config_path",
+           "sequana_data", "scripts"] + list(_lazy_names)
+
+
+def __getattr__(name):
+    # only called if the name is not found the usual way (PEP 562)
+    if name == "scripts":
+        # The standalone app
+        import sequana.scripts
+        return sequana.scripts
+    try:
+        module = _lazy_modules[_lazy_names[name]]
+    except KeyError:
+        raise AttributeError("module 'sequana' has no attribute '{}'".format(name))
+    value = getattr(module, name)
+    # cache it so that __getattr__ is not called again for this name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
 
+if sys.version_info < (3, 7):  # pragma: no cover
+    # module __getattr__ (PEP 562) is ignored before Python 3.7: import
+    # everything eagerly as in previous versions
+    import importlib
+    for _module, _names in _lazy_exports.items():
+        _module = importlib.import_module("sequana." + _module)
+        for _name in _names:
+            globals()[_name] = getattr(_module, _name)
+    from . import scripts
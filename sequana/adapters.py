@@ -817,3 +817,308 @@ class FindAdaptersFromDesign(object):
 
 
         return file_fwd, file_revc
+
+
+# codes of the letters in the automaton of the AdapterScanner. Any other
+# letter (e.g. N) gets the code 4 in the adapters and the code 5 in the reads
+# (as the padding of the batches) so that they never match
+_PAD = 5
+_ADAPTER_CODES = bytes.maketrans(b"ACGT", b"\x00\x01\x02\x03")
+_ADAPTER_CODES = bytes([x if x < 4 else 4 for x in _ADAPTER_CODES])
+_READ_CODES = bytes([x if x < 4 else _PAD for x in _ADAPTER_CODES])
+
+
+def _build_automaton(patterns):
+    # Aho-Corasick automaton of a list of (encoded) patterns. Returns the full
+    # transition table (states x 6 codes) and the patterns ending at each
+    # state (CSR layout: out_indices[out_indptr[s]:out_indptr[s+1]])
+    import collections
+    from sequana.lazy import numpy as np
+
+    goto = [{}]
+    outputs = [[]]
+    for i, pattern in enumerate(patterns):
+        state = 0
+        for code in pattern:
+            if code not in goto[state]:
+                goto.append({})
+                outputs.append([])
+                goto[state][code] = len(goto) - 1
+            state = goto[state][code]
+        outputs[state].append(i)
+
+    N = len(goto)
+    delta = np.zeros((N, _PAD + 1), dtype=np.int32)
+    fail = [0] * N
+    queue = collections.deque()
+    for code in range(_PAD):
+        if code in goto[0]:
+            delta[0, code] = goto[0][code]
+            queue.append(goto[0][code])
+    # breadth-first so that the failure state is always known
+    while queue:
+        state = queue.popleft()
+        outputs[state] = outputs[state] + outputs[fail[state]]
+        for code in range(_PAD):
+            if code in goto[state]:
+                child = goto[state][code]
+                fail[child] = delta[fail[state], code]
+                delta[state, code] = child
+                queue.append(child)
+            else:
+                delta[state, code] = delta[fail[state], code]
+    # padding (and unknown letters) always goes back to the root
+    delta[:, _PAD] = 0
+
+    out_indptr = np.zeros(N + 1, dtype=np.int64)
+    out_indptr[1:] = np.cumsum([len(x) for x in outputs])
+    out_indices = np.array([i for x in outputs for i in x], dtype=np.int32)
+    return delta, out_indptr, out_indices
+
+
+def _scan_batch(sequences, delta, out_indptr, out_indices, lengths):
+    # Run the automaton over a batch of sequences (all reads at once, one
+    # position at a time). Returns the number of reads with each pattern and
+    # the histogram of the position of their first occurrence in the reads.
+    from sequana.lazy import numpy as np
+
+    P = len(lengths)
+    if len(sequences) == 0:
+        return np.zeros(P, dtype=np.int64), np.zeros((P, 0), dtype=np.int64)
+
+    sizes = np.array([len(x) for x in sequences])
+    L = int(sizes.max())
+    data = "".join(sequences).encode("ascii").translate(_READ_CODES)
+    reads = np.full((len(sequences), L), _PAD, dtype=np.uint8)
+    reads[np.arange(L) < sizes[:, None]] = np.frombuffer(data, dtype=np.uint8)
+
+    terminal = np.diff(out_indptr) > 0
+    states = np.zeros(len(sequences), dtype=np.int32)
+    hit_reads, hit_patterns, hit_positions = [], [], []
+    for position in range(L):
+        states = delta[states, reads[:, position]]
+        rows = np.nonzero(terminal[states])[0]
+        if len(rows) == 0:
+            continue
+        # expand the patterns ending at the state of each read
+        starts = out_indptr[states[rows]]
+        counts = out_indptr[states[rows] + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        patterns = out_indices[np.repeat(starts, counts) + offsets]
+        hit_reads.append(np.repeat(rows, counts))
+        hit_patterns.append(patterns)
+        hit_positions.append(position + 1 - lengths[patterns])
+
+    profile = np.zeros((P, L), dtype=np.int64)
+    if len(hit_reads) == 0:
+        return np.zeros(P, dtype=np.int64), profile
+
+    hit_reads = np.concatenate(hit_reads)
+    hit_patterns = np.concatenate(hit_patterns)
+    hit_positions = np.concatenate(hit_positions)
+    # hits are sorted by position so the first one of a (read, pattern) pair
+    # is its first occurrence
+    _, first = np.unique(hit_reads * P + hit_patterns, return_index=True)
+    np.add.at(profile, (hit_patterns[first], hit_positions[first]), 1)
+    return np.bincount(hit_patterns[first], minlength=P), profile
+
+
+class AdapterScanner(object):
+    """Detect adapters in FastQ reads
+
+    ::
+
+        from sequana import sequana_data
+        from sequana.adapters import AdapterScanner
+        scanner = AdapterScanner(sequana_data("adapters_Nextera_fwd.fa"))
+        scanner.scan(sequana_data("test.fastq"))
+        scanner.get_hits()
+        scanner.get_profiles()
+
+    The first *k* bases of all adapters and of their reverse complement are
+    stored in a single Aho-Corasick automaton, which is built once. Reads are
+    then read by batches and each batch is scanned in one pass whatever the
+    number of adapters. Batches are processed in a pool of *jobs* processes.
+
+    For each adapter and strand, we report the number of reads that contain
+    the adapter (a read is counted once even if the adapter is found several
+    times) and the histogram of the position of the adapter in the reads
+    (first occurrence).
+
+    Adapters sharing their first *k* bases (e.g., index adapters starting
+    with the same universal sequence) are all reported for the same hit.
+    Only upper case A, C, G, T letters are matched.
+
+    """
+    strands = ("fwd", "revcomp")
+
+    def __init__(self, adapters, k=12, jobs=1, batch_size=10000):
+        """.. rubric:: constructor
+
+        :param adapters: an :class:`AdapterReader` or a FASTA file of
+            adapters (forward strand)
+        :param int k: length of the prefix of the adapters to search for.
+            Shorter adapters are searched for entirely. If None, the full
+            adapters are searched for (e.g., to distinguish index adapters).
+        :param int jobs: number of processes used to scan the reads
+        :param int batch_size: number of reads scanned at once
+        """
+        from sequana.sequence import DNA
+        from sequana.lazy import numpy as np
+
+        self.adapters = AdapterReader(adapters)
+        self.k = k
+        self.jobs = jobs
+        self.batch_size = batch_size
+
+        patterns = []
+        for sequence in self.adapters.sequences:
+            sequence = sequence.upper()
+            revcomp = DNA(sequence).get_reverse_complement()
+            if k is not None:
+                sequence, revcomp = sequence[:k], revcomp[:k]
+            patterns.append(sequence)
+            patterns.append(revcomp)
+        # pattern 2*i is the adapter i and 2*i+1 its reverse complement
+        self._patterns = patterns
+        self._lengths = np.array([len(x) for x in patterns], dtype=np.int64)
+        encoded = [x.encode("ascii").translate(_ADAPTER_CODES) for x in patterns]
+        self._automaton = _build_automaton(encoded)
+        self.reset()
+
+    def __repr__(self):
+        return "AdapterScanner: {} adapters ({} states)".format(
+            len(self.adapters), len(self._automaton[0]))
+
+    def reset(self):
+        """Reset the counts"""
+        from sequana.lazy import numpy as np
+        self.N = 0
+        self._counts = np.zeros(len(self._patterns), dtype=np.int64)
+        self._profiles = np.zeros((len(self._patterns), 0), dtype=np.int64)
+
+    def find(self, sequence):
+        """Return the adapters found in one sequence
+
+        :return: list of tuples with the identifier of the adapter, the
+            strand (fwd or revcomp) and the position of its first occurrence
+        """
+        from sequana.lazy import numpy as np
+        counts, profile = _scan_batch([sequence], *self._automaton, self._lengths)
+        hits = []
+        for i in np.nonzero(counts)[0]:
+            position = int(np.nonzero(profile[i])[0][0])
+            hits.append((self.adapters.identifiers[i // 2], self.strands[i % 2],
+                         position))
+        return sorted(hits, key=lambda x: x[2])
+
+    def _add(self, counts, profile):
+        from sequana.lazy import numpy as np
+        self._counts += counts
+        if profile.shape[1] > self._profiles.shape[1]:
+            # longer reads than before
+            profiles = np.zeros((len(profile), profile.shape[1]), dtype=np.int64)
+            profiles[:, :self._profiles.shape[1]] = self._profiles
+            self._profiles = profiles
+        self._profiles[:, :profile.shape[1]] += profile
+
+    def _batches(self, filename, max_reads=None):
+        batch = []
+        with pysam.FastxFile(filename) as fin:
+            for i, read in enumerate(fin):
+                if max_reads is not None and i >= max_reads:
+                    break
+                batch.append(read.sequence)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def scan(self, filename, max_reads=None):
+        """Scan the reads of a FastQ file (possibly gzipped)
+
+        Counts are added to the counts of previous calls (see :meth:`reset`).
+
+        :param str filename: the FastQ file
+        :param int max_reads: scan only the first reads of the file
+        :return: the number of scanned reads
+        """
+        N = 0
+        if self.jobs > 1:
+            import collections
+            from concurrent.futures import ProcessPoolExecutor
+            pending = collections.deque()
+            with ProcessPoolExecutor(self.jobs) as executor:
+                for batch in self._batches(filename, max_reads):
+                    N += len(batch)
+                    pending.append(executor.submit(_scan_batch, batch,
+                                   *self._automaton, self._lengths))
+                    # keep a bounded number of batches in memory
+                    while len(pending) > 2 * self.jobs:
+                        self._add(*pending.popleft().result())
+                while pending:
+                    self._add(*pending.popleft().result())
+        else:
+            for batch in self._batches(filename, max_reads):
+                N += len(batch)
+                self._add(*_scan_batch(batch, *self._automaton, self._lengths))
+        self.N += N
+        return N
+
+    def get_hits(self):
+        """Return number of reads with each adapter as a dataframe
+
+        Columns are the counts on each strand (fwd and revcomp), their sum
+        and the percentage of reads (total) with the adapter.
+        """
+        from sequana.lazy import pandas as pd
+        df = pd.DataFrame(self._counts.reshape(-1, 2), columns=self.strands,
+                          index=self.adapters.identifiers)
+        df["total"] = df["fwd"] + df["revcomp"]
+        df["percentage"] = df["total"] * 100. / max(self.N, 1)
+        return df
+
+    def get_profiles(self, strand="fwd", cumulative=True):
+        """Return the position profiles of the adapters as a dataframe
+
+        :param str strand: fwd, revcomp or both
+        :param bool cumulative: if True, values are the percentage of reads
+            with the adapter at or before each position (as in FastQC).
+            Otherwise, the number of reads with the adapter at that position.
+        :return: a dataframe with one column per adapter and one row per
+            position in the reads.
+        """
+        from sequana.lazy import pandas as pd
+        profiles = self._profiles.reshape(len(self.adapters), 2, -1)
+        if strand == "both":
+            profiles = profiles.sum(axis=1)
+        elif strand in self.strands:
+            profiles = profiles[:, self.strands.index(strand), :]
+        else:
+            raise ValueError("strand must be one of fwd, revcomp or both")
+
+        if cumulative:
+            profiles = profiles.cumsum(axis=1) * 100. / max(self.N, 1)
+        return pd.DataFrame(profiles.T, columns=self.adapters.identifiers)
+
+    def plot_profiles(self, strand="both", min_percentage=0.1, ax=None):
+        """Plot the cumulative profiles of the adapters found in the reads
+
+        :param float min_percentage: only adapters found in more than this
+            percentage of reads are shown
+        """
+        import pylab
+        df = self.get_profiles(strand=strand, cumulative=True)
+        df = df.loc[:, df.max() > min_percentage]
+        if ax is None:
+            pylab.clf()
+            ax = pylab.gca()
+        for name in df.columns:
+            ax.plot(df.index + 1, df[name], label=name.split("|")[0])
+        ax.set_xlabel("Position in read (bp)")
+        ax.set_ylabel("% of reads with adapter")
+        ax.grid(True)
+        if len(df.columns):
+            ax.legend()
+        return ax
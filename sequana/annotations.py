@@ -16,13 +16,275 @@
 ##############################################################################
 import os
 
-__all__ = ["Annotation"]
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana import logger
+logger.name = __name__
+
+__all__ = ["Annotation", "FeatureIndex"]
 
 
 class Annotation():
+    """Base class of the annotation files (GFF3, GenBank)
+
+    Children classes provide a :meth:`get_table` method returning a DataFrame
+    with one feature per row. The name of the columns used to index the
+    features (contig, start, end) are stored in the :attr:`_index_columns`
+    attribute.
+    """
+    # bump this number whenever the layout of the sidecar files changes
+    _sidecar_version = 2
+    _index_columns = ("seqid", "start", "stop")
 
     def __init__(self, filename):
 
         self.filename = filename
         assert os.path.exists(filename)
+        self._table = None
+        self._index = None
+
+    def get_table(self, cache=False):  # pragma: no cover
+        raise NotImplementedError
+
+    def get_index(self):
+        """Return a :class:`FeatureIndex` of the features
+
+        Rows returned by the index queries are positions in :meth:`get_table`.
+        """
+        if self._index is None:
+            df = self.get_table()
+            seqid, start, end = self._index_columns
+            self._index = FeatureIndex(df[seqid], df[start], df[end])
+        return self._index
+
+    def get_overlaps(self, seqid, start, end):
+        """Return the features overlapping a region (inclusive positions)
+
+        ::
+
+            gff = GFF3(filename)
+            gff.get_overlaps("chrI", 1000, 2000)
+
+        """
+        rows = self.get_index().overlap(seqid, start, end)
+        return self.get_table().iloc[rows]
+
+    def _get_sidecar_name(self, cache):
+        if cache is True:
+            return self.filename + ".sequana.npz"
+        return cache
+
+    def _load_sidecar(self, cache, arrays=False):
+        """Return the DataFrame stored in a sidecar file
+
+        None is returned if the sidecar does not exist or if the annotation
+        file changed (size or modification time) since the sidecar was saved.
+        If *arrays* is True, the extra arrays saved with the DataFrame are
+        also returned (in a dictionary).
+        """
+        sidecar = self._get_sidecar_name(cache)
+        if not os.path.exists(sidecar):
+            return (None, None) if arrays else None
+
+        stat = os.stat(self.filename)
+        with np.load(sidecar, allow_pickle=False) as data:
+            if int(data["__version__"]) != self._sidecar_version or \
+                    int(data["__size__"]) != stat.st_size or \
+                    int(data["__mtime__"]) != stat.st_mtime_ns:
+                logger.info("{} is outdated. Ignored".format(sidecar))
+                return (None, None) if arrays else None
+            df = _unpack_dataframe(data)
+            if arrays:
+                extra = {key[6:]: data[key] for key in data.files
+                         if key.startswith("extra:")}
+                return df, extra
+            return df
+
+    def _save_sidecar(self, cache, df, arrays=None):
+        """Save a DataFrame (and extra arrays) in a binary sidecar (npz)"""
+        sidecar = self._get_sidecar_name(cache)
+        stat = os.stat(self.filename)
+        data = _pack_dataframe(df)
+        for name, values in (arrays or {}).items():
+            data["extra:" + name] = np.asarray(values)
+        data["__version__"] = np.array(self._sidecar_version)
+        data["__size__"] = np.array(stat.st_size)
+        data["__mtime__"] = np.array(stat.st_mtime_ns)
+        # np.savez appends .npz if missing; write through a file handle
+        with open(sidecar, "wb") as fout:
+            np.savez(fout, **data)
+
+
+def _pack_strings(values):
+    """Pack strings into a single NUL-separated utf-8 buffer (no pickling)"""
+    text = "\x00".join(values)
+    return np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(buffer, size=None):
+    """Unpack strings packed with :func:`_pack_strings`
+
+    An empty buffer is either no string or a single empty string; *size*
+    (the number of strings, if known) tells the two apart.
+    """
+    if size == 0:
+        return []
+    if len(buffer) == 0:
+        return [""]
+    return buffer.tobytes().decode("utf-8").split("\x00")
+
+
+def _pack_dataframe(df):
+    """Convert a DataFrame into a dictionary of numpy arrays
+
+    Categorical columns are stored as codes and categories, numeric columns
+    as is and other columns (strings) as a packed utf-8 buffer.
+    """
+    arrays = {"__columns__": _pack_strings(df.columns),
+              "__rows__": np.array(len(df))}
+    for i, name in enumerate(df.columns):
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays["{}:codes".format(i)] = column.cat.codes.values
+            arrays["{}:categories".format(i)] = _pack_strings(
+                [str(x) for x in column.cat.categories])
+        elif pd.api.types.is_numeric_dtype(column.dtype):
+            arrays["{}:values".format(i)] = column.values
+        else:
+            arrays["{}:strings".format(i)] = _pack_strings(
+                column.fillna("").astype(str))
+    return arrays
+
+
+def _unpack_dataframe(data):
+    columns = _unpack_strings(data["__columns__"])
+    rows = int(data["__rows__"])
+    df = {}
+    for i, name in enumerate(columns):
+        if "{}:codes".format(i) in data:
+            categories = _unpack_strings(data["{}:categories".format(i)])
+            if len(categories) == 1 and categories[0] == "":
+                categories = []
+            df[name] = pd.Categorical.from_codes(data["{}:codes".format(i)],
+                categories=categories)
+        elif "{}:values".format(i) in data:
+            df[name] = data["{}:values".format(i)]
+        else:
+            df[name] = _unpack_strings(data["{}:strings".format(i)], rows)
+    return pd.DataFrame(df, columns=columns)
+
+
+class FeatureIndex(object):
+    """Per-contig index of features for fast overlap queries
+
+    On each contig, features are grouped by length class (lengths between
+    two consecutive powers of 2) and sorted by start position. Within a
+    class, the features overlapping a query start at most one class length
+    before the query, which gives a narrow range of candidates with two
+    binary searches. A few long features (e.g. a region or chromosome line
+    spanning the whole contig) therefore do not widen the search for the
+    others. Queries can be made one at a time with :meth:`overlap` or in
+    batch with :meth:`batch_overlap`.
+
+    ::
+
+        index = FeatureIndex(df.seqid, df.start, df.stop)
+        index.overlap("chr1", 1000, 2000)
+
+    Positions are inclusive on both sides, as in GFF or GenBank files. Returned
+    values are row positions in the input arrays (e.g. used with
+    :meth:`pandas.DataFrame.iloc`).
+    """
+    def __init__(self, seqids, starts, ends):
+        seqids = np.asarray(seqids).astype(str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if not (len(seqids) == len(starts) == len(ends)):
+            raise ValueError("seqids, starts and ends must have same length")
+
+        # length class of each feature: 0 for lengths below 1, then k for
+        # lengths in [2**(k-1), 2**k)
+        lengths = np.maximum(ends - starts, 0)
+        classes = np.zeros(len(lengths), dtype=np.int64)
+        positive = lengths > 0
+        classes[positive] = np.floor(np.log2(lengths[positive])).astype(
+            np.int64) + 1
+
+        self._index = {}
+        # a stable sort on seqid, class then start is done once for all
+        order = np.lexsort((starts, classes, seqids))
+        sorted_seqids = seqids[order]
+        names, first = np.unique(sorted_seqids, return_index=True)
+        last = list(first[1:]) + [len(order)]
+        for name, i, j in zip(names, first, last):
+            rows = order[i:j]
+            values, bounds = np.unique(classes[rows], return_index=True)
+            bounds = list(bounds) + [len(rows)]
+            self._index[name] = []
+            for x, y in zip(bounds[:-1], bounds[1:]):
+                these = rows[x:y]
+                self._index[name].append((starts[these], ends[these], these,
+                    int(lengths[these].max())))
+
+    def __len__(self):
+        return sum(len(x[2]) for groups in self._index.values()
+                   for x in groups)
+
+    def _get_contigs(self):
+        return sorted(self._index.keys())
+    contigs = property(_get_contigs, doc="list of indexed contigs")
+
+    def overlap(self, seqid, start, end):
+        """Return rows of features overlapping the interval [start, end]"""
+        query, rows = self.batch_overlap(seqid, [start], [end])
+        return rows
+
+    def batch_overlap(self, seqid, starts, ends):
+        """Return all overlaps between a set of intervals and the features
+
+        :param seqid: the contig name
+        :param starts: array of query start positions
+        :param ends: array of query end positions
+        :return: two arrays of same length. The first one contains the
+            position of the query in the input arrays, the second one the
+            rows of the overlapping features. Overlaps are sorted by query
+            and then by feature start.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        empty = np.array([], dtype=np.int64)
+        if str(seqid) not in self._index or len(starts) == 0:
+            return empty, empty
+
+        queries, fstarts, rows = [], [], []
+        for group in self._index[str(seqid)]:
+            query, candidates = self._batch_overlap(group, starts, ends)
+            queries.append(query)
+            fstarts.append(group[0][candidates])
+            rows.append(group[2][candidates])
+        queries = np.concatenate(queries)
+        fstarts = np.concatenate(fstarts)
+        rows = np.concatenate(rows)
+        order = np.lexsort((rows, fstarts, queries))
+        return queries[order], rows[order]
+
+    @staticmethod
+    def _batch_overlap(group, starts, ends):
+        # overlaps with the features of a length class (positions in group)
+        fstarts, fends, rows, maxlength = group
+        # candidates start within [start - maxlength, end]
+        lo = np.searchsorted(fstarts, starts - maxlength, side="left")
+        hi = np.searchsorted(fstarts, ends, side="right")
+        counts = np.maximum(hi - lo, 0)
+        total = counts.sum()
+        empty = np.array([], dtype=np.int64)
+        if total == 0:
+            return empty, empty
 
+        query = np.repeat(np.arange(len(starts)), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+            counts)
+        candidates = np.repeat(lo, counts) + offsets
+        keep = fends[candidates] >= starts[query]
+        return query[keep], candidates[keep]
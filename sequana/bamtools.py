@@ -39,15 +39,11 @@ import math
 from collections import Counter
 from collections import OrderedDict
 
-from bx.intervals.intersection import Interval, IntervalTree
-from bx.bitset import BinnedBitSet 
-from bx.bitset_builders import binned_bitsets_from_list
 from sequana.lazy import pandas as pd
 from sequana.lazy import numpy as np
 from sequana.lazy import pylab
 
-from sequana.bed import BED
-from sequana.cigar import fetch_intron, fetch_exon
+from sequana.cigar import fetch_intron
 
 import pysam
 from sequana import jsontool, logger
@@ -120,6 +116,32 @@ def is_cram(filename, *args):
     return f.is_cram
 
 
+def get_regions(bam, n_regions):
+    """Split the contigs of a BAM file into regions processed independently
+
+    :param bam: a :class:`pysam.AlignmentFile`
+    :param int n_regions: approximate number of regions. The number of
+        regions of a contig is proportional to its number of mapped reads
+        (contigs without mapped reads are skipped). If the statistics of the
+        index are not available, each contig is a region.
+    :return: list of (contig, start, end) tuples
+    """
+    try:
+        stats = {x.contig: x.mapped for x in bam.get_index_statistics()}
+    except ValueError:
+        stats = {}
+    total = sum(stats.values())
+    regions = []
+    for name, length in zip(bam.references, bam.lengths):
+        mapped = stats.get(name, 0)
+        if total and mapped == 0:
+            continue
+        N = max(1, int(round(n_regions * mapped / total))) if total else 1
+        bounds = np.linspace(0, length, N + 1).astype(int)
+        regions.extend((name, bounds[i], bounds[i + 1]) for i in range(N))
+    return regions
+
+
 class SAMBAMbase():
     """Base class for SAM/BAM/CRAM data sets
 
@@ -337,13 +359,22 @@ class SAMBAMbase():
         return next(self._data)
 
     @_reset
-    def infer_strandness(self, reference_bed, max_entries, mapq=30):
+    def infer_strandness(self, reference_bed, max_entries, mapq=30,
+                         n_regions=100, cache=False):
         """
         :param reference_bed: a BED file (12-columns with 
             columns 1,2,3,6 used) or GFF file (column 1, 3, 
-            4, 5, 6 are used
+            4, 5, 6 are used. It can also be a
+            :class:`~sequana.strandness.GeneStrandIndex` built once for
+            several BAM files.
         :param mapq: ignore alignment with mapq below 30.
         :param max_entries: can be long. max_entries restrict the estimate
+        :param n_regions: if the BAM file is indexed, reads are sampled over
+            this number of regions spread over the genome instead of being
+            taken from the start of the file.
+        :param cache: save the table of the annotation in a sidecar file
+            and use it next time (see
+            :class:`~sequana.strandness.GeneStrandIndex`).
 
         Strandness of transcript is determined from annotation while
         strandness of reads is determined from alignments.
@@ -364,130 +395,25 @@ class SAMBAMbase():
         If similar, it is no strand-specific.  If the first value is close to 1
         while the other is close to 0, this is a strand-specific dataset
 
+        To process several BAM files (e.g. all samples of a project) in
+        parallel, see :func:`sequana.strandness.infer_strandness`.
         """
-        count = 0
-        from collections import defaultdict
-        p_strandness = defaultdict(int)
-        s_strandness = defaultdict(int)
-
-        gene_ranges = {}
-        if reference_bed.endswith(".bed"):
-            with open(reference_bed, "r") as fin:
-                for line in fin:
-                    if line.startswith(('#','track','browser')):
-                        continue
-                    # Parse fields from gene tabls
-                    fields = line.split()
-                    chrom_name = fields[0]
-                    start = int( fields[1] )
-                    end = int( fields[2] )
-                    #gene_name = fields[3]
-                    strand = fields[5]
-
-                    if chrom_name not in gene_ranges:
-                        gene_ranges[chrom_name] = IntervalTree()
-                    gene_ranges[chrom_name].insert(start,end, strand)
-        elif reference_bed.endswith(".gff"):
-            with open(reference_bed, "r") as fin:
-                count = 0
-                for line in fin:
-                    count +=1
-                    if line.startswith(('#')):
-                        continue
-                    fields = line.split()
-                    if len(fields)<6:
-                        logger.warning("invalid format on line {}: {}".format(count, line))
-                    if fields[2] != "gene":
-                        continue
-                    chrom_name = fields[0]
-                    start = int( fields[3] )
-                    end = int( fields[4] )
-                    #gene_name = fields[3]
-                    strand = fields[6]
-                    if chrom_name not in gene_ranges:
-                        gene_ranges[chrom_name] = IntervalTree()
-                    gene_ranges[chrom_name].insert(start,end, strand)
-
-        self.gene_ranges = gene_ranges
+        from sequana.strandness import GeneStrandIndex, get_strandness_counts
+        if not isinstance(reference_bed, GeneStrandIndex):
+            reference_bed = GeneStrandIndex(reference_bed, cache=cache)
+        self.gene_index = reference_bed
 
-        count = 0
-        for aln in self:
-            if count >= max_entries:
-                break
-            if aln.is_qcfail:
-                continue
-            if aln.is_duplicate:
-                continue
-            if aln.is_secondary:
-                continue
-            if aln.is_unmapped:
-                continue
-            if aln.mapq < mapq:
-                continue
-
-            chrom_name = self._data.get_reference_name(aln.tid)
-
-            if aln.is_paired:
-                if aln.is_read1:
-                    read_id = '1'
-                if aln.is_read2:
-                    read_id = '2'
-                if aln.is_reverse:
-                    map_strand = '-'
-                else:
-                    map_strand = '+'
-                readStart = aln.pos
-                readEnd = readStart + aln.qlen
-                if chrom_name in gene_ranges:
-                    tmp = set(gene_ranges[chrom_name].find(readStart, readEnd))
-                    if len(tmp) == 0: 
-                        continue
-                    strand_from_gene = ':'.join(tmp)
-                    p_strandness[read_id + map_strand + strand_from_gene] += 1
-                    count += 1
-            else:
-                if aln.is_reverse:
-                    map_strand = '-'
-                else:
-                    map_strand = '+'
-                readStart = aln.pos
-                readEnd = readStart + aln.qlen
-                if chrom_name in gene_ranges:
-                    tmp = set(gene_ranges[chrom_name].find(readStart,readEnd))
-                    if len(tmp) == 0: continue
-                    strand_from_gene = ':'.join(tmp)
-                    s_strandness[map_strand + strand_from_gene] += 1
-                    count += 1
-
-        self.s_strandness = s_strandness
-        self.p_strandness = p_strandness
         # Fraction of reads failed to determine: 0.0189
         # Fraction of reads explained by "1++,1--,2+-,2-+": 0.6315
         # Fraction of reads explained by "1+-,1-+,2++,2--": 0.3497
-        # 
-        if len(p_strandness) >0 and len(s_strandness) ==0 :
-            protocol = "Paired-end"
-            spec1= (p_strandness['1++'] + p_strandness['1--'] 
-                    + p_strandness['2+-'] + p_strandness['2-+'])/float(sum(p_strandness.values()))
-            spec2= (p_strandness['1+-'] + p_strandness['1-+'] 
-                    + p_strandness['2++'] + p_strandness['2--'])/float(sum(p_strandness.values()))
-            other = 1 - spec1 - spec2
-
-        elif len(s_strandness) > 0 and len(p_strandness) == 0 :
-            protocol = "Singled-end"
-            spec1 = (s_strandness['++'] + s_strandness['--']) / float(sum(s_strandness.values()))
-            spec2 = (s_strandness['+-'] + s_strandness['-+']) / float(sum(s_strandness.values()))
-            other = 1-spec1-spec2
-        else:
-            protocol = "Mixture"
-            spec1 = "NA"
-            spec2 = "NA"
-            other = "NA"
-        return [protocol, spec1, spec2, other]
+        self.strandness_counts = get_strandness_counts(self._filename,
+            reference_bed, max_entries=max_entries, mapq=mapq,
+            n_regions=n_regions)
+        return self.strandness_counts.get_strandness()
 
     @_reset
     def mRNA_inner_distance(self, refbed, low_bound=-250, up_bound=250,
-            step=5, sample_size=1000000, q_cut=30):
+            step=5, sample_size=1000000, q_cut=30, jobs=1, cache=False):
 
         """Estimate the inner distance of mRNA pair end fragment.
 
@@ -497,164 +423,37 @@ class SAMBAMbase():
             b = BAM(sequana_data("test_hg38_chr18.bam"))
             df = b.mRNA_inner_distance(sequana_data("hg38_chr18.bed"))
 
+        The distances are computed by
+        :func:`sequana.inner_distance.get_inner_distances`. With *jobs* > 1,
+        regions of an indexed BAM file are processed in parallel. The
+        histogram of the distances between *low_bound* and *up_bound* is
+        stored in :attr:`inner_distance_histogram`. With *cache* set to
+        True, the table of the BED file is saved in a sidecar file and used
+        next time (see :class:`~sequana.inner_distance.ExonIndex`).
 
         """
         #This code was inspired from the RSeQC code v2.6.4 and adapted for
-        #sequana simplifying the code and using pandas to store results. This is
-        #limited by memory but more convenient.
-
-        inner_distance_bitsets = BinnedBitSet()
-        tmp = BinnedBitSet()
-        tmp.set_range(0,0)
-        pair_num=0
-
-        inner_distances = []
-        read_names = []
-        descriptions = []
-
-        logger.info("Get exon regions from ")
-
-        bed_obj = BED(refbed)
- 
-        ref_exons = [[exn[0].upper(), exn[1], exn[2]] for exn in bed_obj.get_exons()]
+        #sequana simplifying the code and using pandas to store results.
+        from sequana.inner_distance import get_inner_distances
+        from sequana.inner_distance import get_inner_distance_histogram
 
-        exon_bitsets = binned_bitsets_from_list(ref_exons)
+        df = get_inner_distances(self._filename, refbed,
+            sample_size=sample_size, q_cut=q_cut, jobs=jobs, cache=cache)
 
-        transcript_ranges = {}
-        for i_chr, i_st, i_end, i_strand, i_name in bed_obj.get_transcript_ranges():
-            i_chr = i_chr.upper()
-            if i_chr not in transcript_ranges:
-                transcript_ranges[i_chr] = IntervalTree()
-            else:
-                transcript_ranges[i_chr].add_interval(Interval(i_st, i_end, value=i_name))
-
-        try:
-            while(1):
-                if pair_num >= sample_size:
-                    break
-                splice_intron_size=0
-                aligned_read = next(self)
-
-                if aligned_read.is_qcfail:continue           #skip low quality
-                if aligned_read.is_duplicate:continue        #skip duplicate read
-                if aligned_read.is_secondary:continue        #skip non primary hit
-                if aligned_read.is_unmapped:continue         #skip unmap read
-                if not aligned_read.is_paired: continue      #skip single map read
-                if aligned_read.mate_is_unmapped:continue    #
-                if aligned_read.mapq < q_cut:continue
-
-                read1_len = aligned_read.qlen
-                read1_start = aligned_read.pos
-                read2_start = aligned_read.mpos        #0-based, not included
-                if read2_start < read1_start:
-                    continue                           #because BAM file is sorted, mate_read is already processed if its coordinate is smaller
-                if  read2_start == read1_start and aligned_read.is_read1:
-                    inner_distance = 0
-                    #inner_distances.append(0)
-                    continue
-
-                pair_num +=1
-
-                # check if reads were mapped to diff chromsomes
-                R_read1_ref = self._data.get_reference_name(aligned_read.tid)
-                R_read2_ref = self._data.get_reference_name(aligned_read.rnext)
-                if R_read1_ref != R_read2_ref:
-                    inner_distances.append("NA")
-                    read_names.append(aligned_read.qname)
-                    descriptions.append("sameChrom=No")
-                    continue
-
-                chrom = self._data.get_reference_name(aligned_read.tid).upper()
-                intron_blocks = fetch_intron(chrom, read1_start, aligned_read.cigar)
-                for intron in intron_blocks:
-                    splice_intron_size += intron[2] - intron[1]
-                read1_end = read1_start + read1_len + splice_intron_size
-
-                if read2_start >= read1_end:
-                    inner_distance = read2_start - read1_end
-                else:
-                    exon_positions = []
-                    exon_blocks = fetch_exon(chrom, read1_start,aligned_read.cigar)
-                    for ex in exon_blocks:
-                        for i in range(ex[1]+1,ex[2]+1):
-                            exon_positions.append(i)
-                    inner_distance = -len([i for i in exon_positions if i > read2_start and i <= read1_end])
-
-                read1_gene_names = set()    #read1_end
-                try:
-                    for gene in transcript_ranges[chrom].find(read1_end-1, read1_end):
-                        #gene: Interval(0, 10, value=a)
-                        read1_gene_names.add(gene.value)                        
-                except:
-                    pass
-
-                read2_gene_names = set()    #read2_start
-                try:
-                    for gene in transcript_ranges[chrom].find(read2_start, read2_start +1):
-                        #gene: Interval(0, 10, value=a)
-                        read2_gene_names.add(gene.value)
-                except:
-                    pass
-
-                if len(read1_gene_names.intersection(read2_gene_names)) == 0:
-                    # no common gene
-                    #reads mapped to different gene
-                    inner_distances.append(inner_distance)
-                    read_names.append(aligned_read.qname)
-                    descriptions.append("sameTranscript=No,dist=genomic")
-                    continue
-
-                if inner_distance > 0:
-                    if chrom in exon_bitsets:
-                        size =0
-                        inner_distance_bitsets.set_range(read1_end, read2_start-read1_end)
-                        inner_distance_bitsets.iand(exon_bitsets[chrom])
-                        end=0
-                        while 1:
-                            start = inner_distance_bitsets.next_set( end )
-                            if start == inner_distance_bitsets.size: break
-                            end = inner_distance_bitsets.next_clear( start )
-                            size += (end - start)
-                        #clear BinnedBitSet
-                        inner_distance_bitsets.iand(tmp)   
-
-                        if size == inner_distance:
-                            inner_distances.append(size)
-                            read_names.append(aligned_read.qname)
-                            descriptions.append("sameTranscript=Yes,sameExon=Yes,dist=mRNA")
-                        elif size > 0 and size < inner_distance:
-                            inner_distances.append(size)
-                            read_names.append(aligned_read.qname)
-                            descriptions.append("sameTranscript=Yes,sameExon=No,dist=mRNA")
-                        elif size <= 0:
-                            inner_distances.append(inner_distance)
-                            read_names.append(aligned_read.qname)
-                            descriptions.append("sameTranscript=Yes,nonExonic=Yes,dist=genomic")
-                    else:
-                        inner_distances.append(inner_distance)
-                        read_names.append(aligned_read.qname)
-                        descriptions.append("unknownChromosome,dist=genomic")
-                else:
-                    inner_distances.append(inner_distance)
-                    read_names.append(aligned_read.qname)
-                    descriptions.append("readPairOverlap")
-
-        except StopIteration:
-            pass
-
-        print("Total read pairs  used " + str(pair_num))
-        if pair_num==0:
+        logger.info("Total read pairs used {}".format(len(df)))
+        if len(df) == 0:
             raise ValueError("Cannot find paired reads")
 
-        df = pd.DataFrame(
-            {"read_names": read_names,
-             "val": inner_distances,
-             "desc": descriptions})
-        df = df[["read_names", "val", "desc"]]
-        df.query("val>=@low_bound and val<=@up_bound").val.hist(bins=50)
-        mu = df.query("val>=@low_bound and val<=@up_bound").val.mean()
-        print("mean insert size: {}".format(mu))
-        pylab.title("Mean inner distance={}".format(round(pylab.mean(mu), 2) ))
+        counts, bins = get_inner_distance_histogram(df, low_bound=low_bound,
+            up_bound=up_bound, step=step)
+        self.inner_distance_histogram = (counts, bins)
+
+        values = pd.to_numeric(df["val"], errors="coerce")
+        values = values[(values >= low_bound) & (values <= up_bound)]
+        mu = values.mean()
+        logger.info("mean insert size: {}".format(mu))
+        pylab.hist(values, bins=bins)
+        pylab.title("Mean inner distance={}".format(round(mu, 2)))
         pylab.axvline(mu, color="r", ls="--", lw=2)
         return df, mu
 
@@ -15,51 +15,226 @@
 #
 ##############################################################################
 
-__all__ = ['BED']
+"""Read BED files with 12 columns (transcripts and their exons)
 
+The file is parsed once into a columnar table (one transcript per row) and
+the exons (blocks) of all transcripts are flattened into two arrays of
+absolute start and end positions. The exons of the i-th transcript are
+``exon_starts[exon_offsets[i]:exon_offsets[i+1]]`` (CSR layout)::
 
-class BED(object):
-    """a structure to read and manipulate BED files (12-column file) 
+    from sequana import BED, sequana_data
+    bed = BED(sequana_data("hg38_chr18.bed"))
+    df = bed.get_table(cache=True)
+    offsets, starts, ends = bed.get_blocks()
+    exons = bed.get_sorted_exons(merge=True)["chr18"]
+
+"""
+import io
+
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana.annotations import Annotation
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ['BED', 'merge_intervals']
+
+
+def merge_intervals(starts, ends):
+    """Return the union of intervals as sorted disjoint intervals
+
+    :param starts: array of start positions (included)
+    :param ends: array of end positions (excluded)
+    :return: start and end positions of the merged intervals. Overlapping
+        and adjacent intervals (e.g. [0, 10) and [10, 20)) are merged.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="mergesort")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # a new interval starts after the end of all previous ones
+    first = np.concatenate([[True], starts[1:] > reach[:-1]])
+    last = np.concatenate([first[1:], [True]])
+    return starts[first], reach[last]
+
+
+class BED(Annotation):
+    """a structure to read and manipulate BED files (12-column file)
 
     columns are defined as chromosome name, start and end, gene_name, score,
-    strand, CDS start and end, blcok count, block sizes, block starts:
+    strand, CDS start and end, block count, block sizes, block starts.
+
+    Positions are 0-based, end excluded, as in the BED format. The file is
+    read once by :meth:`get_table`; the exons are then available as
+    flattened arrays (:meth:`get_blocks`) or sorted by chromosome
+    (:meth:`get_sorted_exons`).
 
     """
+    _index_columns = ("chrom", "start", "end")
+    _columns = ["chrom", "start", "end", "gene_name", "score", "strand",
+                "cds_start", "cds_end", "rgb", "block_count", "block_sizes",
+                "block_starts"]
 
     def __init__(self, filename):
-        self.filename = filename
-
-    def _get_line(self, line):
-        try:
-            if line.startswith('#') or  line.startswith('track') \
-                or line.startswith('browser'):
-                return {}
-            else:
-                fields = line.rstrip('\r\n').split()
-                chrom_start = int(fields[1])
-                return {"chrom": fields[0],
-                        "start": chrom_start,
-                        "end": int(fields[2]),
-                        "gene_name": fields[3],
-                        "score": fields[4],
-                        "strand": fields[5],
-                        "cds_start": int(fields[6]),
-                        "cds_end": int(fields[7]),
-                        "block_count": int(fields[9]),
-                        "block_sizes": [int(x) for x in fields[10].strip(',').split(',')],
-                        "block_starts": [int(x)+chrom_start for x in fields[11].strip(",").split(",")]}
-        except Exception as err:
-            print(err)
-            print("Input bed must be 12-column] skipped line {}".format(line))
-            return {}
+        super(BED, self).__init__(filename)
+        self._blocks = None
+        # number of data lines that are not 12-column lines
+        self._invalid = 0
+
+    def get_table(self, cache=False):
+        """Return the transcripts as a columnar DataFrame
+
+        :param cache: if True, the table and the exon arrays are saved in a
+            binary sidecar file next to the BED file (with the .sequana.npz
+            extension) and reloaded from there next time, unless the BED
+            file changed in the meantime. A filename can also be provided.
+
+        The *chrom* and *strand* columns are categorical, positions are
+        integers. Block sizes and starts are not kept in the table; see
+        :meth:`get_blocks`. Lines that do not have 12 columns are skipped.
+        """
+        if self._table is not None:
+            return self._table
+
+        if cache:
+            df, arrays = self._load_sidecar(cache, arrays=True)
+            if df is not None:
+                self._table = df
+                self._invalid = int(arrays["invalid"])
+                self._blocks = (arrays["exon_offsets"], arrays["exon_starts"],
+                                arrays["exon_ends"])
+                return df
+
+        buffer = io.StringIO()
+        with open(self.filename, "r") as reader:
+            for line in reader:
+                if line.startswith(('#', 'track', 'browser')):
+                    continue
+                fields = line.split()
+                if len(fields) != 12:
+                    self._invalid += 1
+                    continue
+                buffer.write("\t".join(fields))
+                buffer.write("\n")
+        if self._invalid:
+            logger.warning("Skipped {} lines with incorrect number of "
+                           "fields".format(self._invalid))
+        buffer.seek(0)
+
+        df = pd.read_csv(buffer, sep="\t", header=None, names=self._columns,
+            keep_default_na=False, dtype={"chrom": "category",
+                "gene_name": str, "score": str, "strand": "category",
+                "rgb": str, "block_sizes": str, "block_starts": str,
+                "start": np.int64, "end": np.int64, "cds_start": np.int64,
+                "cds_end": np.int64, "block_count": np.int64})
+
+        sizes = self._split_blocks(df["block_sizes"])
+        starts = self._split_blocks(df["block_starts"])
+        if len(sizes[0]) != len(starts[0]) or \
+                not np.array_equal(sizes[1], starts[1]):
+            raise ValueError("Block sizes and starts must have same length")
+        offsets = np.zeros(len(df) + 1, dtype=np.int64)
+        np.cumsum(starts[1], out=offsets[1:])
+        exon_starts = starts[0] + np.repeat(df["start"].values, starts[1])
+        self._blocks = (offsets, exon_starts, exon_starts + sizes[0])
+
+        df = df.drop(columns=["rgb", "block_sizes", "block_starts"])
+        self._table = df
+        if cache:
+            self._save_sidecar(cache, df, arrays={"invalid": self._invalid,
+                "exon_offsets": offsets, "exon_starts": self._blocks[1],
+                "exon_ends": self._blocks[2]})
+        return df
+
+    @staticmethod
+    def _split_blocks(values):
+        # comma-separated integers of all rows parsed at once
+        values = values.str.strip(",")
+        counts = np.where(values.str.len() > 0, values.str.count(",") + 1, 0)
+        text = ",".join(x for x in values if x)
+        if not text:
+            return np.zeros(0, dtype=np.int64), counts
+        return np.array(text.split(","), dtype=np.int64), counts
+
+    def get_blocks(self):
+        """Return the exons (blocks) of all transcripts as flattened arrays
+
+        :return: the offsets (length is the number of transcripts + 1), the
+            start and the end positions of the exons. Exons of the i-th
+            transcript of :meth:`get_table` are between offsets[i] and
+            offsets[i+1].
+        """
+        self.get_table()
+        return self._blocks
+
+    def _get_exon_rows(self):
+        # row of the transcript of each exon
+        offsets = self.get_blocks()[0]
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    def get_sorted_exons(self, merge=False):
+        """Return the exons of each chromosome sorted by start position
+
+        :param bool merge: merge overlapping exons into disjoint intervals
+        :return: a dictionary with the chromosome names as keys and a tuple
+            with the start and end positions as values
+        """
+        df = self.get_table()
+        offsets, starts, ends = self.get_blocks()
+        chroms = df["chrom"].cat.codes.values[self._get_exon_rows()]
+        order = np.lexsort((starts, chroms))
+        chroms, starts, ends = chroms[order], starts[order], ends[order]
+        bounds = np.searchsorted(chroms, np.arange(len(df["chrom"].cat.categories) + 1))
+
+        results = {}
+        for i, name in enumerate(df["chrom"].cat.categories):
+            x, y = starts[bounds[i]:bounds[i+1]], ends[bounds[i]:bounds[i+1]]
+            if len(x) == 0:
+                continue
+            if merge:
+                x, y = merge_intervals(x, y)
+            results[str(name)] = (x, y)
+        return results
+
+    def get_sorted_transcripts(self):
+        """Return the transcripts of each chromosome sorted by start position
+
+        :return: a dictionary with the chromosome names as keys and a tuple
+            with the start positions, end positions and rows in
+            :meth:`get_table` as values
+        """
+        df = self.get_table()
+        codes = df["chrom"].cat.codes.values
+        starts = df["start"].values
+        order = np.lexsort((starts, codes))
+        bounds = np.searchsorted(codes[order],
+                                 np.arange(len(df["chrom"].cat.categories) + 1))
+        results = {}
+        for i, name in enumerate(df["chrom"].cat.categories):
+            rows = order[bounds[i]:bounds[i+1]]
+            if len(rows):
+                results[str(name)] = (starts[rows], df["end"].values[rows], rows)
+        return results
+
+    def get_index(self):
+        """Return a :class:`~sequana.annotations.FeatureIndex` of the transcripts
+
+        Positions of the index are 1-based inclusive (as in GFF files).
+        """
+        if self._index is None:
+            from sequana.annotations import FeatureIndex
+            df = self.get_table()
+            self._index = FeatureIndex(df["chrom"], df["start"] + 1, df["end"])
+        return self._index
 
     def __len__(self):
-        count = 0
-        with open(self.filename, "r") as fin:
-            for line in fin:
-                if line.startswith(('#', 'track', 'browser')): continue
-                count += 1
-        return count
+        return len(self.get_table()) + self._invalid
 
     def get_exons(self):
         """Extract exon regions from input BED file.
@@ -75,89 +250,32 @@ class BED(object):
             b.get_exons()
 
         """
-        exons = []
-        with open(self.filename, "r") as fin:
-            for line in fin:
-                if line.startswith('#'): continue
-                if line.startswith('track'): continue
-                if line.startswith('browser'): continue
-                fields = line.rstrip('\r\n').split()
-                assert len(fields) == 12 
-                chrom_start = int(fields[1])
-                chrom_name = fields[0]
-                block_sizes =(int(x) for x in fields[10].strip(',').split(','))
-                block_starts =  (int(x)+chrom_start for x in fields[11].strip(",").split(","))
-                for start, size in zip(block_starts, block_sizes):
-                    exons.append((chrom_name, start, start+size))
-        return exons
+        df = self.get_table()
+        assert self._invalid == 0
+        offsets, starts, ends = self.get_blocks()
+        chroms = df["chrom"].astype(str).values[self._get_exon_rows()]
+        return list(zip(chroms.tolist(), starts.tolist(), ends.tolist()))
 
     def get_transcript_ranges(self):
         """Extract transcript from input BED file."""
-        with open(self.filename, "r") as fin:
-            for line in fin:
-                if line.startswith('#'): continue
-                if line.startswith('track'): continue
-                if line.startswith('browser'): continue
-                fields = line.rstrip('\r\n').split()
-                assert len(fields) == 12 
-                chrom = fields[0]
-                chrom_start = int(fields[1])
-                chrom_end = int(fields[2])
-                strand = fields[5]
-                gene_name = fields[3]
-                yield([chrom, chrom_start, chrom_end, strand,
-                        "{}:{}:{}-{}".format(gene_name, chrom, chrom_start, chrom_end)])
+        df = self.get_table()
+        assert self._invalid == 0
+        chroms = df["chrom"].astype(str).values
+        for chrom, start, end, strand, name in zip(chroms,
+                df["start"].tolist(), df["end"].tolist(),
+                df["strand"].astype(str).values, df["gene_name"].values):
+            yield([chrom, start, end, strand,
+                   "{}:{}:{}-{}".format(name, chrom, start, end)])
 
     def get_CDS_exons(self):
         """Extract CDS from input BED file."""
-        results = []
-        with open(self.filename, "r") as fin:
-            for line in fin:
-                row = self._get_line(line)
-                if row:
-                    cds_start = row["cds_start"]
-                    cds_end = row["cds_end"]
-                    for start, size in zip( row['block_starts'], row['block_sizes'] ):
-                        if (start + size) < cds_start: 
-                            continue
-                        if start > cds_end: 
-                            continue
-                        exon_start = max( start, cds_start )
-                        exon_end = min( start+size, cds_end )
-                        results.append([row['chrom'], exon_start, exon_end])
-        return results
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        df = self.get_table()
+        offsets, starts, ends = self.get_blocks()
+        rows = self._get_exon_rows()
+        cds_start = df["cds_start"].values[rows]
+        cds_end = df["cds_end"].values[rows]
+        keep = (ends >= cds_start) & (starts <= cds_end)
+        chroms = df["chrom"].astype(str).values[rows[keep]]
+        return [list(x) for x in zip(chroms.tolist(),
+            np.maximum(starts, cds_start)[keep].tolist(),
+            np.minimum(ends, cds_end)[keep].tolist())]
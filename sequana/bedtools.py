@@ -31,6 +31,7 @@ from pylab import mean as pymean
 
 from sequana.tools import gc_content
 from sequana.genbank import GenBank
+from sequana.annotations import Annotation, FeatureIndex
 from sequana.errors import SequanaException
 from sequana.summary import Summary
 from sequana.stats import evenness
@@ -1710,6 +1711,8 @@ class FilteredGenomeCov(object):
     :target: developers only
     """
     _feature_not_wanted = {"gene", "regulatory", "source"}
+    # contig name used to index the features of a single contig
+    _any_contig = "contig"
 
     def __init__(self, df, threshold, feature_list=None, step=1,
             apply_threshold_after_merging=True):
@@ -1729,18 +1732,20 @@ class FilteredGenomeCov(object):
         self.thresholds = threshold
         self.apply_threshold_after_merging = True
 
-        if isinstance(feature_list, list) and len(feature_list) == 0:
+        if isinstance(feature_list, (list, pd.DataFrame)) and \
+                len(feature_list) == 0:
             feature_list = None
 
         self.feature_list = feature_list
+        self._feature_index = None
 
         self.step = step
         region_list = self._merge_region()
 
-        if self.feature_list:
+        if self.feature_list is not None:
             region_list = self._add_annotation(region_list, self.feature_list)
 
-        self.df = self._dict_to_df(region_list, self.feature_list)
+        self.df = self._dict_to_df(region_list, self.feature_list is not None)
 
         def func(x):
             try:
@@ -1835,66 +1840,94 @@ class FilteredGenomeCov(object):
             merge_df.append(self._merge_row(region_start, region_stop))
         return merge_df
 
+    def _get_feature_index(self, feature_list):
+        # the features as a DataFrame and their index. The index of an
+        # Annotation instance (GenBank, GFF3) is kept by the instance so that
+        # it is built once for all chromosomes.
+        if isinstance(feature_list, Annotation):
+            return feature_list.get_table(), feature_list.get_index()
+        if self._feature_index is None:
+            if isinstance(feature_list, pd.DataFrame):
+                features = feature_list.reset_index(drop=True)
+            else:
+                features = pd.DataFrame(feature_list)
+            if "seqid" in features.columns:
+                seqids = features["seqid"]
+            else:
+                # list of features of a single contig
+                seqids = [self._any_contig] * len(features)
+            index = FeatureIndex(seqids, features["gene_start"],
+                                 features["gene_end"])
+            self._feature_index = (features, index)
+        return self._feature_index
+
+    def _get_contig_name(self, chrom, index):
+        # name of the chromosome in the annotation (see ChromosomeCov.get_roi)
+        if index.contigs == [self._any_contig]:
+            return self._any_contig
+        if chrom in index.contigs:
+            return chrom
+        alternative = [x for x in str(chrom).split("|") if x]
+        alternative = alternative[-1].split('.')[0] if alternative else chrom
+        if alternative in index.contigs:
+            return alternative
+        logger.warning("{} not found in the annotation".format(chrom))
+        return chrom
+
     def _add_annotation(self, region_list, feature_list):
-        """ Add annotation from a dictionary generated by parsers in
-        sequana.tools.
+        """ Add annotation to the regions
+
+        :param region_list: list of regions from :meth:`_merge_region`
+        :param feature_list: list of features of a contig as returned by
+            :meth:`~sequana.genbank.GenBank.genbank_features_parser`, a
+            DataFrame as returned by :meth:`~sequana.genbank.GenBank.get_table`
+            (features of the chromosome are selected with the *seqid*
+            column) or a :class:`~sequana.genbank.GenBank` instance.
+
+        Overlaps are found in batch with a
+        :class:`~sequana.annotations.FeatureIndex` so the cost per region is
+        logarithmic in the number of features. The index is built once per
+        instance; with a :class:`~sequana.genbank.GenBank` instance, it is
+        shared by all chromosomes and its table can be cached on disk (see
+        :meth:`~sequana.genbank.GenBank.get_table`).
         """
+        columns = ["gene_start", "gene_end", "type", "gene", "strand",
+                   "product"]
+        features, index = self._get_feature_index(feature_list)
+        wanted = ~features["type"].isin(FilteredGenomeCov._feature_not_wanted)
+        if not wanted.any():
+            print("Features types ({0}) are not present in the annotation"
+                  " file. Please change what types you want".format(
+                  ", ".join(FilteredGenomeCov._feature_not_wanted)))
+            return []
+
+        # regions end is exclusive, features positions are inclusive
+        starts = [region["start"] + 1 for region in region_list]
+        ends = [region["end"] - 1 for region in region_list]
+        chrom = region_list[0]["chr"] if region_list else None
+        query, rows = index.batch_overlap(self._get_contig_name(chrom, index),
+                                          starts, ends)
+        keep = wanted.values[rows]
+        query, rows = query[keep], rows[keep]
+
+        # put locus_tag in gene field if gene doesn't exist and note field
+        # in product if product doesn't exist.
+        hits = features.iloc[rows].reindex(
+            columns=columns + ["locus_tag", "note"])
+        hits = hits.astype(object).replace("", np.nan)
+        hits["gene"] = hits["gene"].fillna(hits["locus_tag"]).fillna("None")
+        hits["product"] = hits["product"].fillna(hits["note"]).fillna("None")
+        records = hits[columns].to_dict("records")
+
+        found = {}
+        for i, record in zip(query, records):
+            found.setdefault(i, []).append(record)
+
         region_ann = []
-        # an iterator of features
-        iter_feature = iter(feature_list)
-        feature = next(iter_feature)
-        # pass "source" feature
-        while feature["type"] in FilteredGenomeCov._feature_not_wanted:
-            try:
-                feature = next(iter_feature)
-            except StopIteration:
-                print("Features types ({0}) are not present in the annotation"
-                      " file. Please change what types you want".format(
-                      feature['type']))
-                return region_ann
-
-        # merge regions and annotations
-        for region in region_list:
-            feature_exist = False
-            while feature["gene_end"] <= region["start"]:
-                try:
-                    feature = next(iter_feature)
-                except:
-                    break
-            while feature["gene_start"] < region["end"]:
-                # A feature exist for detected ROI
-                feature_exist = True
-                # put locus_tag in gene field if gene doesn't exist
-                try:
-                    feature["gene"]
-                except KeyError:
-                    try:
-                        feature["gene"] = feature["locus_tag"]
-                    except:
-                        feature["gene"] = "None"
-                # put note field in product if product doesn't exist
-                try:
-                    feature["product"]
-                except KeyError:
-                    try:
-                        feature["product"] = feature["note"]
-                    except:
-                        feature["product"] = "None"
-                # FIXME what that ?
-                #if region["start"] == 237433:
-                #    print(dict(region, **feature))
+        no_feature = dict.fromkeys(columns)
+        for i, region in enumerate(region_list):
+            for feature in found.get(i, [no_feature]):
                 region_ann.append(dict(region, **feature))
-                try:
-                    feature = next(iter_feature)
-                except StopIteration:
-                    break
-            if feature_exist is False:
-                region_ann.append(dict(region, **{"gene_start": None,
-                                                  "gene_end": None,
-                                                  "type": None,
-                                                  "gene": None,
-                                                  "strand": None,
-                                                  "product": None}))
         return region_ann
 
     def _dict_to_df(self, region_list, annotation):
@@ -2017,7 +2050,7 @@ class FilteredGenomeCov(object):
             this_cluster = self._merge_row(row.start, row.end)
             region_list.append(this_cluster)
 
-        merge_df = self._dict_to_df(region_list, self.feature_list)
+        merge_df = self._dict_to_df(region_list, self.feature_list is not None)
 
 
         # finally, remove events that are small.
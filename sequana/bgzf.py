@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Parallel BGZF (blocked gzip) and bzip2 writers
+
+BGZF files are made of independent gzip blocks of at most 64Kb. They can be
+read by any gzip tool (and by htslib/pysam, which can also index them). Since
+blocks are independent, they are compressed in parallel in a pool of threads
+(zlib and bz2 release the GIL). The same is done for bzip2 files made of
+several streams.
+"""
+import os
+import bz2
+import zlib
+import struct
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["ParallelBlockWriter", "BGZFWriter", "BZ2Writer", "check_gzip",
+           "concatenate_gzip"]
+
+
+# maximum size of the uncompressed data of a block (as in htslib)
+BLOCK_SIZE = 0xff00
+# maximum size of a compressed block
+_MAX_BLOCK = 0x10000
+_HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+# empty block written at the end of BGZF files
+_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data, level=6):
+    """Return a BGZF block containing the (at most 64Kb) bytes *data*"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    if len(cdata) + 26 > _MAX_BLOCK:
+        # incompressible data. store it as is (5 extra bytes only)
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+    return b"".join([
+        _HEADER,
+        struct.pack("<H", len(cdata) + 25),
+        cdata,
+        struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+    ])
+
+
+class ParallelBlockWriter(object):
+    """Base class of writers compressing independent blocks in threads
+
+    Data is buffered and cut into blocks of :attr:`block_size` bytes that are
+    compressed with :meth:`compress` in a pool of threads and written in
+    order. The number of blocks waiting to be written is bounded so that
+    memory stays constant whatever the size of the file.
+    """
+    #: size of the uncompressed blocks
+    block_size = BLOCK_SIZE
+    #: bytes written at the end of the file
+    eof = b""
+
+    def __init__(self, filename, threads=4, level=6):
+        """.. rubric:: constructor
+
+        :param filename: output filename or a file object opened in binary mode
+        :param int threads: number of compression threads
+        :param int level: compression level
+        """
+        if hasattr(filename, "write"):
+            self._handle = filename
+            self._owner = False
+        else:
+            self._handle = open(filename, "wb")
+            self._owner = True
+        self.threads = max(1, threads)
+        self.level = level
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        if self.threads > 1:
+            self._executor = ThreadPoolExecutor(self.threads)
+        else:
+            self._executor = None
+        # number of blocks submitted at once and kept in memory
+        self._batch = self.threads * 4 * self.block_size
+        self._max_pending = self.threads * 8
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def compress(self, data):
+        """Compress one block. To be implemented in children classes"""
+        raise NotImplementedError
+
+    def _submit(self, data):
+        if self._executor is None:
+            self._handle.write(self.compress(data))
+            return
+        self._pending.append(self._executor.submit(self.compress, data))
+        while len(self._pending) > self._max_pending:
+            self._handle.write(self._pending.popleft().result())
+
+    def write(self, data):
+        """Write bytes (or a string encoded in utf-8)"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer += data
+        if len(self._buffer) >= self._batch:
+            N = len(self._buffer) - len(self._buffer) % self.block_size
+            view = bytes(self._buffer[:N])
+            del self._buffer[:N]
+            for i in range(0, N, self.block_size):
+                self._submit(view[i:i + self.block_size])
+
+    def flush(self):
+        """Compress and write all buffered data"""
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        for i in range(0, len(data), self.block_size):
+            self._submit(data[i:i + self.block_size])
+        while self._pending:
+            self._handle.write(self._pending.popleft().result())
+        self._handle.flush()
+
+    def close(self):
+        """Flush the data, write the end-of-file bytes and close the file"""
+        if self.closed:
+            return
+        self.flush()
+        self._handle.write(self.eof)
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._owner:
+            self._handle.close()
+        self.closed = True
+
+
+class BGZFWriter(ParallelBlockWriter):
+    """Write a BGZF file compressing the blocks in a pool of threads
+
+    ::
+
+        from sequana.bgzf import BGZFWriter
+        with BGZFWriter("test.fastq.gz", threads=4) as fout:
+            fout.write(b"@read\\nACGT\\n+\\nIIII\\n")
+
+    Blocks are 64Kb long. The output is a valid gzip file.
+
+    """
+    block_size = BLOCK_SIZE
+    eof = _EOF
+
+    def compress(self, data):
+        return compress_block(data, self.level)
+
+
+class BZ2Writer(ParallelBlockWriter):
+    """Write a multi-stream bzip2 file compressing blocks in a pool of threads
+
+    Each block of 900Kb is an independent bzip2 stream (as with pbzip2). Such
+    files can be read by bzip2 and the bz2 Python module.
+    """
+    block_size = 900000
+
+    def __init__(self, filename, threads=4, level=9):
+        super(BZ2Writer, self).__init__(filename, threads=threads, level=level)
+
+    def compress(self, data):
+        return bz2.compress(data, self.level)
+
+
+def is_bgzf(filename):
+    """Return True if the file starts with a BGZF block"""
+    with open(filename, "rb") as fin:
+        header = fin.read(16)
+    return len(header) == 16 and header[:4] == b"\x1f\x8b\x08\x04" and \
+        header[12:14] == b"BC"
+
+
+def check_gzip(filename, full=False):
+    """Check that a file is a valid sequence of gzip members
+
+    BGZF files are checked by walking the block headers (no decompression).
+    For other gzip files, only the header of the first member is checked
+    unless *full* is True: the file is then decompressed (without writing
+    anything) to make sure the last member is complete and not followed by
+    garbage, which is CPU-bound.
+
+    :param bool full: decompress plain gzip files
+    :return: the number of members (blocks for BGZF files) or None for plain
+        gzip files that are not fully checked
+    :raises IOError: if the file is not a valid gzip file
+    """
+    N = 0
+    if is_bgzf(filename):
+        size = os.path.getsize(filename)
+        with open(filename, "rb") as fin:
+            position = 0
+            while position < size:
+                header = fin.read(18)
+                if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04" or \
+                        header[12:14] != b"BC":
+                    raise IOError("{}: invalid BGZF block at byte {}".format(
+                        filename, position))
+                bsize = struct.unpack("<H", header[16:18])[0] + 1
+                position += bsize
+                fin.seek(position)
+                N += 1
+        if position != size:
+            raise IOError("{}: truncated BGZF block".format(filename))
+        return N
+
+    if full is False:
+        # gzip header (10 bytes) with deflate method and trailer (8 bytes)
+        with open(filename, "rb") as fin:
+            header = fin.read(10)
+        if len(header) < 10 or header[:3] != b"\x1f\x8b\x08" or \
+                os.path.getsize(filename) < 18:
+            raise IOError("{}: not a gzip file".format(filename))
+        return None
+
+    with open(filename, "rb") as fin:
+        decompressor = zlib.decompressobj(31)
+        while True:
+            data = fin.read(1024 * 1024)
+            if not data:
+                break
+            while data:
+                if decompressor.eof:
+                    # a new member starts
+                    N += 1
+                    decompressor = zlib.decompressobj(31)
+                try:
+                    decompressor.decompress(data, 1024 * 1024)
+                except zlib.error as err:
+                    raise IOError("{}: {}".format(filename, err))
+                data = decompressor.unconsumed_tail or decompressor.unused_data
+        if decompressor.eof is False:
+            raise IOError("{}: truncated gzip member".format(filename))
+    return N + 1
+
+
+def _copy(fin, fout, size):
+    # copy size bytes between two files using zero-copy system calls if
+    # possible. Both files must be flushed; fin is read from its position
+    offset = fin.tell()
+    if hasattr(os, "copy_file_range"):
+        try:
+            while size > 0:
+                done = os.copy_file_range(fin.fileno(), fout.fileno(),
+                    min(size, 1 << 30), offset, None)
+                if done == 0:
+                    break
+                size -= done
+                offset += done
+        except OSError:
+            # e.g. not supported by the file system; try something else
+            pass
+    if size > 0 and hasattr(os, "sendfile"):
+        try:
+            while size > 0:
+                done = os.sendfile(fout.fileno(), fin.fileno(), offset,
+                                   min(size, 1 << 30))
+                if done == 0:
+                    break
+                size -= done
+                offset += done
+        except OSError:
+            # e.g. output is not a socket (macOS)
+            pass
+    fin.seek(offset)
+    fout.seek(0, os.SEEK_END)
+    while size > 0:
+        data = fin.read(min(size, 16 * 1024 * 1024))
+        if not data:
+            break
+        fout.write(data)
+        size -= len(data)
+
+
+def concatenate_gzip(filenames, output, check=True, full_check=False):
+    """Concatenate gzip files without decompressing them
+
+    A sequence of gzip members is a valid gzip file so compressed files can
+    be concatenated byte for byte. If all files are BGZF files, the
+    end-of-file blocks of the input files are dropped and a single one is
+    added at the end so that the output is a valid BGZF file.
+
+    :param list filenames: the gzip files to concatenate (in that order)
+    :param str output: the output file
+    :param bool check: check the gzip members of the input files first (see
+        :func:`check_gzip`)
+    :param bool full_check: decompress the plain gzip files to check them
+        (BGZF files are always fully checked)
+    """
+    if check:
+        for filename in filenames:
+            check_gzip(filename, full=full_check)
+    bgzf = all(is_bgzf(filename) for filename in filenames)
+
+    with open(output, "wb") as fout:
+        for filename in filenames:
+            size = os.path.getsize(filename)
+            with open(filename, "rb") as fin:
+                if bgzf and size >= len(_EOF):
+                    fin.seek(size - len(_EOF))
+                    if fin.read() == _EOF:
+                        size -= len(_EOF)
+                    fin.seek(0)
+                fout.flush()
+                _copy(fin, fout, size)
+        if bgzf:
+            fout.write(_EOF)
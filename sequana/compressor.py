@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""In-process (re)compression of FastQ files
+
+This is the engine of the **sequana_compressor**
+standalone. Files are converted between fastq, fastq.gz, fastq.bz2 and
+fastq.dsrc without snakemake.
+"""
+import os
+import glob
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["Compressor"]
+
+
+# size of the chunks read from the input files
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def _get_codec(filename):
+    for codec in ("gz", "bz2", "dsrc"):
+        if filename.endswith("." + codec):
+            return codec
+    return ""
+
+
+class _Reader(object):
+    # read the decompressed content of a file by chunks
+    def __init__(self, filename, threads=1):
+        self.codec = _get_codec(filename)
+        self._process = None
+        if self.codec == "gz":
+            import gzip
+            self._handle = gzip.open(filename, "rb")
+        elif self.codec == "bz2":
+            import bz2
+            self._handle = bz2.open(filename, "rb")
+        elif self.codec == "dsrc":
+            self._process = subprocess.Popen(["dsrc", "d", "-s",
+                "-t{}".format(threads), filename], stdout=subprocess.PIPE)
+            self._handle = self._process.stdout
+        else:
+            self._handle = open(filename, "rb")
+
+    def __iter__(self):
+        while True:
+            data = self._handle.read(CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        self._handle.close()
+        if self._process and self._process.wait() != 0:
+            raise IOError("dsrc failed to decompress the input file")
+
+
+class _Writer(object):
+    # write data in a file compressed with a block-level parallel codec
+    def __init__(self, filename, threads=1):
+        from sequana.bgzf import BGZFWriter, BZ2Writer
+        self.codec = _get_codec(filename)
+        self._process = None
+        if self.codec == "gz":
+            self._handle = BGZFWriter(filename, threads=threads)
+        elif self.codec == "bz2":
+            self._handle = BZ2Writer(filename, threads=threads)
+        elif self.codec == "dsrc":
+            self._process = subprocess.Popen(["dsrc", "c", "-s",
+                "-t{}".format(threads), filename], stdin=subprocess.PIPE)
+            self._handle = self._process.stdin
+        else:
+            self._handle = open(filename, "wb")
+
+    def write(self, data):
+        self._handle.write(data)
+
+    def close(self):
+        self._handle.close()
+        if self._process and self._process.wait() != 0:
+            raise IOError("dsrc failed to compress the output file")
+
+
+def checksum(filename, threads=1):
+    """Return the MD5 checksum and size of the decompressed content of a file"""
+    md5 = hashlib.md5()
+    size = 0
+    reader = _Reader(filename, threads=threads)
+    try:
+        for data in reader:
+            md5.update(data)
+            size += len(data)
+    finally:
+        reader.close()
+    return md5.hexdigest(), size
+
+
+class Compressor(object):
+    """Convert FastQ files between compression formats
+
+    ::
+
+        from sequana.compressor import Compressor
+        c = Compressor("fastq.gz", "fastq.bz2", jobs=4, threads=4)
+        filenames = c.find_files(".", recursive=True)
+        results = c.run(filenames)
+
+    Files are processed in a pool of *jobs* workers, largest files first so
+    that a big file does not end up running alone at the end. Each file is
+    decompressed and compressed again in a single pass; gz and bz2 outputs
+    are compressed by blocks in *threads* threads (see :mod:`sequana.bgzf`).
+    The gz files are written in BGZF format, which is gzip compatible.
+
+    While converting, a checksum of the decompressed content is computed.
+    The output file is then decompressed again and its checksum compared to
+    the expected one. If they differ, the output is removed and the input is
+    kept. Otherwise, the input file is removed (unless *keep_input* is set).
+
+    The dsrc format relies on the external **dsrc** executable.
+
+    """
+    codecs = ["", "gz", "bz2", "dsrc"]
+
+    def __init__(self, source, target, jobs=4, threads=4, verify=True,
+                 keep_input=False):
+        """.. rubric:: constructor
+
+        :param str source: extension of the input files (e.g., fastq.gz)
+        :param str target: extension of the output files (e.g., fastq.bz2)
+        :param int jobs: number of files processed at the same time
+        :param int threads: number of threads used to compress a file
+        :param bool verify: check the integrity of the output files
+        :param bool keep_input: do not remove input files
+        """
+        if source.split(".")[0] != target.split(".")[0]:
+            raise ValueError("source and target must have the same prefix (e.g. fastq)")
+        if _get_codec(source) == _get_codec(target):
+            raise ValueError("source and target must have different codecs")
+        self.source = source
+        self.target = target
+        self.jobs = jobs
+        self.threads = threads
+        self.verify = verify
+        self.keep_input = keep_input
+
+    def find_files(self, directory=".", recursive=False):
+        """Return the files with the source extension sorted by decreasing size
+
+        Symbolic links are ignored.
+        """
+        if recursive:
+            pattern = os.path.join(directory, "**", "*." + self.source)
+        else:
+            pattern = os.path.join(directory, "*." + self.source)
+        filenames = [x for x in glob.glob(pattern, recursive=recursive)
+                     if os.path.islink(x) is False]
+        return sorted(filenames, key=os.path.getsize, reverse=True)
+
+    def get_output_filename(self, filename):
+        """Return the output filename of an input file"""
+        assert filename.endswith(self.source)
+        return filename[:-len(self.source)] + self.target
+
+    def convert(self, filename):
+        """Convert one file and return a summary dictionary
+
+        :raises IOError: if the output is corrupted (the input is kept)
+        """
+        output = self.get_output_filename(filename)
+        md5 = hashlib.md5()
+        size = 0
+
+        reader = _Reader(filename, threads=self.threads)
+        try:
+            writer = _Writer(output, threads=self.threads)
+            try:
+                for data in reader:
+                    md5.update(data)
+                    size += len(data)
+                    writer.write(data)
+            finally:
+                writer.close()
+        except Exception:
+            if os.path.exists(output):
+                os.remove(output)
+            raise
+        finally:
+            reader.close()
+
+        expected = md5.hexdigest()
+        if self.verify:
+            found, found_size = checksum(output, threads=self.threads)
+            if (found, found_size) != (expected, size):
+                os.remove(output)
+                raise IOError("Checksum of {} differs from {}. Input kept".format(
+                    output, filename))
+
+        if self.keep_input is False:
+            os.remove(filename)
+        return {"input": filename, "output": output, "size": size,
+                "md5": expected}
+
+    def run(self, filenames):
+        """Convert all files in a pool of workers (largest files first)
+
+        :return: list of summary dictionaries (see :meth:`convert`). Failed
+            conversions are reported with an *error* key.
+        """
+        filenames = sorted(filenames, key=os.path.getsize, reverse=True)
+        logger.info("Found {} files to process".format(len(filenames)))
+
+        results = []
+        with ThreadPoolExecutor(max(1, self.jobs)) as executor:
+            futures = [(x, executor.submit(self.convert, x)) for x in filenames]
+            for filename, future in futures:
+                try:
+                    results.append(future.result())
+                    logger.info("{} converted".format(filename))
+                except Exception as err:
+                    logger.error("{} not converted: {}".format(filename, err))
+                    results.append({"input": filename, "error": str(err)})
+        return results
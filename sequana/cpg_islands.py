@@ -1,18 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Detection of CpG islands
 
+A CpG island is a region where the GC content and the ratio of observed to
+expected CpG dinucleotides are high (Gardiner-Garden and Frommer, 1987). The
+expected number of CpG in a window of length *L* is :math:`C \\times G / L`
+where *C* and *G* are the number of C and G in the window.
 
+All windows of a sequence are computed at once using cumulative sums over the
+sequence encoded as bytes. Consecutive windows that pass the thresholds are
+merged into islands::
 
-def CpG(sequence, size=200):
-    """
-    The Sequence Manipulation Suite: CpG Islands
-    Results for 1200 residue sequence "sample sequence" starting "taacatactt".
-    CpG islands search using window size of 200.
-    Range, value
-    32 to 231, the y-value is 1.75 and the %GC content is 50.5
-    33 to 232, the y-value is 1.75 and the %GC content is 50.5
+    from sequana.cpg_islands import CpGIslands
+    cpg = CpGIslands("genome.fa")
+    df = cpg.run(jobs=4)
+    cpg.to_bed("cpg_islands.bed")
+
+"""
+import pysam
+
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["CpG", "CpGIslands", "find_cpg_islands"]
+
+
+# number of windows computed at once (bounds the memory of the cumulative sums)
+CHUNK_SIZE = 10000000
+
+
+def _encode(sequence):
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    return np.frombuffer(sequence.upper(), dtype=np.uint8)
+
+
+def _window_stats(codes, size):
+    # C, G and CpG counts of all windows of length size (one per start position)
+    C = np.zeros(len(codes) + 1, dtype=np.int32)
+    G = np.zeros(len(codes) + 1, dtype=np.int32)
+    CG = np.zeros(len(codes), dtype=np.int32)
+    isC = codes == ord("C")
+    isG = codes == ord("G")
+    np.cumsum(isC, out=C[1:])
+    np.cumsum(isG, out=G[1:])
+    # CG[i] is the number of CpG starting before position i
+    np.cumsum(isC[:-1] & isG[1:], out=CG[1:])
 
+    N = len(codes) - size + 1
+    C = (C[size:] - C[:N]).astype(np.int64)
+    G = (G[size:] - G[:N]).astype(np.int64)
+    CG = CG[size - 1:] - CG[:N]
+    return C, G, CG
+
+
+def _obs_exp(C, G, CG, size):
+    expected = C * G
+    # size / (C * G) can be very large; use floats
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(expected > 0, CG * size / expected.astype(float), 0.)
+    return ratio
+
+
+def CpG(sequence, size=200, min_gc=0.5, min_obs_exp=0.6):
+    """Return the windows of a sequence that look like CpG islands
+
+    As in the Sequence Manipulation Suite::
+
+        Results for 1200 residue sequence "sample sequence" starting "taacatactt".
+        CpG islands search using window size of 200.
+        Range, value
+        32 to 231, the y-value is 1.75 and the %GC content is 50.5
+        33 to 232, the y-value is 1.75 and the %GC content is 50.5
+
+    :param str sequence: a DNA sequence
+    :param int size: length of the windows
+    :param float min_gc: minimum GC content (fraction) of a window
+    :param float min_obs_exp: minimum observed/expected CpG ratio
+    :return: a dataframe with the start (1-based) and end positions of the
+        windows, their observed/expected CpG ratio (y-value) and %GC.
 
     Gardiner-Garden M, Frommer M. J Mol Biol. 1987 Jul 20;196(2):261-82.
 
     """
-    pass
+    codes = _encode(sequence)
+    if len(codes) < size:
+        return pd.DataFrame(columns=["start", "end", "obs_exp", "gc"])
+    C, G, CG = _window_stats(codes, size)
+    ratio = _obs_exp(C, G, CG, size)
+    gc = (C + G) / size
+    selection = np.nonzero((gc > min_gc) & (ratio > min_obs_exp))[0]
+    return pd.DataFrame({"start": selection + 1, "end": selection + size,
+                         "obs_exp": ratio[selection],
+                         "gc": gc[selection] * 100})
+
+
+def find_cpg_islands(sequence, size=200, min_gc=0.5, min_obs_exp=0.6,
+                     min_length=200, chunk_size=CHUNK_SIZE):
+    """Return the CpG islands of a sequence
+
+    All windows of length *size* with a GC content above *min_gc* and an
+    observed/expected CpG ratio above *min_obs_exp* are merged into islands
+    when they overlap.
+
+    :param sequence: a DNA sequence (string or bytes)
+    :param int min_length: minimum length of the islands
+    :param int chunk_size: number of windows computed at once
+    :return: a dataframe with the start (0-based) and end (exclusive)
+        positions, the size, the GC content (fraction), the observed/expected
+        CpG ratio and the number of CpG of each island.
+    """
+    codes = _encode(sequence)
+    N = len(codes) - size + 1
+    columns = ["start", "end", "size", "gc", "obs_exp", "cpg"]
+    if N <= 0:
+        return pd.DataFrame(columns=columns)
+
+    # windows passing the thresholds, computed by chunks of windows
+    passed = np.zeros(N, dtype=bool)
+    for start in range(0, N, chunk_size):
+        end = min(start + chunk_size, N)
+        C, G, CG = _window_stats(codes[start:end + size - 1], size)
+        ratio = _obs_exp(C, G, CG, size)
+        passed[start:end] = ((C + G) > min_gc * size) & (ratio > min_obs_exp)
+
+    # runs of consecutive windows. Two runs separated by a few failing
+    # windows give overlapping islands, which are merged
+    edges = np.diff(np.concatenate([[0], passed.view(np.int8), [0]]))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0] - 1 + size
+    if len(starts):
+        first = np.concatenate([[True], starts[1:] > ends[:-1]])
+        last = np.concatenate([first[1:], [True]])
+        starts, ends = starts[first], ends[last]
+    keep = (ends - starts) >= min_length
+    starts, ends = starts[keep], ends[keep]
+
+    # statistics of the islands themselves (islands are disjoint and sorted)
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+
+    def _sum(values):
+        if len(bounds) == 0:
+            return np.zeros(0, dtype=np.int64)
+        values = np.concatenate([values, [0]])
+        return np.add.reduceat(values, bounds, dtype=np.int64)[0::2]
+
+    isC = codes == ord("C")
+    isG = codes == ord("G")
+    C = _sum(isC)
+    G = _sum(isG)
+    # CpG[i] is a CpG starting at i; the last base of an island cannot start one
+    CG = _sum(np.concatenate([isC[:-1] & isG[1:], [False]]))
+    CG -= (isC[ends - 1] & np.concatenate([isG, [False]])[ends]).astype(np.int64)
+    lengths = ends - starts
+    return pd.DataFrame({"start": starts, "end": ends, "size": lengths,
+        "gc": (C + G) / np.maximum(lengths, 1),
+        "obs_exp": _obs_exp(C, G, CG, lengths), "cpg": CG}, columns=columns)
+
+
+def _find_cpg_islands(args):
+    # used by the pool of processes of CpGIslands
+    name, sequence, kwargs = args
+    df = find_cpg_islands(sequence, **kwargs)
+    df.insert(0, "chr", name)
+    return df
+
+
+class CpGIslands(object):
+    """Detect CpG islands in all sequences of a FASTA file
+
+    ::
+
+        from sequana import sequana_data
+        from sequana.cpg_islands import CpGIslands
+        cpg = CpGIslands(sequana_data("measles.fa"))
+        df = cpg.run()
+
+    Contigs are processed in parallel in a pool of processes. The islands are
+    stored in the :attr:`df` attribute as a dataframe with the chr, start
+    (0-based), end (exclusive) columns as in BED files or in the regions of
+    interest of :mod:`sequana.bedtools`, and the size, gc, obs_exp and cpg
+    columns. They can be saved in BED format with :meth:`to_bed` or
+    intersected with annotations using :meth:`get_index`.
+
+    """
+    def __init__(self, filename, size=200, min_gc=0.5, min_obs_exp=0.6,
+                 min_length=200):
+        """.. rubric:: constructor
+
+        :param str filename: a FASTA file (possibly gzipped)
+        :param int size: length of the windows
+        :param float min_gc: minimum GC content (fraction) of a window
+        :param float min_obs_exp: minimum observed/expected CpG ratio of a window
+        :param int min_length: minimum length of the islands
+        """
+        self.filename = filename
+        self.size = size
+        self.min_gc = min_gc
+        self.min_obs_exp = min_obs_exp
+        self.min_length = min_length
+        self.df = None
+
+    def _get_parameters(self):
+        return {"size": self.size, "min_gc": self.min_gc,
+                "min_obs_exp": self.min_obs_exp, "min_length": self.min_length}
+
+    def _contigs(self):
+        with pysam.FastxFile(self.filename) as fin:
+            for record in fin:
+                yield (record.name, record.sequence, self._get_parameters())
+
+    def run(self, jobs=1):
+        """Detect the islands of all contigs
+
+        :param int jobs: number of contigs processed at the same time
+        :return: the dataframe of the islands (see :attr:`df`)
+        """
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(_find_cpg_islands, self._contigs()))
+        else:
+            results = [_find_cpg_islands(x) for x in self._contigs()]
+
+        columns = ["chr", "start", "end", "size", "gc", "obs_exp", "cpg"]
+        if results:
+            self.df = pd.concat(results, ignore_index=True)[columns]
+        else:
+            self.df = pd.DataFrame(columns=columns)
+        logger.info("Found {} CpG islands".format(len(self.df)))
+        return self.df
+
+    def _get_df(self):
+        if self.df is None:
+            self.run()
+        return self.df
+
+    def to_bed(self, filename):
+        """Save the islands in BED format (name is CpG:<number of CpG>)"""
+        df = self._get_df()
+        with open(filename, "w") as fout:
+            for row in df.itertuples():
+                fout.write("{}\t{}\t{}\tCpG:{}\t{:.3f}\n".format(
+                    row.chr, row.start, row.end, row.cpg, row.obs_exp))
+
+    def get_index(self):
+        """Return a :class:`~sequana.annotations.FeatureIndex` of the islands
 
+        Positions of the index are 1-based inclusive (as in GFF files).
+        """
+        from sequana.annotations import FeatureIndex
+        df = self._get_df()
+        return FeatureIndex(df["chr"], df["start"] + 1, df["end"])
@@ -1046,6 +1046,15 @@ class KeggPathwayEnrichment:
         ke = KeggPathwayEnrichment("path_to_rnadiff", "mmu", mapper=df,
             preload_directory="kegg_pathways/mmu")
 
+    Reading hundreds of JSON files takes time. Instead, you can save the
+    pathways into a single gene set store (see
+    :class:`~sequana.kegg_store.KeggGeneSetStore`) that is loaded in a few
+    milliseconds and can be used offline (the background is stored as well)::
+
+        ke.export_pathways_to_store("mmu.kegg")
+        ke = KeggPathwayEnrichment("path_to_rnadiff", "mmu", mapper=df,
+            preload_directory="mmu.kegg")
+
         df = ke.scatterplot('down')
         tight_layout()
         savefig("B4052_T1vsT0_KE_scatterplot_down.png")
@@ -1079,10 +1088,9 @@ class KeggPathwayEnrichment:
 
         self.convert_input_gene_to_upper_case = convert_input_gene_to_upper_case
 
-        from bioservices import KEGG
-
-        self.kegg = KEGG(cache=True)
-        self.kegg.organism = organism
+        self.organism = organism
+        self._kegg = None
+        self.store = None
         self.summary = Summary("KeggPathwayEnrichment")
         self.summary.add_params(
             {
@@ -1111,14 +1119,16 @@ class KeggPathwayEnrichment:
 
         choices = list(self.rnadiff.gene_lists.keys())
 
+        self._load_pathways(progress=progress, preload_directory=preload_directory)
+
         if background:
             self.background = background
+        elif self.store is not None and self.store.background:
+            self.background = self.store.background
         else:
-            self.background = len(self.kegg.list(self.kegg.organism).split("\n"))
+            self.background = len(self.kegg.list(self.organism).split("\n"))
         logger.info("Set number of genes to {}".format(self.background))
 
-        self._load_pathways(progress=progress, preload_directory=preload_directory)
-
         if isinstance(mapper, str):
             import pandas as pd
 
@@ -1138,10 +1148,37 @@ class KeggPathwayEnrichment:
             print(err)
             logger.critical("An error occured while computing enrichments. ")
 
+    def _get_kegg(self):
+        # the KEGG service is only created when needed so that a gene set
+        # store can be used without network access
+        if self._kegg is None:
+            from bioservices import KEGG
+
+            self._kegg = KEGG(cache=True)
+            self._kegg.organism = self.organism
+        return self._kegg
+
+    kegg = property(_get_kegg, doc="the bioservices KEGG service (created on demand)")
+
     def _load_pathways(self, progress=True, preload_directory=None):
         # This is just loading all pathways once for all
         self.pathways = {}
-        if preload_directory:
+        if preload_directory and os.path.isfile(preload_directory):
+            # preload is a gene set store (see sequana.kegg_store)
+            from sequana.kegg_store import KeggGeneSetStore
+
+            self.store = KeggGeneSetStore(preload_directory)
+            if self.store.organism and self.store.organism != self.organism:
+                logger.warning(
+                    "The gene set store was built for {} not {}".format(
+                        self.store.organism, self.organism
+                    )
+                )
+            self.pathways = self.store.pathways
+            self.gene_sets = self.store.gene_sets
+            self._set_df_pathways()
+            return
+        elif preload_directory:
             # preload is a directory with all pathways in it
             import glob
 
@@ -1190,16 +1227,23 @@ class KeggPathwayEnrichment:
             else:
                 print("SKIPPED (no genes) {}: {}".format(ID, res["NAME"]))
 
+        self._set_df_pathways()
+
+    def _set_df_pathways(self):
         # save all pathways info
         self.df_pathways = pd.DataFrame(self.pathways).T
-        del self.df_pathways["ENTRY"]
-        del self.df_pathways["REFERENCE"]
-        go = [
-            x["GO"] if isinstance(x, dict) and "GO" in x.keys() else None
-            for x in self.df_pathways.DBLINKS
-        ]
+        for name in ["ENTRY", "REFERENCE"]:
+            if name in self.df_pathways.columns:
+                del self.df_pathways[name]
+        if "DBLINKS" in self.df_pathways.columns:
+            go = [
+                x["GO"] if isinstance(x, dict) and "GO" in x.keys() else None
+                for x in self.df_pathways.DBLINKS
+            ]
+            del self.df_pathways["DBLINKS"]
+        else:
+            go = None
         self.df_pathways["GO"] = go
-        del self.df_pathways["DBLINKS"]
 
     def plot_genesets_hist(self, bins=20):
         N = len(self.gene_sets.keys())
@@ -1554,10 +1598,16 @@ class KeggPathwayEnrichment:
         """
 
         # First let us find the kegg ID
-        genes = self.kegg.list(self.kegg.organism).strip().split("\n")
+        if self.store is not None:
+            # genes that are not in any pathway are not stored but would not
+            # be found anyway
+            keggid = ["{}:{}".format(self.organism, x) for x in self.store.gene_ids]
+            gene_names = [x.strip() for x in self.store.gene_names]
+        else:
+            genes = self.kegg.list(self.organism).strip().split("\n")
 
-        keggid = [x.split("\t")[0].strip() for x in genes]
-        gene_names = [x.split("\t")[1].split(";")[0].strip() for x in genes]
+            keggid = [x.split("\t")[0].strip() for x in genes]
+            gene_names = [x.split("\t")[1].split(";")[0].strip() for x in genes]
 
         self.keggid = keggid
         self.gene_names = gene_names
@@ -1637,7 +1687,7 @@ class KeggPathwayEnrichment:
         # They can be loaded back. If so, we use kegg service only in
         # :meth:`find_pathways_by_gene` method and
 
-        outdir = outdir + "/" + self.kegg.organism
+        outdir = outdir + "/" + self.organism
         from easydev import mkdirs
 
         mkdirs(outdir)
@@ -1647,6 +1697,20 @@ class KeggPathwayEnrichment:
             with open(f"{outdir}/{key}.json", "w") as fout:
                 json.dump(data, fout)
 
+    def export_pathways_to_store(self, filename):
+        """Save the pathways into a :class:`~sequana.kegg_store.KeggGeneSetStore`
+
+        The store (a single file) can be given back as the
+        **preload_directory** argument to run the enrichment offline.
+        """
+        from sequana.kegg_store import KeggGeneSetStore
+
+        store = KeggGeneSetStore.from_pathways(
+            self.pathways, organism=self.organism, background=self.background
+        )
+        store.save(filename)
+        return store
+
 
 # not tested. This is tested trough bioservics and takes a long time
 class Mart:  # pragma: no cover
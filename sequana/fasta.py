@@ -204,17 +204,26 @@ class FastA(object):
         return cherries
 
     def get_stats(self):
-        from pylab import mean
+        from sequana.stats import LengthHistogram
+        lengths = LengthHistogram(self.lengths)
         stats = {}
         stats["N"] = len(self.sequences)
-        stats["mean_length"] = mean(self.lengths)
-        from sequana.stats import N50, L50
-        stats["N50"] = N50(self.lengths)
-        stats["L50"] = L50(self.lengths)
-        stats["min_length"] = min(self.lengths)
-        stats["max_length"] = max(self.lengths)
+        stats["mean_length"] = lengths.total / len(lengths)
+        stats["N50"] = int(lengths.N50())
+        stats["L50"] = lengths.L50()
+        stats["min_length"] = int(lengths.values[0])
+        stats["max_length"] = int(lengths.values[-1])
         return stats
 
+    def get_length_histogram(self):
+        """Return the lengths of the sequences as a mergeable histogram
+
+        Histograms of several files can be added to get the statistics
+        (e.g. N50) of a project. See :class:`~sequana.stats.LengthHistogram`.
+        """
+        from sequana.stats import LengthHistogram
+        return LengthHistogram(self.lengths)
+
     def summary(self, max_contigs=-1):
         from pylab import mean, argmax
         # used by sequana summary fasta
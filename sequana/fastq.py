@@ -1,5 +1,7 @@
 """Utilities to manipulate FASTQ and Reads"""
 import io
+import os
+import json
 import time
 import zlib
 from itertools import islice
@@ -21,6 +23,7 @@ except: # version 2.0
 
 import pysam
 from pysam import qualitystring_to_array
+from sequana.phred import QualityBatch
 
 try:
     from itertools import izip_longest
@@ -231,7 +234,16 @@ class FastQ(object):
             self.data_format = "unknown"
 
 
-    def get_lengths(self):
+    def get_lengths(self, cache=False):
+        """Return the lengths of the reads
+
+        :param bool cache: take the lengths from the statistics of the file
+            (see :meth:`get_stats`) instead of reading it. The lengths are
+            then sorted instead of being in the order of the file.
+        """
+        if cache:
+            histogram = self.get_stats(cache=True).length_histogram
+            return np.repeat(np.arange(len(histogram)), histogram).tolist()
         return [len(x["sequence"]) for x in self]
 
 
@@ -274,7 +286,14 @@ class FastQ(object):
         return count
 
     def count_reads(self):
-        """Return count_lines divided by 4"""
+        """Return count_lines divided by 4
+
+        If the statistics of the file were saved in a valid sidecar file (see
+        :class:`FastQStats`), the file is not read again.
+        """
+        stats = FastQStats.read_cache(self.filename)
+        if stats is not None:
+            return stats.n_reads
         nlines = self.count_lines()
         if divmod(nlines, self._N)[1] != 0:
             print("WARNING. number of lines not multiple of 4.")
@@ -848,14 +867,18 @@ class FastQ(object):
                 letters = "\t".join([x for x in index.decode()])
                 fout.write("%s\t" % count + letters + "\n")
 
-    def stats(self):
-        self.rewind()
-        data = [len(read['sequence']) for read in self]
-        S = sum(data)
-        N = float(len(data))
-        return {"mean_read_length": S/N,
-                "N": int(N),
-                "sum_read_length": S}
+    def get_stats(self, cache=False):
+        """Return the statistics of the file (see :class:`FastQStats`)
+
+        :param bool cache: use and save the sidecar file of the statistics
+        """
+        return FastQStats.from_file(self.filename, cache=cache)
+
+    def stats(self, cache=False):
+        stats = self.get_stats(cache=cache)
+        return {"mean_read_length": stats.mean_read_length,
+                "N": stats.n_reads,
+                "sum_read_length": stats.total_bp}
 
     def __eq__(self, other):
         if id(other) == id(self):
@@ -868,6 +891,263 @@ class FastQ(object):
         return True
 
 
+class FastQStats(object):
+    """Statistics of FastQ files that can be cached and merged
+
+    All statistics are computed in a single pass over the file by batches of
+    reads and stored as counts and histograms so that statistics of several
+    files (e.g. lanes of a sample) can be added::
+
+        from sequana.fastq import FastQStats
+        stats = FastQStats.from_file("lane1.fastq.gz")
+        stats += FastQStats.from_file("lane2.fastq.gz")
+        stats.n_reads, stats.mean_read_length, stats.gc_content
+
+    With *cache* set to True, the statistics are saved next to the FastQ file
+    in a small JSON file (sidecar) with the **.sequana_stats.json** extension.
+    The sidecar records the path, size and modification time of the FastQ
+    file; it is used instead of reading the file again as long as the file
+    does not change. Use *cache_directory* if the FastQ directory is
+    read-only.
+
+    The GC content is the mean of the GC content of each read, as in
+    :class:`FastQC`.
+
+    """
+    #: bump this number whenever the content of the sidecar changes
+    version = 2
+    suffix = ".sequana_stats.json"
+    bases = "ACGTN"
+
+    def __init__(self):
+        self.filenames = []
+        self.n_reads = 0
+        self.base_counts = dict.fromkeys(self.bases, 0)
+        #: number of reads for each read length
+        self.length_histogram = np.zeros(1, dtype=np.int64)
+        #: number of bases for each quality (0 to 93)
+        self.quality_histogram = np.zeros(94, dtype=np.int64)
+        #: number of reads for each GC content (percentage rounded)
+        self.gc_histogram = np.zeros(101, dtype=np.int64)
+        #: sum of the GC content of each read (percentage, not rounded)
+        self.sum_gc = 0.
+        self.sum_mean_qualities = 0.
+
+    def __repr__(self):
+        return "FastQStats: {} reads, {} bases".format(self.n_reads,
+                                                      self.total_bp)
+
+    def __add__(self, other):
+        stats = FastQStats()
+        for this in (self, other):
+            stats.filenames.extend(this.filenames)
+            stats.n_reads += this.n_reads
+            for base in self.bases:
+                stats.base_counts[base] += this.base_counts[base]
+            stats.length_histogram = _add_histograms(stats.length_histogram,
+                                                     this.length_histogram)
+            stats.quality_histogram += this.quality_histogram
+            stats.gc_histogram += this.gc_histogram
+            stats.sum_gc += this.sum_gc
+            stats.sum_mean_qualities += this.sum_mean_qualities
+        return stats
+
+    def __radd__(self, other):
+        # so that sum() can be used
+        if other == 0:
+            return self
+        return self.__add__(other)
+
+    def _get_total_bp(self):
+        lengths = np.arange(len(self.length_histogram))
+        return int((lengths * self.length_histogram).sum())
+    total_bp = property(_get_total_bp, doc="total number of bases")
+
+    def _get_mean_read_length(self):
+        return self.total_bp / max(self.n_reads, 1)
+    mean_read_length = property(_get_mean_read_length)
+
+    def _get_min_read_length(self):
+        return int(np.nonzero(self.length_histogram)[0].min()) if self.n_reads else 0
+    min_read_length = property(_get_min_read_length)
+
+    def _get_max_read_length(self):
+        return int(np.nonzero(self.length_histogram)[0].max()) if self.n_reads else 0
+    max_read_length = property(_get_max_read_length)
+
+    def _get_gc_content(self):
+        return self.sum_gc / max(self.n_reads, 1)
+    gc_content = property(_get_gc_content,
+        doc="mean of the GC content of the reads (%)")
+
+    def _get_mean_quality(self):
+        return self.sum_mean_qualities / max(self.n_reads, 1)
+    mean_quality = property(_get_mean_quality,
+        doc="mean of the mean quality of the reads")
+
+    def add_reads(self, sequences, qualities):
+        """Add a batch of reads (lists of sequences and quality strings)"""
+        lengths = np.array([len(x) for x in sequences], dtype=np.int64)
+        if len(lengths) == 0:
+            return
+        codes = np.frombuffer("".join(sequences).upper().encode("ascii"),
+                              dtype=np.uint8)
+        counts = np.bincount(codes, minlength=256)
+        for base in self.bases:
+            self.base_counts[base] += int(counts[ord(base)])
+
+        self.n_reads += len(lengths)
+        self.length_histogram = _add_histograms(self.length_histogram,
+                                                np.bincount(lengths))
+
+        indptr = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        nonempty = lengths > 0
+        isGC = (codes == ord("G")) | (codes == ord("C"))
+        GC = np.zeros(len(lengths))
+        if nonempty.any():
+            GC[nonempty] = np.add.reduceat(isGC, indptr[nonempty], dtype=np.int64)
+        GC = GC * 100. / np.maximum(lengths, 1)
+        self.sum_gc += float(GC[nonempty].sum())
+        gc = np.round(GC).astype(np.int64)
+        self.gc_histogram += np.bincount(gc[nonempty], minlength=101)
+
+        batch = QualityBatch(qualities)
+        self.quality_histogram += batch.get_histogram()
+        self.sum_mean_qualities += float(np.nansum(batch.mean_qualities))
+
+    @classmethod
+    def from_file(cls, filename, cache=False, cache_directory=None,
+                  batch_size=100000):
+        """Return the statistics of a FastQ file (possibly gzipped)
+
+        :param bool cache: read the statistics from the sidecar file if it
+            is valid and save them if they are computed.
+        :param str cache_directory: where to store the sidecar file (defaults
+            to the directory of the FastQ file)
+        :param int batch_size: number of reads processed at once
+        """
+        if cache:
+            stats = cls.read_cache(filename, cache_directory)
+            if stats is not None:
+                return stats
+
+        stats = cls()
+        stats.filenames = [filename]
+        sequences, qualities = [], []
+        with pysam.FastxFile(filename) as fin:
+            for record in fin:
+                sequences.append(record.sequence)
+                qualities.append(record.quality)
+                if len(sequences) == batch_size:
+                    stats.add_reads(sequences, qualities)
+                    sequences, qualities = [], []
+        stats.add_reads(sequences, qualities)
+
+        if cache:
+            stats.write_cache(filename, cache_directory)
+        return stats
+
+    @classmethod
+    def from_files(cls, filenames, **kwargs):
+        """Return the merged statistics of several files (e.g. lanes)"""
+        return sum(cls.from_file(filename, **kwargs) for filename in filenames)
+
+    @classmethod
+    def get_cache_filename(cls, filename, cache_directory=None):
+        """Return the name of the sidecar file of a FastQ file"""
+        if cache_directory is None:
+            return filename + cls.suffix
+        return os.path.join(cache_directory, os.path.basename(filename) + cls.suffix)
+
+    @staticmethod
+    def _get_key(filename):
+        info = os.stat(filename)
+        return {"path": os.path.abspath(filename), "size": info.st_size,
+                "mtime": info.st_mtime_ns}
+
+    @classmethod
+    def read_cache(cls, filename, cache_directory=None):
+        """Return the statistics saved in the sidecar file
+
+        :return: None if there is no sidecar file or if the FastQ file
+            changed since it was written.
+        """
+        sidecar = cls.get_cache_filename(filename, cache_directory)
+        if os.path.exists(sidecar) is False:
+            return None
+        try:
+            with open(sidecar) as fin:
+                data = json.load(fin)
+        except ValueError:
+            logger.warning("Corrupted {} ignored".format(sidecar))
+            return None
+        if data.get("version") != cls.version or \
+                data.get("key") != cls._get_key(filename):
+            return None
+        stats = cls.from_dict(data["stats"])
+        stats.filenames = [filename]
+        return stats
+
+    def write_cache(self, filename, cache_directory=None):
+        """Save the statistics in the sidecar file of a FastQ file"""
+        sidecar = self.get_cache_filename(filename, cache_directory)
+        data = {"version": self.version, "key": self._get_key(filename),
+                "stats": self.to_dict()}
+        try:
+            with open(sidecar, "w") as fout:
+                json.dump(data, fout)
+        except OSError as err:
+            logger.warning("Could not save statistics in {}: {}".format(
+                sidecar, err))
+
+    def to_dict(self):
+        """Return the statistics as a dictionary (JSON compatible)"""
+        return {
+            "n_reads": self.n_reads,
+            "base_counts": self.base_counts,
+            "length_histogram": self.length_histogram.tolist(),
+            "quality_histogram": self.quality_histogram.tolist(),
+            "gc_histogram": self.gc_histogram.tolist(),
+            "sum_gc": self.sum_gc,
+            "sum_mean_qualities": self.sum_mean_qualities,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build statistics from a dictionary created with :meth:`to_dict`"""
+        stats = cls()
+        stats.n_reads = data["n_reads"]
+        stats.base_counts = dict(data["base_counts"])
+        for name in ("length_histogram", "quality_histogram", "gc_histogram"):
+            setattr(stats, name, np.array(data[name], dtype=np.int64))
+        stats.sum_gc = data["sum_gc"]
+        stats.sum_mean_qualities = data["sum_mean_qualities"]
+        return stats
+
+    def get_summary(self):
+        """Return the statistics in the format of :meth:`FastQC.get_stats`"""
+        stats = dict(self.base_counts)
+        stats.update({
+            "n_reads": self.n_reads,
+            "total bases": self.total_bp,
+            "GC content": self.gc_content,
+            "average read length": self.mean_read_length,
+            "mean quality": self.mean_quality,
+        })
+        cols = ['n_reads', 'A', 'C', 'G', 'T', 'N', 'total bases',
+                'GC content', 'average read length', 'mean quality']
+        return pd.DataFrame([stats])[cols]
+
+
+def _add_histograms(h1, h2):
+    # sum of two histograms of different lengths
+    if len(h1) < len(h2):
+        h1, h2 = h2, h1
+    h1 = h1.copy()
+    h1[:len(h2)] += h2
+    return h1
+
+
 # a simple decorator to check whether the data was computed or not.
 # If not, compute it
 def run_info(f):
@@ -910,7 +1190,7 @@ class FastQC(object):
 
     """
     def __init__(self, filename, max_sample=500000, dotile=False, verbose=True,
-                 skip_nrows=0):
+                 skip_nrows=0, cache=False):
         """.. rubric:: constructor
 
         :param filename:
@@ -920,6 +1200,11 @@ class FastQC(object):
             good feeling of the data quality. The entire input file is
             parsed tough. This is required for instance to get the number of
             nucleotides.
+        :param bool cache: read the statistics of the whole file from its
+            sidecar file, or compute and save them (see :class:`FastQStats`).
+            The number of reads, :meth:`get_stats` and
+            :meth:`histogram_sequence_lengths` then use them instead of
+            reading the file again.
         """
         self.verbose = verbose
         self.filename = filename
@@ -929,7 +1214,12 @@ class FastQC(object):
         # However, the FastQ implementation in this module is faster at
         # computing the length by a factor 3
         self.fastq = FastQ(filename)
-        self.N = len(self.fastq)
+        self._stats = None
+        if cache:
+            self._stats = self.fastq.get_stats(cache=True)
+            self.N = self._stats.n_reads
+        else:
+            self.N = len(self.fastq)
 
         # Use only max_sample in some of the computation
         self.max_sample = min(max_sample, self.N)
@@ -958,12 +1248,10 @@ class FastQC(object):
         self.lengths = np.empty(self.N)
         self.gc_list = []
         total_length = 0
-        C = defaultdict(int)
         if self.verbose:
             pb = Progress(self.N)
 
         sequences = []
-        mean_qualities = []
         qualities = []
         # could use multiprocessing
         # FastxFile has shown some errors while handling gzip files
@@ -983,16 +1271,10 @@ class FastQC(object):
                 self.lengths[i] = N
 
                 # we can store all qualities and sequences reads, so
-                # just max_sample are stored:
-                quality = [ord(x) -33 for x in record.qualities]
-                mean_qualities.append(sum(quality) / N)
-                qualities.append(quality)
+                # just max_sample are stored. qualities are decoded at the end
+                qualities.append(record.qualities)
                 sequences.append(record.sequence)
 
-                # store count of all qualities
-                for k in record.qualities:
-                    C[k] += 1
-
                 GG = record.sequence.count('G') 
                 CC = record.sequence.count('C')
                 self.gc_list.append((GG+CC)/float(N)*100)
@@ -1009,17 +1291,20 @@ class FastQC(object):
                 if self.verbose:
                     pb.animate(i+1)
 
-        # other data
-        self.qualities = qualities
+        # decode all qualities at once
+        batch = QualityBatch(qualities)
+        self.qualities = batch.to_list()
         # we may want to skip first rows 
-        self.mean_qualities = mean_qualities
+        self.mean_qualities = list(batch.mean_qualities)
+        # only the lengths of the sampled reads are set
+        self.lengths = self.lengths[self.skip_nrows:self.skip_nrows + len(sequences)]
         self.minimum = int(self.lengths.min())
         self.maximum = int(self.lengths.max())
         self.sequences = sequences
         self.gc_content = np.mean(self.gc_list)
         stats['mean_length'] = total_length / float(self.N)
         stats['total_bp'] = stats['A'] + stats['C'] + stats['G'] + stats["T"] + stats['N']
-        stats['mean_quality'] = sum([(ord(k) -33)*v for k,v in C.items()]) / stats['total_bp']
+        stats['mean_quality'] = batch.mean_quality
 
         self.stats = stats
 
@@ -1061,9 +1346,8 @@ class FastQC(object):
                     continue
                 if i > self.max_sample + self.skip_nrows:
                     break
-                quality = [ord(x) -33 for x in record.qualities]
-                qualities.append(quality)
-        return qualities
+                qualities.append(record.qualities)
+        return QualityBatch(qualities).to_list()
 
     def boxplot_quality(self, hold=False, ax=None):
         """Boxplot quality
@@ -1120,6 +1404,12 @@ class FastQC(object):
         Hist2D(tiles['x'], tiles['y']).plot()
 
     @run_info
+    def _get_length_histogram(self):
+        # lengths of the sampled reads
+        data = [len(x) for x in self.sequences]
+        bary, barx = np.histogram(data, bins=range(max(data)+1))
+        return barx, bary, max(data)
+
     def histogram_sequence_lengths(self, logy=True):
         """Histogram sequence lengths
 
@@ -1132,9 +1422,14 @@ class FastQC(object):
             qc = FastQC(filename)
             qc.histogram_sequence_lengths()
 
+        With *cache* (see constructor), the lengths of all reads are used.
         """
-        data = [len(x) for x in self.sequences]
-        bary, barx = np.histogram(data, bins=range(max(data)+1))
+        if self._stats is not None:
+            bary = self._stats.length_histogram
+            barx = np.arange(len(bary))
+            maximum = self._stats.max_read_length
+        else:
+            barx, bary, maximum = self._get_length_histogram()
 
         # get rid of zeros to avoid warnings
         bx = [x for x,y in zip(barx, bary) if y!=0]
@@ -1144,7 +1439,7 @@ class FastQC(object):
         else:
             pylab.bar(bx, by)
 
-        pylab.xlim([1,max(data)+1])
+        pylab.xlim([1,maximum+1])
 
         pylab.grid(True)
         pylab.xlabel("position (bp)", fontsize=self.fontsize)
@@ -1170,8 +1465,23 @@ class FastQC(object):
         pylab.xlabel(r"Mean GC content (%)", fontsize=self.fontsize)
         pylab.xlim([0,100])
 
-    @run_info
     def get_stats(self):
+        """Return the statistics of the reads as a one-row DataFrame
+
+        The statistics of all reads are returned if they were loaded (see
+        *cache* in the constructor) or if all reads are sampled. Otherwise,
+        they are computed on the sampled reads.
+        """
+        if self.skip_nrows == 0:
+            if self._stats is not None:
+                return self._stats.get_summary()
+            if self.max_sample >= self.N:
+                # a single pass with FastQStats is enough
+                return self.fastq.get_stats().get_summary()
+        return self._get_stats()
+
+    @run_info
+    def _get_stats(self):
         # FIXME the information should all be computed in _get_info
 
         # !!! sequences is limited to 500,000 if max_sample set to 500,000
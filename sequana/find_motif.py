@@ -1,10 +1,118 @@
 from sequana import BAM, FastQ
 from sequana.lazy import pylab
+from sequana.lazy import numpy as np
 from sequana.lazy import pandas as pd
 
 
+# number of reads sent at once to the workers of FindMotif
+BATCH_SIZE = 1000
 
 
+def get_motif_positions(seq, motif):
+    """Return the positions of all occurrences of a motif (overlapping or not)"""
+    codes = np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+    pattern = np.frombuffer(motif.encode("ascii"), dtype=np.uint8)
+    N = len(codes) - len(pattern) + 1
+    if N <= 0 or len(pattern) == 0:
+        return np.zeros(0, dtype=np.int64)
+    found = codes[:N] == pattern[0]
+    for i in range(1, len(pattern)):
+        found &= codes[i:N + i] == pattern[i]
+    return np.nonzero(found)[0]
+
+
+def _is_self_overlapping(motif):
+    # True if two occurrences of the motif can overlap (e.g. CAGCAG, AAA)
+    return any(motif[i:] == motif[:len(motif) - i] for i in range(1, len(motif)))
+
+
+def get_window_counts(seq, motif, window):
+    """Return the number of motifs in the windows starting at each position
+
+    The count of the i-th position is ``seq[i:i+window].count(motif)``, that
+    is the number of non-overlapping occurrences found from left to right.
+
+    Occurrences are searched once. If they cannot overlap, window counts are
+    the difference of a cumulative sum. Otherwise, the greedy left-to-right
+    count of each window is obtained by jumping over the occurrences with
+    pointers doubling at each level (log of window / motif length levels).
+    """
+    L = len(seq)
+    M = len(motif)
+    positions = get_motif_positions(seq, motif)
+    if len(positions) == 0:
+        return np.zeros(L, dtype=np.int64)
+    starts = np.arange(L)
+    # occurrences must end within the window (and the sequence)
+    bound = starts + window - M
+    # first occurrence at or after each position and the first one after the
+    # last valid one
+    first = np.searchsorted(positions, starts, side="left")
+    last = np.searchsorted(positions, bound, side="right")
+
+    if not _is_self_overlapping(motif):
+        return np.maximum(last - first, 0)
+
+    # next occurrence that does not overlap each occurrence (sentinel
+    # len(positions) is never valid)
+    P = len(positions)
+    sentinel = np.concatenate([positions, [L + window]])
+    jumps = [np.concatenate([np.searchsorted(positions, positions + M), [P]])]
+    level = 1
+    while (1 << level) * M <= window:
+        jumps.append(jumps[-1][jumps[-1]])
+        level += 1
+
+    counts = (sentinel[first] <= bound).astype(np.int64)
+    current = first
+    for k in range(len(jumps) - 1, -1, -1):
+        following = jumps[k][current]
+        valid = sentinel[following] <= bound
+        current = np.where(valid, following, current)
+        counts += valid * (1 << k)
+    return counts
+
+
+def _scan_batch(batch, motif, window, local_threshold):
+    # number of windows above the threshold for each sequence of a batch
+    return [int((get_window_counts(seq, motif, window) >= local_threshold).sum())
+            for seq in batch]
+
+
+def _scan(batches, motif, window, local_threshold, jobs=1):
+    # yield the batches (list of tuples with a sequence as first item) and
+    # their scores, in order
+    if jobs > 1:
+        import collections
+        from concurrent.futures import ProcessPoolExecutor
+        pending = collections.deque()
+        with ProcessPoolExecutor(jobs) as executor:
+            for batch in batches:
+                pending.append((batch, executor.submit(_scan_batch,
+                    [x[0] for x in batch], motif, window, local_threshold)))
+                # keep a bounded number of batches in memory
+                while len(pending) > 2 * jobs:
+                    batch, future = pending.popleft()
+                    yield batch, future.result()
+            while pending:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+    else:
+        for batch in batches:
+            yield batch, _scan_batch([x[0] for x in batch], motif, window,
+                                     local_threshold)
+
+
+def _batches(items, batch_size=BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
 def find_motif(bamfile, motif="CAGCAG", window=200, savefig=False, 
     local_th=5, global_th=10):
@@ -25,10 +133,10 @@ def find_motif(bamfile, motif="CAGCAG", window=200, savefig=False,
         if a.query_sequence is None:
             continue
         seq = a.query_sequence
-        X1 = [seq[i:i+window].count(motif) for i in range(len(seq))]
-        S = sum([x>local_th for x in X1])
+        X1 = get_window_counts(seq, motif, window)
+        S = int((X1 > local_th).sum())
         Ss.append(S)
-        als.append(a)
+        alns.append(a)
         if S > global_th:
             found.append(True)
             off = a.query_alignment_start
@@ -68,21 +176,38 @@ class FindMotif():
         if window is None:
             window = self.window
 
-        # This should be improved with a true sliding window
-        X1 = [seq[i:i+window].count(motif) for i in range(len(seq))]
+        X1 = get_window_counts(seq, motif, window)
 
         # Number of point crossing the threshold in the sequence
         # The threshold should be below window/len(motif) if there are no errors
-        S = sum([x>=local_threshold for x in X1])
+        S = int((X1 >= local_threshold).sum())
         return X1, S
 
+    def _get_thresholds(self, local_threshold, global_threshold):
+        if local_threshold is None:
+            local_threshold = self.local_threshold
+        if global_threshold is None:
+            global_threshold = self.global_threshold
+        return local_threshold, global_threshold
+
     def find_motif_fasta(self, filename, motif, window=200,
-            local_threshold=None, global_threshold=None):
-        from sequana import FastA
-        data = FastA(filename)
-        N = len(data)
-        from easydev import Progress
-        pb = Progress(N)
+            local_threshold=None, global_threshold=None, jobs=1):
+        """Return the sequences of a FASTA file with many windows rich in motifs
+
+        :param int jobs: number of processes. Sequences are sent to the
+            workers by batches of :data:`BATCH_SIZE`.
+        :return: a dataframe with the name, score (hit), length, start and end
+            of the sequences with a score above the global threshold.
+        """
+        import pysam
+        local_threshold, global_threshold = self._get_thresholds(
+            local_threshold, global_threshold)
+
+        def records():
+            with pysam.FastxFile(filename) as fin:
+                for item in fin:
+                    yield (item.sequence, item.name)
+
         df = {
             "query_name": [],
             "hit": [],
@@ -90,24 +215,38 @@ class FindMotif():
             "start": [],
             "end": []
         }
-        for i, item in enumerate(data):
-            X1, S = self.find_motif_from_sequence(item.sequence, motif,
-                        window=window, local_threshold=local_threshold
-                        )
-            if S >= self.global_threshold:
-                df['query_name'].append(item.name)
-                df['start'].append(0)
-                df['end'].append(len(item.sequence))
-                df['length'].append(len(item.sequence))
-                df['hit'].append(S)
-            pb.animate(i+1)
+        for batch, scores in _scan(_batches(records()), motif, window,
+                                   local_threshold, jobs=jobs):
+            for (seq, name), S in zip(batch, scores):
+                if S >= global_threshold:
+                    df['query_name'].append(name)
+                    df['start'].append(0)
+                    df['end'].append(len(seq))
+                    df['length'].append(len(seq))
+                    df['hit'].append(S)
         df = pd.DataFrame(df)
         return df
 
     def find_motif_bam(self, filename, motif, window=200, figure=False, savefig=False,
-            local_threshold=None, global_threshold=None):
-        from sequana import BAM
-        b1 = BAM(filename)
+            local_threshold=None, global_threshold=None, jobs=1):
+        """Return the score of all alignments of a BAM file
+
+        :param int jobs: number of processes. Alignments are sent to the
+            workers by batches of :data:`BATCH_SIZE`.
+        :return: a dataframe with the name, score (hit), length, start and end
+            of the alignments.
+        """
+        local_threshold, global_threshold = self._get_thresholds(
+            local_threshold, global_threshold)
+
+        def records():
+            for a in BAM(filename):
+                if a.query_sequence is None:
+                    continue
+                yield (a.query_sequence, a.query_name, a.reference_start,
+                       a.reference_end, a.rlen, a.query_alignment_start,
+                       a.reference_name)
+
         df = {
             "query_name": [],
             "hit": [],
@@ -115,32 +254,22 @@ class FindMotif():
             "start": [],
             "end": []
         }
+        for batch, scores in _scan(_batches(records()), motif, window,
+                                   local_threshold, jobs=jobs):
+            for (seq, name, start, end, length, off, rname), S in zip(batch, scores):
+                df['query_name'].append(name)
+                df['start'].append(start)
+                df['end'].append(end)
+                df['length'].append(length)
+                df['hit'].append(S)
 
-        for a in b1:
-            if a.query_sequence is None:
-                continue
-            seq = a.query_sequence
-
-            X1, S = self.find_motif_from_sequence(seq, motif, window=window,
-                local_threshold=local_threshold)
-
-            df['query_name'].append(a.query_name)
-            df['start'].append(a.reference_start)
-            df['end'].append(a.reference_end)
-            df['length'].append(a.rlen)
-            df['hit'].append(S)
-
-            if S >= self.global_threshold:
-                off = a.query_alignment_start
-                #pylab.clf()
-                if figure:
-                    pylab.plot(range(off+a.reference_start, off+a.reference_start+len(seq)),X1)
+                if S >= global_threshold and figure:
+                    X1 = get_window_counts(seq, motif, window)
+                    pylab.plot(range(off+start, off+start+len(seq)),X1)
                     if savefig:
-                        pylab.savefig("{}_{}_{}.png".format(a.reference_name, S, a.query_name.replace("/", "_")))
+                        pylab.savefig("{}_{}_{}.png".format(rname, S, name.replace("/", "_")))
 
         df = pd.DataFrame(df)
-        L = len(df.query("hit>5"))
-        print(L)
         return df
 
 
@@ -162,10 +291,10 @@ class FindMotif():
             seq = found.query_sequence
             if clf:pylab.clf()
             for window in windows:
-                X = [seq[i:i+window].count(motif) for i in range(len(seq))]
+                X = get_window_counts(seq, motif, window)
                 if show_figure:
                     pylab.plot(X, label=window)
-                score = sum([x>local_threshold for x in X])
+                score = int((X > local_threshold).sum())
                 sizes.append(score-window)
             if show_figure:
                 pylab.legend()
@@ -214,7 +343,7 @@ class FindMotif():
             seq = aln.query_sequence
             if seq:
                 count += 1
-                X1 = [seq[i:i+window].count(motif) for i in range(len(seq))]
+                X1 = get_window_counts(seq, motif, window)
                 pylab.plot(range(aln.reference_start,
                     aln.reference_start+len(seq)),X1, label=aln.query_name)
         print("Showing {} entries after filtering".format(count))
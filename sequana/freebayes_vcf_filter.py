@@ -16,12 +16,22 @@
 #
 ##############################################################################
 """Analysis of VCF file generated by freebayes."""
+import io
+import csv
+
 from sequana.lazy import vcf
+from sequana.lazy import numpy as np
 from sequana.lazy import pandas as pd
+from sequana.vcf_batch_filter import VCFBatchFilter, get_info, \
+    get_info_matrix, strand_balance
 from sequana import logger
 logger.name = __name__
 
 
+_annotation_columns = ['effect_type', 'mutation_type', 'effect_impact',
+    'gene_name', 'CDS_position', 'codon_change', 'prot_effect', 'prot_size']
+
+
 class Variant(object):
     """ Variant reader and dictionary that stores important variant information
     """
@@ -33,7 +43,7 @@ class Variant(object):
         """
         self._record = record
         self._samples = {s.sample: s for s in record.samples}
-        self._resume = self._vcf_line_to_dict(record)
+        self._resume = None
 
     def __str__(self):
         return str(self.record)
@@ -44,6 +54,8 @@ class Variant(object):
 
     @property
     def resume(self):
+        if self._resume is None:
+            self._resume = self._vcf_line_to_dict(self._record)
         return self._resume
 
     @property
@@ -248,18 +260,67 @@ class VCF_freebayes(vcf.Reader):
         variants = [Variant(v) for v in self]
         return variants
 
+    def _get_batch_filter(self, filter_dict=None, chunksize=100000):
+        if filter_dict:
+            self.filters_params = filter_dict
+        engine = VCFBatchFilter(self.filename, chunksize=chunksize)
+        engine.freebayes_params = self.filters_params
+        return engine
+
     def filter_vcf(self, filter_dict=None):
         """ Filter variants in the VCF file.
 
         :param dict filter_dict: dictionary of filters. It updates the
             attribute :attr:`VCF_freebayes.filter_params`
         Return Filtered_freebayes object.
+
+        Filters are evaluated by batches of variants with
+        :class:`~sequana.vcf_batch_filter.VCFBatchFilter`. Same results as
+        :meth:`_filter_line` applied to each variant.
         """
-        if filter_dict:
-            self.filters_params = filter_dict
-        variants = [Variant(v) for v in self if self._filter_line(v)]
-        self.rewind()
-        return Filtered_freebayes(variants, self)
+        engine = self._get_batch_filter(filter_dict)
+        lines = []
+        for chunk in engine.read_chunks():
+            keep = engine.filter_batch(chunk)
+            lines.extend(line for line, status in zip(chunk, keep) if status)
+        return Filtered_freebayes(None, self, lines=lines)
+
+    def to_csv(self, output_filename, filter_dict=None, info_field=False,
+               chunksize=100000):
+        """Filter the variants and save the table in CSV or Parquet format
+
+        :param str output_filename: output filename. Parquet format is used
+            if the extension is .parquet (requires pyarrow).
+        :param dict filter_dict: dictionary of filters. It updates the
+            attribute :attr:`VCF_freebayes.filter_params`
+        :param bool info_field: save the info_* columns (joint VCF only)
+        :param int chunksize: number of variants processed at once.
+
+        Same table as :meth:`Filtered_freebayes.to_csv` but variants are
+        converted and written by chunks (see :func:`freebayes_lines_to_df`)
+        so that large (joint) VCF files can be processed with a small
+        memory footprint.
+        """
+        engine = self._get_batch_filter(filter_dict, chunksize=chunksize)
+        columns = None
+        writer = _TableWriter(output_filename, "# sequana_variant_calling;{0}"
+            .format(self.filters_params))
+        try:
+            for chunk in engine.read_chunks():
+                keep = engine.filter_batch(chunk)
+                lines = [x for x, status in zip(chunk, keep) if status]
+                if not lines:
+                    continue
+                if columns is None:
+                    columns = _get_columns(self.samples, self.is_joint,
+                        _has_annotation(lines[0]), info_field)
+                df = freebayes_lines_to_df(lines, self.samples)
+                writer.write(df.reindex(columns=columns))
+            if columns is None:
+                writer.write(pd.DataFrame(columns=_get_columns(self.samples,
+                    self.is_joint, False, info_field)))
+        finally:
+            writer.close()
 
     def _filter_line(self, vcf_line):
         """ Filter variant with parameter set in :attr:`VCF_freebayes.filters`.
@@ -298,13 +359,18 @@ class VCF_freebayes(vcf.Reader):
 class Filtered_freebayes(object):
     """ Variants filtered with VCF_freebayes.
     """
-    def __init__(self, variants, fb_vcf):
+    def __init__(self, variants, fb_vcf, lines=None):
         """.. rubric:: constructor
 
-        :param list variants: list of variants record.
+        :param list variants: list of variants record. If None, variants
+            are created from *lines* when required.
         :param VCF_freebayes fb_vcf: class parent.
+        :param list lines: VCF lines of the variants. If provided, the
+            data frame is built from the lines directly (see
+            :func:`freebayes_lines_to_df`).
         """
         self._variants = variants
+        self._lines = lines
         self._vcf = fb_vcf
         self._columns = self._create_index()
         self._df = self._vcf_to_df()
@@ -313,6 +379,11 @@ class Filtered_freebayes(object):
     def variants(self):
         """ Get the variant list.
         """
+        if self._variants is None:
+            header = "".join(VCFBatchFilter(self.vcf.filename).header)
+            reader = vcf.Reader(fsock=io.StringIO(header +
+                                                  "".join(self._lines)))
+            self._variants = [Variant(v) for v in reader]
         return self._variants
 
     @property
@@ -334,33 +405,24 @@ class Filtered_freebayes(object):
         return self._columns
 
     def _create_index(self):
-        columns = ['chr', 'position', 'reference', 'alternative', 'depth']
-        if self.vcf.is_joint:
-            columns += self.vcf.samples
+        if self._lines is not None:
+            annotated = len(self._lines) and _has_annotation(self._lines[0])
         else:
-            columns.append('frequency')
-        columns += ['strand_balance', 'freebayes_score']
-        try:
-            if 'effect_type' in self.variants[0].resume.keys():
-                columns += [ 
-                    'effect_type', 'mutation_type', 'effect_impact',
-                    'gene_name', 'CDS_position', 'codon_change', 'prot_effect',
-                    'prot_size'
-                ]
-        except IndexError:
-            pass
-        if self.vcf.is_joint:
-            columns += [
-                'info_{0}'.format(i) for i in range(len(self.vcf.samples))
-            ]
-        return columns
+            try:
+                annotated = 'effect_type' in self.variants[0].resume.keys()
+            except IndexError:
+                annotated = False
+        return _get_columns(self.vcf.samples, self.vcf.is_joint, annotated)
 
     def _vcf_to_df(self):
         """ Create a data frame with the most important information contained
         in the VCF file.
         """
-        dict_list = [v.resume for v in self.variants]
-        df = pd.DataFrame.from_records(dict_list)
+        if self._lines is not None:
+            df = freebayes_lines_to_df(self._lines, self.vcf.samples)
+        else:
+            dict_list = [v.resume for v in self.variants]
+            df = pd.DataFrame.from_records(dict_list)
         try:
             return df[self.columns]
         except KeyError:
@@ -370,21 +432,17 @@ class Filtered_freebayes(object):
         """ Write DataFrame in CSV format.
 
         :params str output_filename: output CSV filename.
+        :param bool info_field: save the info_* columns (joint VCF only)
         """
+        columns = [x for x in self.columns if info_field or
+                   not x.startswith("info_")]
         with open(output_filename, "w") as fp:
             print("# sequana_variant_calling;{0}".format(
                 self.vcf.filters_params), file=fp)
             if self.df.empty:
-                print(",".join(self.columns), file=fp)
+                print(",".join(columns), file=fp)
             else:
-                if info_field:
-                    self.df.to_csv(fp, index=False)
-                else:
-                    self.df.to_csv(
-                        fp,
-                        index=False,       
-                        columns=self.columns[:-len(self.vcf.samples)]
-                    )
+                self.df.to_csv(fp, index=False, columns=columns)
 
     def to_vcf(self, output_filename):
         """ Write VCF file in VCF format.
@@ -440,3 +498,191 @@ def compute_strand_balance(vcf_line):
         for i in range(len(vcf_line.INFO["SAF"]))
     ]
     return strand_bal
+
+
+def _has_annotation(line):
+    """Return True if the VCF line is annotated by snpEff"""
+    info = line.split("\t", 8)[7]
+    return info.startswith("EFF=") or ";EFF=" in info
+
+
+def _get_columns(samples, is_joint, annotated, info_field=True):
+    columns = ['chr', 'position', 'reference', 'alternative', 'depth']
+    if is_joint:
+        columns += samples
+    else:
+        columns.append('frequency')
+    columns += ['strand_balance', 'freebayes_score']
+    if annotated:
+        columns += _annotation_columns
+    if is_joint and info_field:
+        columns += ['info_{0}'.format(i) for i in range(len(samples))]
+    return columns
+
+
+def _format_values(values, fmt="%.2f", sep="; "):
+    """Format the rows of a 2D array and join them (NaN are skipped)"""
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    result = None
+    for column in values.T:
+        text = pd.Series(np.char.mod(fmt, column))
+        valid = ~np.isnan(column)
+        if result is None:
+            result = text.where(valid, "")
+        else:
+            result = result + np.where(valid, sep + text, "")
+    return result
+
+
+def _get_format_fields(fmt, data, names):
+    """Extract FORMAT fields of one sample
+
+    :param fmt: Series of the FORMAT column
+    :param data: Series of the sample column
+    :param names: FORMAT keys to extract (e.g. GT, DP)
+    :return: dictionary of Series (None if missing)
+    """
+    values = data.str.split(":", expand=True)
+    fields = {name: pd.Series([None] * len(data), dtype=object)
+              for name in names}
+    # FORMAT is usually the same for all variants; group rows by FORMAT
+    for this in fmt.unique():
+        keys = this.split(":")
+        rows = (fmt == this).values
+        for name in names:
+            if name in keys and keys.index(name) < values.shape[1]:
+                fields[name][rows] = values.loc[rows, keys.index(name)].values
+    return fields
+
+
+def freebayes_lines_to_df(lines, samples):
+    """Convert freebayes VCF lines into a data frame of the main fields
+
+    :param list lines: VCF data lines (no header)
+    :param list samples: names of the samples in the VCF file
+    :return: same data frame as built from :attr:`Variant.resume` in
+        :class:`Filtered_freebayes`
+
+    INFO and FORMAT fields are extracted for all lines at once and the
+    frequencies and strand balances are computed on arrays, so no Python
+    object is created per variant.
+    """
+    if len(lines) == 0:
+        return pd.DataFrame()
+    ncols = 9 + len(samples) if samples else 8
+    data = pd.read_csv(io.StringIO("".join(lines)), sep="\t", header=None,
+        names=range(ncols), usecols=range(ncols), dtype=str,
+        quoting=csv.QUOTE_NONE, keep_default_na=False)
+    info = data[7]
+
+    depth = get_info(info, "DP")
+    qual = pd.to_numeric(data[5], errors="coerce").astype(float)
+
+    df = pd.DataFrame({
+        'chr': data[0],
+        'position': data[1],
+        'depth': depth.astype(np.int64) if not np.isnan(depth).any()
+                 else depth,
+        'reference': data[3],
+        'alternative': data[4].str.replace(",", "; ", regex=False),
+        'freebayes_score': qual,
+        'strand_balance': _format_values(strand_balance(
+            get_info_matrix(info, "SAF"), get_info_matrix(info, "SAR"))),
+    })
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if len(samples) == 1:
+            df['frequency'] = _format_values(
+                get_info_matrix(info, "AO") / depth[:, None])
+        else:
+            for i, sample in enumerate(samples):
+                fields = _get_format_fields(data[8], data[9 + i],
+                                            ["GT", "DP", "AO", "GL"])
+                gt = fields["GT"].fillna(".")
+                called = gt.str.replace(r"[/|]", "", regex=True).str.strip(
+                    ".") != ""
+                sample_depth = pd.to_numeric(fields["DP"], errors="coerce")
+                ao = fields["AO"].fillna("").str.split(",", expand=True)
+                ao = ao.apply(pd.to_numeric, errors="coerce").values
+                freq = _format_values(ao / sample_depth.values[:, None])
+                gl = fields["GL"].fillna("").str.split(",", expand=True)
+                gl = _format_values(gl.apply(pd.to_numeric,
+                    errors="coerce").values, "%.3f", ",")
+                dp = fields["DP"].where(fields["DP"] != ".", "None")
+                info_field = gt + ":" + dp.fillna("None") + ":" + gl
+                df[sample] = freq.where(called, "0")
+                df['info_{0}'.format(i)] = info_field.where(called,
+                                                            ".:None:None")
+
+    # snpEff annotation e.g. EFF=effect(impact|type|codon|p.prot/c.cds|...
+    eff = info.str.extract(r"(?:^|;)EFF=([^;]*)", expand=False)
+    if eff.notnull().any():
+        annotation = eff.str.split(",").str[0].str.split("|", expand=True)
+        annotation = annotation.reindex(columns=range(6))
+        effect = annotation[0].str.split("(", n=1, expand=True)
+        effect = effect.reindex(columns=range(2))
+        effects = annotation[3].str.split("/")
+        valid = effects.str.len() == 2
+        prot_effect = effects.str[0].where(valid, "")
+        cds_effect = effects.str[-1].where(valid, annotation[3])
+        df['CDS_position'] = cds_effect.str[2:]
+        df['effect_type'] = effect[0]
+        df['codon_change'] = annotation[2]
+        df['gene_name'] = annotation[5]
+        df['mutation_type'] = annotation[1]
+        df['prot_effect'] = prot_effect.where(eff.notnull()).str[2:]
+        df['prot_size'] = annotation[4]
+        df['effect_impact'] = effect[1]
+    return df
+
+
+class _TableWriter(object):
+    """Write data frames by chunks in a CSV file (or Parquet file)"""
+    def __init__(self, filename, comment=None):
+        self.filename = filename
+        self.parquet = filename.endswith(".parquet")
+        self._writer = None
+        self._schema = None
+        if self.parquet:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                logger.error("pyarrow is required to save Parquet files")
+                raise
+        else:
+            self._writer = open(filename, "w")
+            if comment:
+                print(comment, file=self._writer)
+            self._header = True
+
+    def write(self, df):
+        if self.parquet:
+            # same types whatever the chunk: floats or strings
+            df = df.copy()
+            for name in df.columns:
+                if pd.api.types.is_numeric_dtype(df[name].dtype) and \
+                        df[name].notnull().any():
+                    df[name] = df[name].astype(float)
+                else:
+                    df[name] = df[name].astype(object).where(
+                        df[name].notnull(), None)
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+                self._writer = pq.ParquetWriter(self.filename, self._schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._schema,
+                                             preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self._writer, index=False, header=self._header)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
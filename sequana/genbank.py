@@ -19,6 +19,7 @@
 import re
 from sequana.annotations import Annotation
 from sequana.fasta import FastA
+from sequana.lazy import pandas as pd
 from sequana import logger
 logger.name = __name__
 
@@ -33,7 +34,15 @@ class GenBank(Annotation):
         gg = GenBank()
         gg.get_types()
 
+    Features can also be retrieved as a table and queried by position::
+
+        gg.get_table()
+        gg.get_overlaps("JB409847", 1000, 2000)
+
     """
+    _index_columns = ("seqid", "gene_start", "gene_end")
+    _qualifiers = ["gene", "locus_tag", "product", "note"]
+
     def __init__(self, filename):
         super(GenBank, self).__init__(filename)
 
@@ -87,6 +96,45 @@ class GenBank(Annotation):
                     output+= "{}\n".format(sequence[start:end])
         return output
 
+    def get_table(self, cache=False):
+        """Return features of all contigs as a DataFrame
+
+        :param cache: if True, the table is saved in a binary sidecar file next
+            to the GenBank (.sequana.npz extension) and reloaded from there
+            next time, unless the GenBank changed in the meantime. A filename
+            can also be provided.
+
+        Columns are *seqid*, *type*, *gene_start*, *gene_end*, *strand* and
+        the *gene*, *locus_tag*, *product* and *note* qualifiers (empty
+        strings if undefined).
+        """
+        if self._table is not None:
+            return self._table
+
+        if cache:
+            self._table = self._load_sidecar(cache)
+            if self._table is not None:
+                return self._table
+
+        columns = ["seqid", "type", "gene_start", "gene_end", "strand"]
+        columns += self._qualifiers
+        data = []
+        for contig, features in self.genbank_features_parser().items():
+            for feature in features:
+                data.append([contig, feature['type'], feature['gene_start'],
+                    feature['gene_end'], feature['strand']] +
+                    [feature.get(x, "") for x in self._qualifiers])
+        df = pd.DataFrame(data, columns=columns)
+        for name in ["seqid", "type", "strand"]:
+            df[name] = df[name].astype("category")
+        for name in ["gene_start", "gene_end"]:
+            df[name] = df[name].astype("int64")
+
+        self._table = df
+        if cache:
+            self._save_sidecar(cache, df)
+        return df
+
     def genbank_features_parser(self):
         """ Return dictionary with features contains inside a genbank file.
 
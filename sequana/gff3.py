@@ -16,11 +16,18 @@
 ##############################################################################
 import re
 import os
+import io
+import csv
 
 # from bioconvert/io/gff3 and adapted later on
 from sequana.annotations import Annotation
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
 from easydev import do_profile
 
+from sequana import logger
+logger.name = __name__
+
 __all__ = ["GFF3"]
 
 
@@ -31,8 +38,12 @@ class GFF3(Annotation):
     .. seealso:: https://github.com/The-Sequence-Ontology/Specifications/blob/master/gff3.md
 
     """
+    _columns = ["seqid", "source", "type", "start", "stop", "score",
+                "strand", "phase", "attributes"]
+
     def __init__(self, filename):
         super(GFF3, self).__init__(filename)
+        self._attributes = {}
 
     def get_types(self):
         """Extract unique GFF types
@@ -102,6 +113,99 @@ class GFF3(Annotation):
         df['ID'] = [get_attr(x, 'ID') for x in df['attributes']]
         return df
 
+    def get_table(self, cache=False):
+        """Return the annotation as a columnar DataFrame
+
+        :param cache: if True, the parsed table is saved in a binary sidecar
+            file next to the GFF (with the .sequana.npz extension) and
+            reloaded from there next time, unless the GFF changed in the
+            meantime. A filename can also be provided.
+
+        Compared to :meth:`get_df`, which builds a dictionary per line, this
+        method parses the file in one go: the *seqid*, *source*, *type* and
+        *strand* columns are categorical, *start* and *stop* are integers,
+        *score* and *phase* are floats (NaN if undefined). Attributes are kept
+        as raw strings and parsed on demand with :meth:`get_attribute`.
+
+        ::
+
+            gff = GFF3(filename)
+            df = gff.get_table(cache=True)
+            df['ID'] = gff.get_attribute("ID")
+
+        This is the method of choice for large GFF files (e.g. human
+        annotation).
+        """
+        if self._table is not None:
+            return self._table
+
+        if cache:
+            self._table = self._load_sidecar(cache)
+            if self._table is not None:
+                return self._table
+
+        # Only the 9-column lines are kept. The optional FASTA section
+        # at the end of the file is ignored
+        buffer = io.StringIO()
+        skipped = 0
+        with open(self.filename, "r") as reader:
+            for line in reader:
+                if line.startswith("#"):
+                    if line.startswith("##FASTA"):
+                        break
+                    continue
+                if not line.strip():
+                    continue
+                if line.count("\t") != 8:
+                    skipped += 1
+                    continue
+                buffer.write(line)
+        if skipped:
+            logger.warning("Skipped {} lines with incorrect number of "
+                           "fields".format(skipped))
+        buffer.seek(0)
+
+        df = pd.read_csv(buffer, sep="\t", header=None, names=self._columns,
+            quoting=csv.QUOTE_NONE, keep_default_na=False, na_values=["."],
+            dtype={"seqid": "category", "source": "category",
+                   "type": "category", "strand": "category",
+                   "start": np.int64, "stop": np.int64,
+                   "score": np.float64, "phase": np.float32,
+                   "attributes": str})
+        df["phase"] = df["phase"] % 3
+
+        # decoding is done on the categories only, not on each row
+        for name in ["seqid", "source", "type"]:
+            categories = [self.decode_small(str(x))
+                          for x in df[name].cat.categories]
+            if len(set(categories)) == len(categories):
+                df[name] = df[name].cat.rename_categories(categories)
+
+        self._table = df
+        if cache:
+            self._save_sidecar(cache, df)
+        return df
+
+    def get_attribute(self, name):
+        """Return the values of an attribute as a Series
+
+        :param str name: attribute tag (e.g., ID, Name, gene_id)
+
+        Values are extracted from the raw attributes of :meth:`get_table` with a
+        vectorised regular expression and decoded. Lines without this
+        attribute are set to None. Results are kept in memory so that a
+        second call is free.
+        """
+        if name not in self._attributes:
+            attributes = self.get_table()["attributes"]
+            pattern = r"(?:^|;)\s*{}[= ]([^;]*)".format(re.escape(name))
+            values = attributes.str.extract(pattern, expand=False)
+            values = values.str.strip().map(self.decode_complete,
+                na_action="ignore")
+            values = values.where(values.notnull(), None)
+            self._attributes[name] = values.rename(name)
+        return self._attributes[name]
+
     def _process_main_fields(self, fields):
         annotation = {}
 
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Inner distance of paired-end RNA-seq fragments
+
+The inner distance is the distance between the end of the first mate and the
+start of the second one. When both mates belong to the same transcript, only
+the exonic bases between the mates are counted (mRNA distance). This follows
+the RSeQC definition (used by :meth:`sequana.bamtools.SAMBAMbase.mRNA_inner_distance`)::
+
+    from sequana import sequana_data
+    from sequana.inner_distance import get_inner_distances
+    df = get_inner_distances(sequana_data("test_hg38_chr18.bam"),
+                             sequana_data("hg38_chr18.bed"))
+
+Mate coordinates are collected by batches and the exonic distances are
+computed with binary searches over the merged exons of each contig.
+"""
+import pysam
+
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana.bamtools import get_regions
+from sequana.bed import BED, merge_intervals
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["ExonIndex", "get_inner_distances", "get_inner_distance_histogram"]
+
+
+# number of pairs processed at once
+BATCH_SIZE = 100000
+
+
+class ExonIndex(object):
+    """Exons and transcripts of a 12-columns BED file indexed by contig
+
+    ::
+
+        from sequana import sequana_data
+        from sequana.inner_distance import ExonIndex
+        index = ExonIndex(sequana_data("hg38_chr18.bed"))
+        index.exonic_length("CHR18", [7567315], [7568000])
+
+    Exons are merged into sorted disjoint intervals together with the
+    cumulative exonic length before each interval, so that the number of
+    exonic bases of any interval is the difference of two binary searches.
+    Contig names are upper case. With *cache* set to True, the BED table is
+    saved in (and read from) a sidecar file (see
+    :meth:`sequana.bed.BED.get_table`).
+    """
+    def __init__(self, filename, cache=False):
+        bed = BED(filename)
+        bed.get_table(cache=cache)
+        # contigs are upper case; chr1 and CHR1 (if any) are gathered
+        exons = {}
+        for chrom, values in bed.get_sorted_exons().items():
+            exons.setdefault(chrom.upper(), []).append(values)
+        transcripts = {}
+        for chrom, values in bed.get_sorted_transcripts().items():
+            transcripts.setdefault(chrom.upper(), []).append(values[0:2])
+
+        self._exons = {}
+        for chrom, values in exons.items():
+            starts = np.concatenate([x[0] for x in values])
+            ends = np.concatenate([x[1] for x in values])
+            starts, ends = merge_intervals(starts, ends)
+            cumulated = np.concatenate([[0], np.cumsum(ends - starts)[:-1]])
+            self._exons[chrom] = (starts, ends, cumulated)
+
+        self._transcripts = {}
+        for chrom, values in transcripts.items():
+            starts = np.concatenate([x[0] for x in values])
+            ends = np.concatenate([x[1] for x in values])
+            order = np.argsort(starts, kind="mergesort")
+            # the longest reach of the transcripts starting before a position
+            self._transcripts[chrom] = (starts[order],
+                                        np.maximum.accumulate(ends[order]))
+
+    def _get_contigs(self):
+        return sorted(self._exons.keys())
+    contigs = property(_get_contigs, doc="list of indexed contigs")
+
+    def _exonic_before(self, chrom, positions):
+        # number of exonic bases before each position
+        starts, ends, cumulated = self._exons[chrom]
+        i = np.searchsorted(starts, positions, side="right") - 1
+        j = np.maximum(i, 0)
+        inside = np.clip(positions - starts[j], 0, ends[j] - starts[j])
+        return np.where(i >= 0, cumulated[j] + inside, 0)
+
+    def exonic_length(self, chrom, starts, ends):
+        """Return the number of exonic bases in the intervals [start, end)"""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if chrom not in self._exons:
+            return np.zeros(len(starts), dtype=np.int64)
+        return self._exonic_before(chrom, ends) - self._exonic_before(chrom, starts)
+
+    def same_transcript(self, chrom, positions1, positions2):
+        """Return True for pairs of positions within a same transcript"""
+        positions1 = np.asarray(positions1, dtype=np.int64)
+        positions2 = np.asarray(positions2, dtype=np.int64)
+        if chrom not in self._transcripts:
+            return np.zeros(len(positions1), dtype=bool)
+        starts, reach = self._transcripts[chrom]
+        first = np.minimum(positions1, positions2)
+        last = np.maximum(positions1, positions2)
+        # a transcript contains both positions if it starts before the first
+        # one and ends after the last one
+        i = np.searchsorted(starts, first, side="right") - 1
+        return (i >= 0) & (reach[np.maximum(i, 0)] > last)
+
+
+def _resolve(index, names, data):
+    # vectorised inner distances of a batch of pairs
+    chroms = np.array(data["chrom"], dtype=np.int64)
+    mates = np.array(data["mate_chrom"], dtype=np.int64)
+    read1_end = np.array(data["read1_end"], dtype=np.int64)
+    read2_start = np.array(data["read2_start"], dtype=np.int64)
+    overlap = np.array(data["overlap"], dtype=np.int64)
+
+    distances = np.where(read2_start >= read1_end, read2_start - read1_end,
+                         -overlap)
+    same_transcript = np.zeros(len(chroms), dtype=bool)
+    exonic = np.zeros(len(chroms), dtype=np.int64)
+    known = np.zeros(len(chroms), dtype=bool)
+    for tid in np.unique(chroms):
+        rows = chroms == tid
+        chrom = names[tid].upper()
+        same_transcript[rows] = index.same_transcript(chrom,
+            read1_end[rows] - 1, read2_start[rows])
+        known[rows] = chrom in index._exons
+        exonic[rows] = index.exonic_length(chrom, read1_end[rows],
+            np.maximum(read2_start[rows], read1_end[rows]))
+
+    descriptions = np.full(len(chroms), "sameChrom=No", dtype=object)
+    values = distances.astype(object)
+    values[chroms != mates] = "NA"
+    same = chroms == mates
+
+    rows = same & ~same_transcript
+    descriptions[rows] = "sameTranscript=No,dist=genomic"
+    rows = same & same_transcript & (distances <= 0)
+    descriptions[rows] = "readPairOverlap"
+    positive = same & same_transcript & (distances > 0)
+    rows = positive & ~known
+    descriptions[rows] = "unknownChromosome,dist=genomic"
+    rows = positive & known & (exonic == distances)
+    descriptions[rows] = "sameTranscript=Yes,sameExon=Yes,dist=mRNA"
+    rows = positive & known & (exonic > 0) & (exonic < distances)
+    descriptions[rows] = "sameTranscript=Yes,sameExon=No,dist=mRNA"
+    values[rows] = exonic[rows]
+    rows = positive & known & (exonic <= 0)
+    descriptions[rows] = "sameTranscript=Yes,nonExonic=Yes,dist=genomic"
+
+    return pd.DataFrame({"read_names": data["read_name"], "val": values,
+                         "desc": descriptions},
+                        columns=["read_names", "val", "desc"])
+
+
+def _collect(alignments, names, index, q_cut, sample_size, start=None, end=None):
+    # inner distances of the pairs of a list of alignments
+    keys = ("read_name", "chrom", "mate_chrom", "read1_end", "read2_start",
+            "overlap")
+    data = {key: [] for key in keys}
+    results = []
+    N = 0
+    for aln in alignments:
+        if sample_size is not None and N >= sample_size:
+            break
+        if aln.is_qcfail or aln.is_duplicate or aln.is_secondary or \
+                aln.is_unmapped or not aln.is_paired or aln.mate_is_unmapped \
+                or aln.mapping_quality < q_cut:
+            continue
+        read1_start = aln.reference_start
+        # reads fetched from a region may start before it
+        if start is not None and read1_start < start:
+            continue
+        if end is not None and read1_start >= end:
+            break
+        read2_start = aln.next_reference_start
+        # the mate is processed if it comes first (sorted BAM)
+        if read2_start < read1_start:
+            continue
+        if read2_start == read1_start and aln.is_read1:
+            continue
+        N += 1
+
+        # aligned length of the read and its introns (N operations)
+        introns = aln.get_cigar_stats()[0][3]
+        read1_end = read1_start + aln.query_alignment_length + introns
+        overlap = 0
+        if read2_start < read1_end:
+            # aligned bases of the read after the start of the mate
+            for block_start, block_end in aln.get_blocks():
+                overlap += max(0, min(block_end, read1_end) -
+                               max(block_start, read2_start))
+
+        data["read_name"].append(aln.query_name)
+        data["chrom"].append(aln.reference_id)
+        data["mate_chrom"].append(aln.next_reference_id)
+        data["read1_end"].append(read1_end)
+        data["read2_start"].append(read2_start)
+        data["overlap"].append(overlap)
+        if len(data["chrom"]) == BATCH_SIZE:
+            results.append(_resolve(index, names, data))
+            data = {key: [] for key in keys}
+
+    if data["chrom"]:
+        results.append(_resolve(index, names, data))
+    if results:
+        return pd.concat(results, ignore_index=True)
+    return pd.DataFrame(columns=["read_names", "val", "desc"])
+
+
+def _get_region_distances(args):
+    # used by the pool of processes of get_inner_distances
+    filename, index, region, q_cut, sample_size = args
+    with pysam.AlignmentFile(filename) as bam:
+        if region is None:
+            return _collect(bam, bam.references, index, q_cut, sample_size)
+        contig, start, end = region
+        return _collect(bam.fetch(contig, start, end), bam.references, index,
+                        q_cut, sample_size, start=start, end=end)
+
+
+def get_inner_distances(filename, refbed, sample_size=1000000, q_cut=30,
+                        jobs=1, n_regions=None, cache=False):
+    """Return the inner distance of read pairs of a BAM file
+
+    :param str filename: the BAM file (sorted by coordinates)
+    :param refbed: a 12-columns BED file or an :class:`ExonIndex`
+    :param int sample_size: maximum number of pairs to use (None for all
+        pairs)
+    :param int q_cut: ignore alignments with a mapping quality below q_cut
+    :param int jobs: number of regions processed at the same time. Requires
+        an indexed BAM file; otherwise pairs are read from the start of the
+        file.
+    :param int n_regions: number of regions of the genome processed
+        independently (defaults to 4 times *jobs*). *sample_size* is
+        then shared by the regions.
+    :param cache: use the sidecar file of the BED file (see
+        :class:`ExonIndex`)
+    :return: a dataframe with the read names, the inner distances (val) and
+        the description of the distance (desc), as in RSeQC.
+    """
+    if isinstance(refbed, ExonIndex):
+        index = refbed
+    else:
+        index = ExonIndex(refbed, cache=cache)
+
+    regions = None
+    if jobs > 1 or n_regions:
+        with pysam.AlignmentFile(filename) as bam:
+            if bam.has_index():
+                regions = get_regions(bam, n_regions or 4 * jobs)
+            else:
+                logger.warning("{} is not indexed. Reads are processed from "
+                               "the start of the file".format(filename))
+    if regions:
+        quota = None
+        if sample_size is not None:
+            quota = max(1, sample_size // max(1, len(regions)))
+        tasks = [(filename, index, region, q_cut, quota) for region in regions]
+    else:
+        tasks = [(filename, index, None, q_cut, sample_size)]
+
+    if jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(_get_region_distances, tasks))
+    else:
+        results = [_get_region_distances(task) for task in tasks]
+    return pd.concat(results, ignore_index=True)
+
+
+def get_inner_distance_histogram(df, low_bound=-250, up_bound=250, step=5):
+    """Return the histogram of the inner distances
+
+    :param df: a dataframe returned by :func:`get_inner_distances`
+    :return: counts and bin edges (as returned by :func:`numpy.histogram`)
+    """
+    values = pd.to_numeric(df["val"], errors="coerce").dropna().values
+    bins = np.arange(low_bound, up_bound + step, step)
+    return np.histogram(values, bins=bins)
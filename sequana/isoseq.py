@@ -194,10 +194,10 @@ class IsoSeqQC(object):
         bins is from 0 to 94 
         """
 
-        hq_qv = [pylab.mean([ord(X)-33 for X in read['quality'].decode()]) 
-                for read in self.hq_sequence]
-        lq_qv = [pylab.mean([ord(X) -33 for X in read['quality'].decode()]) 
-            for read in self.lq_sequence]
+        hq_qv = phred.QualityBatch([read['quality'] for read in
+                                    self.hq_sequence]).mean_qualities
+        lq_qv = phred.QualityBatch([read['quality'] for read in
+                                    self.lq_sequence]).mean_qualities
 
         if bins is None:
             bins = range(0,94)
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Offline store of KEGG gene sets
+
+The KEGG pathways of an organism are fetched once (from KEGG or from the JSON
+files exported by :meth:`~sequana.enrichment.KeggPathwayEnrichment.export_pathways_to_json`)
+and saved into a single binary file that can be loaded back without any
+network access.
+"""
+import os
+import glob
+import json
+
+from sequana.lazy import numpy as np
+from sequana.annotations import _pack_strings
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["KeggGeneSetStore"]
+
+
+def _unpack_strings(buffer, N):
+    if N == 0:
+        return []
+    return bytes(buffer).decode("utf-8").split("\x00")
+
+
+def _get_pathway_name(data):
+    name = data.get("NAME", "")
+    if isinstance(name, list):
+        name = name[0]
+    return name.split(" - ", 1)[0]
+
+
+def _get_gene_name(geneID, description):
+    # some pathways reports genes as a dictionary id:'gene name; description'
+    # ('.eg. eco') others reports genes as a dictionary id:'description'
+    if ";" in description:
+        return description.split(";")[0]
+    return geneID
+
+
+class KeggGeneSetStore(object):
+    """Compact and versioned store of the KEGG pathways of an organism
+
+    All gene identifiers are stored once (interned) and the membership of the
+    genes in the pathways is stored as two arrays (CSR layout): the genes of
+    the pathway *i* are indexed by ``indices[indptr[i]:indptr[i+1]]``. The
+    arrays are memory-mapped when the store is read back so that loading is
+    almost instantaneous and does not require any network access.
+
+    A store is built once, either from KEGG or from a directory of JSON files
+    exported with :meth:`~sequana.enrichment.KeggPathwayEnrichment.export_pathways_to_json`::
+
+        from sequana.kegg_store import KeggGeneSetStore
+        store = KeggGeneSetStore.from_json_directory("kegg_pathways/eco")
+        store.save("eco.kegg")
+
+    and read back later on::
+
+        store = KeggGeneSetStore("eco.kegg")
+        store.gene_sets["eco00010"]
+
+    The filename can also be provided to
+    :class:`~sequana.enrichment.KeggPathwayEnrichment` as the
+    **preload_directory** argument.
+
+    """
+    #: bump this number whenever the layout of the file changes
+    version = 1
+    _magic = b"SEQKEGG\x00"
+    _strings = ("pathway_ids", "pathway_names", "pathway_descriptions",
+                "pathway_classes", "pathway_go", "gene_ids", "gene_names",
+                "gene_descriptions")
+
+    def __init__(self, filename=None):
+        """.. rubric:: constructor
+
+        :param str filename: a store saved with :meth:`save`. If not provided,
+            an empty store is created.
+        """
+        self.filename = filename
+        self.organism = None
+        self.background = None
+        self.pathway_ids = []
+        self.pathway_names = []
+        self.pathway_descriptions = []
+        self.pathway_classes = []
+        self.pathway_go = []
+        self.gene_ids = []
+        self.gene_names = []
+        self.gene_descriptions = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self._gene_sets = None
+        self._pathways = None
+        if filename:
+            self._read(filename)
+
+    def __len__(self):
+        return len(self.pathway_ids)
+
+    def __repr__(self):
+        return "KeggGeneSetStore ({}): {} pathways, {} genes".format(
+            self.organism, len(self), len(self.gene_ids))
+
+    @classmethod
+    def from_pathways(cls, pathways, organism=None, background=None):
+        """Build a store from a dictionary of KEGG pathways
+
+        :param dict pathways: keys are pathway identifiers (e.g., eco00010)
+            and values are the KEGG entries as returned by the parser of
+            bioservices (or the JSON files exported by sequana).
+        :param str organism: the KEGG organism code (e.g., eco)
+        :param int background: number of genes of the organism
+        """
+        store = cls()
+        store.organism = organism
+        store.background = background
+
+        gene_index = {}
+        indptr = [0]
+        indices = []
+        for ID in sorted(pathways):
+            data = pathways[ID]
+            store.pathway_ids.append(ID)
+            store.pathway_names.append(_get_pathway_name(data))
+            description = data.get("DESCRIPTION", "")
+            if isinstance(description, list):
+                description = " ".join(description)
+            store.pathway_descriptions.append(description)
+            store.pathway_classes.append(data.get("CLASS", ""))
+            dblinks = data.get("DBLINKS", None)
+            if isinstance(dblinks, dict) and "GO" in dblinks:
+                store.pathway_go.append(dblinks["GO"])
+            else:
+                store.pathway_go.append("")
+
+            for geneID, description in data.get("GENE", {}).items():
+                if geneID not in gene_index:
+                    gene_index[geneID] = len(store.gene_ids)
+                    store.gene_ids.append(geneID)
+                    store.gene_names.append(_get_gene_name(geneID, description))
+                    store.gene_descriptions.append(description)
+                indices.append(gene_index[geneID])
+            indptr.append(len(indices))
+
+        store.indptr = np.array(indptr, dtype=np.int64)
+        store.indices = np.array(indices, dtype=np.int32)
+        return store
+
+    @classmethod
+    def from_json_directory(cls, directory, organism=None, background=None):
+        """Build a store from the JSON files of a directory
+
+        :param str directory: a directory with one JSON file per pathway as
+            created by :meth:`~sequana.enrichment.KeggPathwayEnrichment.export_pathways_to_json`
+        :param str organism: the KEGG organism code. Defaults to the name of
+            the directory.
+        :param int background: number of genes of the organism
+        """
+        pathways = {}
+        for name in glob.glob(os.path.join(directory, "*.json")):
+            key = os.path.basename(name)[:-len(".json")]
+            with open(name, "r") as fin:
+                pathways[key] = json.load(fin)
+        if organism is None:
+            organism = os.path.basename(os.path.normpath(directory))
+        return cls.from_pathways(pathways, organism=organism,
+                                 background=background)
+
+    @classmethod
+    def from_kegg(cls, organism, progress=True):  # pragma: no cover
+        """Build a store fetching all pathways of an organism from KEGG
+
+        The background (number of genes of the organism) is also stored so
+        that the store can be used without network access later on.
+        """
+        from bioservices import KEGG
+        from easydev import Progress
+
+        kegg = KEGG(cache=True)
+        kegg.organism = organism
+        background = len(kegg.list(organism).split("\n"))
+
+        logger.info("loading all pathways from KEGG. may take time the first time")
+        pathways = {}
+        pb = Progress(len(kegg.pathwayIds))
+        for i, ID in enumerate(kegg.pathwayIds):
+            pathways[ID.replace("path:", "")] = kegg.parse(kegg.get(ID))
+            if progress:
+                pb.animate(i + 1)
+        return cls.from_pathways(pathways, organism=organism,
+                                 background=background)
+
+    def save(self, filename):
+        """Save the store into a single binary file
+
+        The file starts with a small JSON header (version, organism,
+        background and location of the arrays) followed by the raw arrays,
+        each aligned on 8 bytes so that they can be memory-mapped.
+        """
+        arrays = {name: _pack_strings(getattr(self, name))
+                  for name in self._strings}
+        # copy the arrays since they may be mapped on the file to overwrite
+        arrays["indptr"] = np.array(self.indptr, dtype=np.int64)
+        arrays["indices"] = np.array(self.indices, dtype=np.int32)
+
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            layout[name] = [array.dtype.str, len(array), offset]
+            offset += array.nbytes + (-array.nbytes % 8)
+
+        header = {
+            "version": self.version,
+            "organism": self.organism,
+            "background": self.background,
+            "counts": {name: len(getattr(self, name)) for name in self._strings},
+            "arrays": layout,
+        }
+        header = json.dumps(header).encode("utf-8")
+        header += b" " * (-(len(header) + 16) % 8)
+
+        with open(filename, "wb") as fout:
+            fout.write(self._magic)
+            fout.write(np.array([len(header)], dtype="<u8").tobytes())
+            fout.write(header)
+            for array in arrays.values():
+                fout.write(array.tobytes())
+                fout.write(b"\x00" * (-array.nbytes % 8))
+        self.filename = filename
+
+    def _read(self, filename):
+        with open(filename, "rb") as fin:
+            if fin.read(8) != self._magic:
+                raise ValueError("{} is not a KEGG gene set store".format(filename))
+            size = int(np.frombuffer(fin.read(8), dtype="<u8")[0])
+            header = json.loads(fin.read(size).decode("utf-8"))
+
+        if header["version"] != self.version:
+            raise ValueError("{} was created with version {} of the store "
+                "(expected {}). Please build it again".format(
+                filename, header["version"], self.version))
+
+        self.organism = header["organism"]
+        self.background = header["background"]
+        start = 16 + size
+        data = {}
+        for name, (dtype, N, offset) in header["arrays"].items():
+            if N == 0:
+                data[name] = np.zeros(0, dtype=dtype)
+            else:
+                data[name] = np.memmap(filename, dtype=dtype, mode="r",
+                                       offset=start + offset, shape=(N,))
+        for name in self._strings:
+            setattr(self, name, _unpack_strings(data[name],
+                                                header["counts"][name]))
+        self.indptr = data["indptr"]
+        self.indices = data["indices"]
+
+    def get_gene_indices(self, pathway_id):
+        """Return the indices of the genes of a pathway"""
+        i = self.pathway_ids.index(pathway_id)
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def _get_gene_sets(self):
+        if self._gene_sets is None:
+            names = np.array(self.gene_names, dtype=object)
+            self._gene_sets = {}
+            for i, ID in enumerate(self.pathway_ids):
+                start, end = self.indptr[i], self.indptr[i + 1]
+                if end > start:
+                    self._gene_sets[ID] = list(names[self.indices[start:end]])
+        return self._gene_sets
+    gene_sets = property(_get_gene_sets,
+        doc="dictionary of gene names for each pathway (pathways without genes are skipped)")
+
+    def _get_pathways(self):
+        if self._pathways is None:
+            self._pathways = {}
+            for i, ID in enumerate(self.pathway_ids):
+                data = {
+                    "NAME": self.pathway_names[i],
+                    "DESCRIPTION": self.pathway_descriptions[i],
+                    "CLASS": self.pathway_classes[i],
+                }
+                if self.pathway_go[i]:
+                    data["DBLINKS"] = {"GO": self.pathway_go[i]}
+                start, end = self.indptr[i], self.indptr[i + 1]
+                if end > start:
+                    data["GENE"] = {self.gene_ids[j]: self.gene_descriptions[j]
+                                    for j in self.indices[start:end]}
+                self._pathways[ID] = data
+        return self._pathways
+    pathways = property(_get_pathways,
+        doc="dictionary of pathways in the format of the KEGG parser (NAME, GENE, ...)")
+
+    def find_pathways(self, gene_ids):
+        """Return the pathways containing at least one of the KEGG gene ids"""
+        if isinstance(gene_ids, str):
+            gene_ids = [gene_ids]
+        wanted = set(gene_ids)
+        selection = np.array([x in wanted for x in self.gene_ids], dtype=bool)
+        if len(selection) == 0:
+            return []
+        hits = selection[self.indices]
+        # index of the pathway of each membership entry
+        owners = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        return [self.pathway_ids[i] for i in np.unique(owners[hits])]
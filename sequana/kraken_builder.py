@@ -30,12 +30,116 @@ from sequana.databases import ENADownload
 from easydev import execute, TempFile, Progress, md5, DevTools
 
 from sequana import sequana_config_path
+from sequana.lazy import numpy as np
 from sequana.lazy import pandas as pd
 from sequana import logger
 logger.name = __name__
 
 
-__all__ = ["KrakenBuilder"]
+__all__ = ["KrakenBuilder", "TaxonIndex"]
+
+
+class TaxonIndex(object):
+    """Sorted index of the NCBI GI (or accession) to taxon mapping
+
+    The NCBI mapping files (gi_taxid_nucl.dmp or nucl_gb.accession2taxid) are
+    large text files. They are converted once for all into two binary files
+    stored next to them (sorted keys and taxons) that are memory-mapped, so
+    that millions of identifiers are resolved with a binary search without
+    loading or parsing the text file again::
+
+        from sequana.kraken_builder import TaxonIndex
+        index = TaxonIndex("virusdb/taxonomy/gi_taxid_nucl.dmp")
+        taxons = index.get_taxons([9626243, 9629357])
+
+    The index is rebuilt if the mapping file is more recent than the index.
+    Files with the *accession2taxid* extension are indexed by accession
+    (with version) and other files by GI number (first column).
+
+    """
+    #: taxon returned for unknown identifiers (unidentified)
+    unknown = 32644
+
+    def __init__(self, filename, chunksize=10000000, width=24):
+        """.. rubric:: constructor
+
+        :param str filename: the gi_taxid_nucl.dmp or accession2taxid file
+        :param int chunksize: number of rows read at once to build the index
+        :param int width: maximum length of the accessions
+        """
+        self.filename = filename
+        self.chunksize = chunksize
+        self.accession = filename.replace(".gz", "").endswith("accession2taxid")
+        self.dtype = "S{}".format(width) if self.accession else np.int64
+        self.keys_filename = filename + ".keys.npy"
+        self.taxons_filename = filename + ".taxons.npy"
+        if self._is_valid() is False:
+            self.build()
+        self.keys = np.load(self.keys_filename, mmap_mode="r")
+        self.taxons = np.load(self.taxons_filename, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _is_valid(self):
+        mtime = os.path.getmtime(self.filename)
+        for filename in (self.keys_filename, self.taxons_filename):
+            if os.path.exists(filename) is False or \
+                    os.path.getmtime(filename) < mtime:
+                return False
+        return True
+
+    def _read_chunks(self):
+        if self.accession:
+            # accession, accession.version, taxid, gi
+            return pd.read_csv(self.filename, sep="\t", usecols=[1, 2],
+                dtype={1: str, 2: np.int32}, header=0, names=[0, 1, 2, 3],
+                chunksize=self.chunksize)
+        return pd.read_csv(self.filename, sep="\t", header=None,
+            names=[1, 2], dtype={1: np.int64, 2: np.int32},
+            chunksize=self.chunksize)
+
+    def build(self):
+        """Convert the mapping file into the sorted binary index"""
+        logger.info("Indexing {}".format(self.filename))
+        keys, taxons = [], []
+        for chunk in self._read_chunks():
+            keys.append(chunk[1].values.astype(self.dtype))
+            taxons.append(chunk[2].values.astype(np.int32))
+        keys = np.concatenate(keys) if keys else np.zeros(0, self.dtype)
+        taxons = np.concatenate(taxons) if taxons else np.zeros(0, np.int32)
+        # the GI file is already sorted; no need to sort it again
+        if len(keys) and np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind="mergesort")
+            keys, taxons = keys[order], taxons[order]
+        # written in a temporary file first so that an interrupted build is
+        # not used later
+        for filename, values in ((self.taxons_filename, taxons),
+                                 (self.keys_filename, keys)):
+            with open(filename + ".tmp", "wb") as fout:
+                np.save(fout, values)
+            os.rename(filename + ".tmp", filename)
+
+    def get_taxons(self, identifiers):
+        """Return the taxons of a list of GI numbers (or accessions)
+
+        Unknown identifiers get the taxon :attr:`unknown`.
+        """
+        identifiers = np.asarray(identifiers).astype(self.dtype)
+        taxons = np.full(len(identifiers), self.unknown, dtype=np.int64)
+        if len(self.keys) == 0:
+            return taxons
+        positions = np.searchsorted(self.keys, identifiers)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = self.keys[positions] == identifiers
+        taxons[found] = self.taxons[positions[found]]
+        return taxons
+
+
+def _read_header(filename):
+    # first line of a FASTA file (used in a pool of threads)
+    with open(filename, "r") as fin:
+        return fin.readline()
 
 
 class KrakenBuilderBase():
@@ -500,7 +604,12 @@ kraken2-build --clean --db kraken2_test
         cmd = "kraken-build --clean --db %s" % self.params['dbname']
         execute(cmd)
 
-    def get_gis(self, extensions=['fa']):
+    def get_gis(self, extensions=['fa'], threads=8):
+        """Return the GI numbers of the FASTA files of the library
+
+        Headers of the files are read in a pool of *threads* threads.
+        """
+        from concurrent.futures import ThreadPoolExecutor
         self.filenames = []
         root = self.dbname
         for extension in extensions:
@@ -510,20 +619,17 @@ kraken2-build --clean --db kraken2_test
             self.filenames.extend( list(glob.iglob("%s/library/**/**/*%s" %
                 (root, extension))))
 
-        N = len(self.filenames)
-        pb = Progress(N)
+        with ThreadPoolExecutor(max(1, threads)) as executor:
+            headers = list(executor.map(_read_header, self.filenames))
+
         gis = []
-        for i, filename in enumerate(self.filenames):
-            data = open(filename, "r")
-            line = data.readline()
+        for filename, line in zip(self.filenames, headers):
             if line.startswith('>'):
                 assert "gi" in line, "expected >gi to be found at the beginning"
                 gi = line[1:].split("|")[1]
             else:
                 raise ValueError("This file %s does not seem to be a FASTA file" % filename)
             gis.append(gi)
-            pb.animate(i+1)
-        print()
         gis = [int(x) for x in gis]
         self.gis = gis
 
@@ -531,46 +637,19 @@ kraken2-build --clean --db kraken2_test
         return gis
 
     def get_taxons_from_gis(self, gis, filename="gi_taxid_nucl.dmp"):
-        filename = self.taxon_path + os.sep + filename
-        data = pd.read_csv(filename, chunksize=1000000, sep='\t',
-            header=None)
-        N = 560  # with time this number will be deprecated but good for now
-
-        local_gis = gis[:]
-
-        # We will found GI an order than different from the input gis list so
-        # we will need to keep track of the order
-        found_gis = []
-        taxons = [32644] * len(gis)   # 32644 means unidentified
-        # we search for the unique gis. Once found, we remove them from the
-        # vector and keep going until the vector is empty or there is no more
-        # chunks. A good sanity check is that the final gis vector should be
-        # empty meaning all have been found. We do not care about the order
-        # of the final taxons vector as compare to the GI vector
+        """Return the taxons of a list of GI numbers (same order)
 
+        The mapping file is converted once into a :class:`TaxonIndex`. GI
+        numbers that are not found get the taxon 32644 (unidentified).
+        """
+        filename = self.taxon_path + os.sep + filename
         print("Scanning %s to look for %s GI numbers" % (filename, len(gis)))
-        pb = Progress(N)
-        for i, chunk in enumerate(data):
-            chunk.set_index(0, inplace=True)
-            chunk = chunk.loc[local_gis].dropna()
-
-            # keep the GI and Taxon
-            found_gis.extend([int(x) for x in list(chunk.index)])
-            
-            # update the remaining GIs and the taxons
-            for gi, tax in zip(chunk.index, chunk.values):
-                local_gis.remove(gi)
-                index = gis.index(gi)
-                taxons[index] = tax
-
-            # no need to carry on if all GIs were found
-            if len(local_gis) == 0:
-                break
-            pb.animate(i+1)
-        print("")
-
-        taxons = [int(x) for x in taxons]
-        return taxons
+        index = TaxonIndex(filename)
+        taxons = index.get_taxons(gis)
+        N = (taxons == index.unknown).sum()
+        if N:
+            logger.warning("%s GI numbers not found in %s" % (N, filename))
+        return [int(x) for x in taxons]
 
 
 class NCBITaxonReader(object):
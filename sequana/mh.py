@@ -17,7 +17,6 @@
 
 
 
-from random import uniform, gauss
 from sequana.lazy import numpy as np
 from sequana.lazy import pylab
 
@@ -29,7 +28,7 @@ __all__ = ["MetropolisHasting"]
 
 
 class MetropolisHasting():
-    """
+    """Sample a distribution given as a profile with Metropolis-Hastings
 
     .. plot::
 
@@ -40,9 +39,15 @@ class MetropolisHasting():
             0.086,  0.092,  0.097,  0.103]
         m.Ytarget = [83, 315,  611, 675, 1497, 5099, 7492, 2797, 842, 334, 
             117, 63, 33, 22, 11, 3, 3, 1,  0,  2]
-        vec = m.simulate(100000)
+        vec = m.simulate(100000, seed=1)
         m.check(bins=100)
 
+    Many independent chains are run at the same time as numpy arrays (see
+    :meth:`simulate`). Gaussian proposals falling outside of the boundaries
+    are reflected into them so that the proposal stays symmetric. The number
+    of proposed and accepted moves are stored in :attr:`proposed` and
+    :attr:`accepted`, and the histogram of the acceptance probabilities in
+    :attr:`aprob_histogram`.
 
     .. warning: be aware of border effects. For instance if the profile does
         not go to zero at the lower bound or upper_bound, then the final
@@ -52,12 +57,20 @@ class MetropolisHasting():
         manually. 
 
     """
+    #: number of bins of the acceptance probabilities histogram
+    aprob_bins = 50
+
     def __init__(self):
         self.burning = 20000
         self.lower_bound = 0000
         self.upper_bound = 100000
-        self.aprob = []
         self._Xtarget = None
+        self._reset_statistics()
+
+    def _reset_statistics(self):
+        self.proposed = 0
+        self.accepted = 0
+        self.aprob_histogram = np.zeros(self.aprob_bins, dtype=np.int64)
 
     def _set_x(self, X):
         self._Xtarget = np.array(X)
@@ -73,59 +86,92 @@ class MetropolisHasting():
         return self._Ytarget
     Ytarget = property(_get_y, _set_y)
 
-    def simulate(self, n=100000, burning=20000, step=None, x0=None):
-        if step is None:
-            self.step = (self.upper_bound - self.lower_bound) / 100.
-            step = self.step
+    def _get_acceptance_rate(self):
+        return self.accepted / max(1, self.proposed)
+    acceptance_rate = property(_get_acceptance_rate,
+        doc="fraction of the proposed moves that were accepted")
 
-        if x0 is None:
-            self.x0 = (self.upper_bound - self.lower_bound) / 2 + self.lower_bound
-
-        self.aprob = []
-
-        # function target profile
+    def _target(self, x):
         NS = self.Ytarget / sum(self.Ytarget)
-        sdnorm = lambda x: np.interp(x, self.Xtarget, NS)
-
-        x = self.x0
-
-        vec = [x] # starting seed
-
-        # a gaussian jump centered on 0 is used as a random inovation 
-        # if the candidate is outside of the boundaries, we try another 
-        # candidate
-        def jumper(x):
-            #jump = uniform(-step, step)
-            jump = gauss(0, step)
-            xprime = x + jump
-            while xprime < self.lower_bound or xprime>self.upper_bound:
-                jump = gauss(0, step)
-                xprime = x + jump
-            return xprime
-
-        for i in range(1, n*2+burning):
-            xprime = jumper(x)
-
-            aprob = min([1., sdnorm(xprime)/sdnorm(x)]) #acceptance probability
-            u = uniform(0, 1)
-            if u < aprob:
-                x = xprime
-                vec.append(x)
-            self.aprob.append(aprob)
-
-            if len(vec) == n + burning:
-                break
-        self.burning_vector = vec[0:burning]
-        self.vec = vec[burning:]
-
-        return vec[burning:]
+        return np.interp(x, self.Xtarget, NS)
+
+    def _reflect(self, x):
+        # fold values into [lower_bound, upper_bound] (mirror on the bounds)
+        width = self.upper_bound - self.lower_bound
+        if width <= 0:
+            return np.full_like(x, self.lower_bound)
+        y = np.mod(x - self.lower_bound, 2 * width)
+        return self.lower_bound + np.where(y > width, 2 * width - y, y)
+
+    def _initial_states(self, rng, chains, x0):
+        if x0 is not None:
+            return np.full(chains, float(x0))
+        # chains start at random positions drawn from the target profile
+        weights = self.Ytarget / sum(self.Ytarget)
+        positions = rng.choice(len(self.Xtarget), size=chains, p=weights)
+        return self._reflect(self.Xtarget[positions] +
+                             rng.normal(0, self.step, chains))
+
+    def simulate(self, n=100000, burning=20000, step=None, x0=None,
+                 chains=1000, seed=None):
+        """Return n samples of the target distribution
+
+        :param int n: number of samples
+        :param int burning: number of initial moves discarded (shared by the
+            chains)
+        :param float step: standard deviation of the gaussian proposals
+            (defaults to 1% of the range)
+        :param float x0: starting point of all chains. By default, chains
+            start at random positions drawn from the target profile.
+        :param int chains: number of independent chains run at the same time
+        :param int seed: seed of the random generator
+        :return: numpy array of samples (the samples of each chain are
+            consecutive)
+        """
+        if step is None:
+            step = (self.upper_bound - self.lower_bound) / 100.
+        self.step = step
+        self.x0 = x0
+        rng = np.random.default_rng(seed)
+        self._reset_statistics()
+
+        chains = max(1, min(chains, n))
+        # number of moves per chain
+        nburn = -(-burning // chains)
+        nsteps = -(-n // chains)
+
+        x = self._initial_states(rng, chains, x0)
+        px = self._target(x)
+        samples = np.empty((nburn + nsteps, chains))
+        for i in range(nburn + nsteps):
+            xprime = self._reflect(x + rng.normal(0, step, chains))
+            pxprime = self._target(xprime)
+            # acceptance probability
+            with np.errstate(divide="ignore", invalid="ignore"):
+                aprob = np.where(px > 0, np.minimum(1., pxprime / px), 1.)
+            accept = rng.random(chains) < aprob
+            x = np.where(accept, xprime, x)
+            px = np.where(accept, pxprime, px)
+            samples[i] = x
+
+            self.proposed += chains
+            self.accepted += int(accept.sum())
+            indices = np.minimum((aprob * self.aprob_bins).astype(int),
+                                 self.aprob_bins - 1)
+            self.aprob_histogram += np.bincount(indices, minlength=self.aprob_bins)
+
+        self.burning_vector = samples[:nburn].T.ravel()
+        self.vec = samples[nburn:].T.ravel()[:n]
+        return self.vec
 
     def diagnostics(self, bins=60, clear=True):
         if clear: pylab.clf()
 
         pylab.subplot(3,1,1)
-        pylab.hist(self.aprob, bins=bins)
-        pylab.title("Acceptation")
+        edges = np.linspace(0, 1, self.aprob_bins + 1)
+        pylab.bar(edges[:-1], self.aprob_histogram, width=1. / self.aprob_bins,
+            align="edge")
+        pylab.title("Acceptation ({:.1%})".format(self.acceptance_rate))
 
         pylab.subplot(3,1,2)
         pylab.plot(self.vec)
@@ -76,7 +76,8 @@ quality += r"""QRSTUVWXYZ[\]^_`abcdefghijklmnopqrstuvwxyz{|}~"""
 from math import log10
 
 
-__all__ = ['Quality', "proba_to_quality_sanger", "quality_to_proba_sanger"]
+__all__ = ['Quality', "QualityBatch", "proba_to_quality_sanger",
+           "quality_to_proba_sanger"]
 
 
 def proba_to_quality_sanger(pe):
@@ -218,19 +219,171 @@ class QualitySolexa(Quality):
         super(QualitySolexa, self).__init__(seq, offset=64)
 
 
+class QualityBatch(object):
+    """Phred qualities of a batch of reads decoded at once
 
+    Quality strings of all reads are decoded in a single vectorised step and
+    stored as a ragged array: a flat array of uint8 values (:attr:`values`)
+    and the offsets of the reads in that array (:attr:`indptr`), the
+    qualities of read *i* being ``values[indptr[i]:indptr[i+1]]``.
 
+    ::
 
+        from sequana.phred import QualityBatch
+        batch = QualityBatch(["IIIII", "II#"])
+        batch.mean_qualities
+        batch.mean_error_probabilities
+        batch.get_position_quantiles()
 
+    Qualities can be provided as strings (or bytes) encoded with an *offset*
+    (33 for Sanger) or as arrays of already decoded values such as the
+    *query_qualities* of pysam alignments (the offset is then ignored). A
+    buffer of quality strings separated by new lines can be decoded with
+    :meth:`from_buffer`.
 
+    """
+    #: qualities are clipped to this maximum value (Sanger scale)
+    max_quality = 93
 
+    def __init__(self, qualities, offset=33):
+        """.. rubric:: constructor
 
+        :param qualities: list of quality strings, bytes or arrays of decoded
+            values.
+        :param int offset: offset of the encoded qualities
+        """
+        self.offset = offset
+        lengths = np.array([len(x) for x in qualities], dtype=np.int64)
+        if len(qualities) and isinstance(qualities[0], (str, bytes)):
+            if isinstance(qualities[0], str):
+                buffer = "".join(qualities).encode("ascii")
+            else:
+                buffer = b"".join(qualities)
+            values = self._decode(np.frombuffer(buffer, dtype=np.uint8))
+        elif len(qualities):
+            values = np.concatenate([np.asarray(x, dtype=np.uint8)
+                                     for x in qualities])
+        else:
+            values = np.zeros(0, dtype=np.uint8)
+        self._set(values, lengths)
+
+    def _decode(self, codes):
+        return (codes - np.uint8(self.offset)).astype(np.uint8)
+
+    def _set(self, values, lengths):
+        self.values = values
+        self.lengths = lengths
+        self.indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+
+    @classmethod
+    def from_buffer(cls, buffer, offset=33):
+        """Decode a buffer of quality strings separated by new lines
+
+        :param bytes buffer: e.g. b"IIII\\nII#\\n"
+        """
+        batch = cls([], offset=offset)
+        codes = np.frombuffer(buffer, dtype=np.uint8)
+        newlines = np.flatnonzero(codes == ord("\n"))
+        if len(codes) and codes[-1] != ord("\n"):
+            newlines = np.append(newlines, len(codes))
+        starts = np.concatenate([[0], newlines[:-1] + 1])
+        keep = np.ones(len(codes), dtype=bool)
+        keep[newlines[newlines < len(codes)]] = False
+        batch._set(batch._decode(codes[keep]), newlines - starts)
+        return batch
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        return self.values[self.indptr[i]:self.indptr[i + 1]]
+
+    def _sum_per_read(self, values):
+        # sum of the values of each read (reads may be empty)
+        sums = np.zeros(len(self), dtype=np.float64)
+        nonempty = self.lengths > 0
+        if nonempty.any():
+            sums[nonempty] = np.add.reduceat(values, self.indptr[:-1][nonempty],
+                                             dtype=np.float64)
+        return sums
+
+    def _get_mean_qualities(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sum_per_read(self.values) / self.lengths
+    mean_qualities = property(_get_mean_qualities,
+        doc="mean quality of each read (NaN for empty reads)")
+
+    def _get_mean_error_probabilities(self):
+        # lookup table of the error probability of each quality
+        table = 10 ** (np.arange(256) / -10.)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sum_per_read(table[self.values]) / self.lengths
+    mean_error_probabilities = property(_get_mean_error_probabilities,
+        doc="mean error probability of each read (NaN for empty reads)")
 
-
-
-
-
-
-
-
-
+    def _get_mean_quality(self):
+        if len(self.values) == 0:
+            return np.nan
+        return self.values.mean()
+    mean_quality = property(_get_mean_quality, doc="mean quality of all bases")
+
+    def _get_positions(self):
+        # position of each value in its read
+        return np.arange(len(self.values)) - np.repeat(self.indptr[:-1], self.lengths)
+
+    def to_matrix(self, fill_value=255):
+        """Return qualities as a matrix (reads x positions)
+
+        Reads shorter than the longest one are padded with *fill_value*.
+        """
+        L = int(self.lengths.max()) if len(self) else 0
+        matrix = np.full((len(self), L), fill_value, dtype=np.uint8)
+        matrix[np.arange(L) < self.lengths[:, None]] = self.values
+        return matrix
+
+    def to_list(self):
+        """Return qualities as a list of arrays (one per read)"""
+        return np.split(self.values, self.indptr[1:-1])
+
+    def get_histogram(self):
+        """Return the number of bases for each quality (0 to 93)"""
+        values = np.minimum(self.values, self.max_quality)
+        return np.bincount(values, minlength=self.max_quality + 1)
+
+    def get_position_histogram(self):
+        """Return the number of bases for each position and quality
+
+        :return: a matrix with one row per position in the reads and one
+            column per quality (0 to 93).
+        """
+        Q = self.max_quality + 1
+        L = int(self.lengths.max()) if len(self) else 0
+        values = np.minimum(self.values, self.max_quality).astype(np.int64)
+        counts = np.bincount(self._get_positions() * Q + values,
+                             minlength=L * Q)
+        return counts.reshape(L, Q)
+
+    def get_position_quantiles(self, quantiles=(0.1, 0.25, 0.5, 0.75, 0.9),
+                               histogram=None):
+        """Return the quantiles of the qualities at each position
+
+        Quantiles are computed from :meth:`get_position_histogram`, which can
+        be provided (e.g. the sum of the histograms of several batches).
+
+        :return: a dataframe with one row per position and one column per
+            quantile (NaN if no read covers a position).
+        """
+        from sequana.lazy import pandas as pd
+        if histogram is None:
+            histogram = self.get_position_histogram()
+        cumulated = np.cumsum(histogram, axis=1)
+        totals = cumulated[:, -1]
+        data = {}
+        for quantile in quantiles:
+            # first quality whose cumulated count reaches the quantile
+            found = cumulated >= np.maximum(quantile * totals, 1)[:, None]
+            values = np.argmax(found, axis=1).astype(float)
+            values[totals == 0] = np.nan
+            data[quantile] = values
+        return pd.DataFrame(data, columns=list(quantiles))
@@ -14,59 +14,181 @@
 #  documentation: http://sequana.readthedocs.io
 #
 ##############################################################################
+"""Conversion of Salmon quantification files into feature counts
 
-import pandas as pd
+::
+
+    from sequana.salmon import Salmon, get_counts_matrix
+    s = Salmon("sample1/quant.sf")
+    s.save_feature_counts("sample1.feature_counts", "genome.gff")
+
+    # all samples of a project in a single matrix (see RNADiffAnalysis)
+    df = get_counts_matrix(["sample1/quant.sf", "sample2/quant.sf"],
+                           "genome.gff", jobs=2)
+    df.to_csv("counts.tsv", sep="\t")
+
+"""
+import os
+
+from sequana.lazy import pandas as pd
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["Salmon", "get_counts_matrix"]
+
+
+# columns of the feature counts files
+COLUMNS = ["Geneid", "Chr", "Start", "End", "Strand", "Length"]
+
+
+def get_gene_annotation(gff, attribute="ID"):
+    """Return the genes of a GFF file indexed by an attribute
+
+    Genes that share the same attribute value (e.g., genes on several loci)
+    are merged: their chromosomes, starts, stops and strands are joined with
+    semi-colons (as in featureCounts) and their lengths are added.
+
+    :param gff: a GFF filename or a :class:`~sequana.gff3.GFF3` instance
+    :return: a dataframe indexed by the attribute with the Chr, Start, End,
+        Strand and Length columns
+    """
+    from sequana.gff3 import GFF3
+    if isinstance(gff, GFF3) is False:
+        gff = GFF3(gff)
+    df = gff.get_table()
+    df = pd.DataFrame({"Geneid": gff.get_attribute(attribute).values,
+        "Chr": df["seqid"].astype(str).values, "Start": df["start"].values,
+        "End": df["stop"].values, "Strand": df["strand"].astype(str).values,
+        "type": df["type"].astype(str).values})
+    df = df[(df["type"] == "gene").values & df["Geneid"].notnull().values]
+    df = df.drop(columns="type")
+    df["Length"] = df["End"] - df["Start"] + 1
+
+    duplicated = df["Geneid"].duplicated(keep=False)
+    unique = df[~duplicated].set_index("Geneid")
+    unique = unique.astype({"Start": str, "End": str})
+    if duplicated.any():
+        join = lambda x: ";".join(str(y) for y in x)
+        merged = df[duplicated].groupby("Geneid", sort=False).agg({
+            "Chr": join, "Start": join, "End": join, "Strand": join,
+            "Length": "sum"})
+        unique = pd.concat([unique, merged])
+    return unique[COLUMNS[1:]]
+
+
+def read_quant(filename):
+    """Return the Name, Length and NumReads columns of a Salmon quant file"""
+    return pd.read_csv(filename, sep="\t", usecols=["Name", "Length",
+        "NumReads"], dtype={"Name": str})
+
+
+def _get_sample_name(filename):
+    # sample/quant.sf is named after its directory
+    if os.path.basename(filename) in ("quant.sf", "quant.genes.sf"):
+        return os.path.basename(os.path.dirname(os.path.abspath(filename)))
+    return os.path.basename(filename).split(".")[0]
+
+
+def _get_counts(quant, annotation, tolerance=5):
+    # NumReads of the annotated features of a quant dataframe (same order)
+    quant = quant.drop_duplicates("Name").set_index("Name")
+    quant = quant.loc[quant.index.intersection(annotation.index)]
+    lengths = annotation.loc[quant.index, "Length"]
+    wrong = (quant["Length"] - lengths).abs() > tolerance
+    if wrong.any():
+        name = wrong[wrong].index[0]
+        logger.error("{}: {} (quant) {} (gff)".format(name,
+            quant.loc[name, "Length"], lengths[name]))
+        raise ValueError("length in gff and quant not the same")
+    return quant["NumReads"].astype(int)
+
+
+def _read_counts(args):
+    # used by the pool of processes of get_counts_matrix
+    filename, annotation = args
+    return _get_counts(read_quant(filename), annotation)
+
+
+def get_counts_matrix(filenames, gff, attribute="ID", jobs=1,
+                      sample_names=None):
+    """Convert the Salmon quant files of several samples into a counts matrix
+
+    :param list filenames: the quant.sf files
+    :param gff: the GFF file used to annotate the features
+    :param str attribute: the GFF attribute that matches the Name column of
+        the quant files
+    :param int jobs: number of quant files read at the same time
+    :param list sample_names: names of the samples. By default, the name of
+        the directory containing the quant.sf files.
+    :return: a dataframe with a row per feature (Geneid index) and a column
+        per sample, as expected by :class:`~sequana.rnadiff.RNADiffAnalysis`.
+        Features missing in a sample are set to 0.
+
+    The annotation is parsed once for all samples.
+    """
+    if sample_names is None:
+        sample_names = [_get_sample_name(x) for x in filenames]
+    if len(sample_names) != len(filenames):
+        raise ValueError("Expected as many sample names as filenames")
+    annotation = get_gene_annotation(gff, attribute=attribute)
+    tasks = [(filename, annotation) for filename in filenames]
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            counts = list(executor.map(_read_counts, tasks))
+    else:
+        counts = [_read_counts(task) for task in tasks]
+
+    df = pd.concat(counts, axis=1, keys=sample_names, sort=False)
+    df = df.fillna(0).astype(int)
+    df.index.name = "Geneid"
+    return df
 
 
 class Salmon():
+    """Convert the output of Salmon (quant.sf) into a feature counts file
+
+    ::
 
+        from sequana.salmon import Salmon
+        s = Salmon("quant.sf")
+        df = s.get_feature_counts("genome.gff")
+
+    The features of the quant file (Name column) are matched against the
+    genes of a GFF file using one of their attributes (ID by default). The
+    gene lengths of the GFF and quant files must agree (5 bases tolerance).
+
+    """
     def __init__(self, filename):
         self.filename = filename
         df = pd.read_csv(filename, sep='\t')
         self.df = df
 
     def get_feature_counts(self, gff, attribute="ID"):
-        from sequana.gff3 import GFF3
-        gff = GFF3(gff)
-        annot = gff.get_df()
-        annot = annot.query("type=='gene'")
-        names = [x[attribute] for x in annot.attributes]
-        identifiers = [x["ID"] for x in annot.attributes]
-        annot['identifiers'] = identifiers
-        annot['names'] = names
-        annot = annot.set_index("identifiers")
-
-        results = ""
-        for name, length in zip(self.df.Name, self.df.Length):
-            try:dd = annot.loc[name]
-            except: continue
-            if isinstance(dd.seqid, str):
-                length2 = dd.stop - dd.start +1
-                seqid = dd.seqid
-                stops = dd.stop
-                starts = dd.start
-                strands = dd.strand
-                new_name = dd['names']
-            else:
-                seqid = ";".join(dd.seqid.values)
-                starts = ";".join([str(x) for x in dd.start.values])
-                stops = ";".join([str(x) for x in dd.stop.values])
-                strands = ";".join(dd.strand.values)
-                length2 = (dd.stop - dd.start).sum() + len(dd.stop)
-                new_name = dd['names'].values[0]
-
-            if abs(length - length2) >5:
-                print(name, length, length2)
-                raise ValueError("length in gff and quant not the same")
-            NumReads = int(self.df.query("Name==@name")['NumReads'].values[0])
-            if name.startswith("gene"):
-                results += f"\n{name}\t{seqid}\t{starts}\t{stops}\t{strands}\t{length}\t{NumReads}"
-        return results
+        """Return the feature counts of the quant file
+
+        :return: a dataframe with the featureCounts columns (Geneid, Chr,
+            Start, End, Strand, Length) and the number of reads of each
+            annotated feature, in the order of the quant file.
+        :raises ValueError: if the lengths in the GFF and quant files differ
+        """
+        annotation = get_gene_annotation(gff, attribute=attribute)
+        counts = _get_counts(self.df, annotation)
+        df = annotation.loc[counts.index].copy()
+        # the length of the quant file is reported
+        df["Length"] = self.df.drop_duplicates("Name").set_index(
+            "Name").loc[counts.index, "Length"]
+        df[self.filename] = counts
+        df.index.name = "Geneid"
+        return df.reset_index()
 
     def save_feature_counts(self, filename, gff, attribute="ID"):
         from sequana import version
-        data = self.get_feature_counts(gff, attribute=attribute)
+        df = self.get_feature_counts(gff, attribute=attribute)
         with open(filename, "w") as fout:
-            fout.write("# Program:sequana.salmon v{}; sequana salmon -i {} -o {} -g {}".format(
+            fout.write("# Program:sequana.salmon v{}; sequana salmon -i {} -o {} -g {}\n".format(
                 version, self.filename,filename, gff))
-            fout.write(data)
+            df.to_csv(fout, sep="\t", index=False)
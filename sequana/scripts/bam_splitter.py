@@ -22,7 +22,6 @@ import argparse
 from sequana.scripts.tools import SequanaOptions
 
 from easydev.console import purple
-from  collections import Counter
 from sequana import logger
 logger.name = "sequana.bam_splitter"
 
@@ -67,88 +66,120 @@ another file\n""" % prog
         self.add_argument("--keep-unmapped", dest="keep_unmapped",
                           action="store_true",
                           help="keep unmapped files")
+        self.add_argument("--compress", dest="compress",
+                          action="store_true",
+                          help="""save the FastQ files in BGZF format (gzip
+compatible). Blocks are compressed in parallel using --threads""")
+        self.add_threads(self)
 
         self.add_version(self)
         self.add_level(self)
 
 
-def sniff(filename):
-    logger.info("Sniffing file {}".format(filename))
-    from sequana import BAM, SAM, CRAM
+def _open_fastq(filename, compress=False, threads=1):
+    if compress:
+        from sequana.bgzf import BGZFWriter
+        return BGZFWriter(filename + ".gz", threads=threads)
+    return open(filename, "wb")
+
+
+def split_alignments(filename, outputs, categories, threads=1, batch_size=10000):
+    """Split the reads of a SAM/BAM/CRAM file into several FastQ files
+
+    :param filename: input SAM/BAM/CRAM file
+    :param dict outputs: keys are the names of the categories and values
+        writable files opened in binary mode (see :class:`~sequana.bgzf.BGZFWriter`)
+    :param list categories: for each of the 4096 possible flags, the name of
+        the category of the read (a key of *outputs*) or None to drop the read.
+    :param int threads: number of threads used to decode the BAM/CRAM file
+    :param int batch_size: number of reads formatted before writing them
+    :return: a histogram of the flags (numpy array of length 4096)
+
+    Reads are formatted in batches so that memory stays constant whatever
+    the size of the input file.
+    """
+    import pysam
+    from sequana.lazy import numpy as np
     from sequana.sniffer import sniffer
+
+    logger.info("Sniffing file {}".format(filename))
     datatype = sniffer(filename)
-    if datatype == "SAM":
-        logger.info("Input data in SAM format")
-        data = SAM(filename)
-    elif datatype == "BAM":
-        logger.info("Input data in BAM format")
-        data = BAM(filename)
-    elif datatype == "CRAM":
-        logger.info("Input data in CRAM format")
-        data = CRAM(filename)
-    else:
+    if datatype not in ("SAM", "BAM", "CRAM"):
         raise ValueError("Your input file does not seem to be a valid SAM/BAM/CRAM file")
-    return data
-
+    logger.info("Input data in {} format".format(datatype))
 
-def splitter_mapped_unmapped(filename, prefix):
+    histogram = [0] * 4096
+    buffers = {name: [] for name in outputs}
+    data = pysam.AlignmentFile(filename, "r", threads=threads, check_sq=False)
+    try:
+        for a in data:
+            flag = a.flag
+            histogram[flag] += 1
+            name = categories[flag]
+            if name is None:
+                continue
+            seq = a.query_sequence
+            qual = a.qual
+            assert len(seq) == len(qual)
+            buffer = buffers[name]
+            buffer.append("@%s\n%s\n+\n%s\n" % (a.query_name, seq, qual))
+            if len(buffer) >= batch_size:
+                outputs[name].write("".join(buffer).encode())
+                buffer.clear()
+    finally:
+        data.close()
+
+    for name, buffer in buffers.items():
+        if buffer:
+            outputs[name].write("".join(buffer).encode())
+    return np.array(histogram, dtype=np.int64)
+
+
+def _split(filename, prefix, categories, threads=1, compress=False):
+    outputs = {}
+    try:
+        for name in set(categories) - {None}:
+            outputs[name] = _open_fastq("{}.{}.fastq".format(prefix, name),
+                compress=compress, threads=threads)
+        flags = split_alignments(filename, outputs, categories, threads=threads)
+    finally:
+        for output in outputs.values():
+            output.close()
+    match = sum(flags[i] for i, name in enumerate(categories) if name == "mapped")
+    return int(match), int(flags.sum() - match), flags
+
+
+def splitter_mapped_unmapped(filename, prefix, threads=1, compress=False):
     logger.info("Creating 2 files (mapped and unmapped reads)")
-    data = sniff(filename)
-
-    count = 0
-    flags = []
-    match = 0
-    unmatch = 0
     logger.info("Please wait while creating output files")
-    with open("{}.unmapped.fastq".format(prefix), "w") as fnosirv:
-        with open("{}.mapped.fastq".format(prefix), "w") as fsirv:
-            for a in data:
-                if a.flag & 256:
-                    unmatch += 1
-                elif a.flag & 4:
-                    read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                    assert len(a.query_sequence) == len(a.qual)
-                    fnosirv.write(read)
-                    unmatch += 1
-                else:
-                    read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                    assert len(a.query_sequence) == len(a.qual)
-                    fsirv.write(read)
-                    match += 1
-                flags.append(a.flag)
-    return match, unmatch, flags
-
-
-def splitter_mapped_only(filename, prefix):
+    categories = []
+    for flag in range(4096):
+        if flag & 256:
+            categories.append(None)
+        elif flag & 4:
+            categories.append("unmapped")
+        else:
+            categories.append("mapped")
+    return _split(filename, prefix, categories, threads=threads, compress=compress)
+
+
+def splitter_mapped_only(filename, prefix, threads=1, compress=False):
     logger.info("Creating 1 file (mapped reads only). ")
     logger.info("Use --keep-unmapped to save unmapped reads.")
-    data = sniff(filename)
-
-    count = 0
-    flags = []
-    match = 0
-    unmatch = 0
-
     logger.info("Please wait while creating output file")
-    with open("{}.mapped.fastq".format(prefix), "w") as fsirv:
-        for a in data:
-            if a.flag & 260:
-                unmatch += 1
-                count += 1
-            else:
-                read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                assert len(a.query_sequence) == len(a.qual)
-                fsirv.write(read)
-                match += 1
-            flags.append(a.flag)
-    return match, unmatch, flags
+    categories = [None if flag & 260 else "mapped" for flag in range(4096)]
+    return _split(filename, prefix, categories, threads=threads, compress=compress)
 
 
-def _main(filename, prefix, keep_unmapped=True):
+def _main(filename, prefix, keep_unmapped=True, threads=1, compress=False):
+    """Split the input file and return the number of mapped and unmapped reads
+    and a histogram of the flags (numpy array of length 4096)"""
     if keep_unmapped:
-        match, unmatch, flags = splitter_mapped_unmapped(filename, prefix)
+        match, unmatch, flags = splitter_mapped_unmapped(filename, prefix,
+            threads=threads, compress=compress)
     else:
-        match, unmatch, flags = splitter_mapped_only(filename, prefix)
+        match, unmatch, flags = splitter_mapped_only(filename, prefix,
+            threads=threads, compress=compress)
     return match, unmatch, flags
 
 
@@ -193,11 +224,13 @@ def main(args=None):
 
 
     match, unmatch, flags = _main(options.input, prefix,
-        keep_unmapped=options.keep_unmapped)
+        keep_unmapped=options.keep_unmapped, threads=options.threads,
+        compress=options.compress)
 
     logger.info("Matched: {}".format(match))
     logger.info("Unmatched (flag 4 and 256): {}".format(unmatch))
-    logger.info("All flags: {}".format(Counter(flags)))
+    logger.info("All flags: {}".format(
+        {int(flag): int(flags[flag]) for flag in flags.nonzero()[0]}))
 
 
 if __name__ == "__main__":
@@ -24,7 +24,7 @@ import argparse
 
 from sequana.scripts.tools import SequanaOptions
 from sequana import misc
-from sequana import Module, SequanaConfig
+from sequana import logger
 
 from easydev import SmartFormatter, TempFile
 
@@ -44,8 +44,15 @@ class Options(argparse.ArgumentParser, SequanaOptions):
         sequana_compressor --source fastq.gz   --target fastq
         sequana_compressor --source fastq.bz2  --target fastq
 
-    If your job(s) were interrupted (ctrl+C), your directories will most
-    probably be locked. Use the --unlock option in such situations.
+    Files are converted in-process (largest first) by a pool of --jobs
+    workers; gz and bz2 outputs are compressed by blocks using --threads
+    threads. The decompressed content of the output is checked against the
+    input before the input is removed. The snakemake workflow used in
+    previous versions is still available with --use-snakemake.
+
+    With --use-snakemake, if your job(s) were interrupted (ctrl+C), your
+    directories will most probably be locked. Use the --unlock option in
+    such situations.
 
         sequana_compressor --source ... --target ... --unlock
 
@@ -107,7 +114,16 @@ Issues: http://github.com/sequana/sequana"""
             help="""The number of jobs is limited to 20 to limit IO. If you
                 want to bypass this limitation, use this option.""")
 
+        group.add_argument("--keep-input", default=False,
+            action="store_true", dest="keep_input",
+            help="""Do not remove the input files once converted.""")
+
         group = self.add_argument_group("SNAKEMAKE RELATED")
+        group.add_argument("--use-snakemake", default=False,
+            action="store_true", dest="use_snakemake",
+            help="""Use the snakemake workflow instead of the in-process
+                engine (required to run jobs on a cluster). Implied by
+                --unlock, --snakemake-cluster and --snakemake-options""")
         group.add_argument("--unlock", action="store_true",
             help="""If you stopped the application, the underlying snakemake
                 process are interrupted and directories were snakemake was
@@ -150,12 +166,6 @@ def main(args=None):
         raise ValueError('The number of jobs is limited to 20. You can ' +
             'force this limit by using --bypass-job-limit')
 
-    if misc.on_cluster("tars-") and options.unlock is False:
-        if options.cluster is None:
-            raise ValueError("You are on TARS (Institut Pasteur). You " +
-                " must use --cluster option to provide the scheduler " +
-                " options (typically ' --cluster 'sbatch --qos normal' )")
-
     # valid codecs:
     valid_extensions = [("fastq." + ext2).rstrip(".")
                         for ext2 in ['', 'bz2', 'gz', 'dsrc']]
@@ -171,7 +181,44 @@ def main(args=None):
         raise ValueError("""--target and --source combo not valid.
 Must be one of fastq, fastq.gz, fastq.bz2 or fastq.dsrc""")
 
+    # options of the snakemake workflow imply --use-snakemake
+    snakemake_only = [name for name, used in (
+        ("--unlock", options.unlock),
+        ("--snakemake-cluster", options.cluster),
+        ("--snakemake-options",
+            options.snakemake != user_options.get_default("snakemake")))
+        if used]
+    if snakemake_only and options.use_snakemake is False:
+        logger.warning("{} implies --use-snakemake".format(
+            ", ".join(snakemake_only)))
+        options.use_snakemake = True
+
+    if options.use_snakemake is False:
+        from sequana.compressor import Compressor
+        logger.level = "INFO" if options.verbose else "WARNING"
+        compressor = Compressor(options.source, options.target,
+            jobs=options.jobs, threads=options.threads,
+            keep_input=options.keep_input)
+        filenames = compressor.find_files(".", recursive=options.recursive)
+        if options.dryrun:
+            for filename in filenames:
+                print("{} -> {}".format(filename,
+                    compressor.get_output_filename(filename)))
+            return
+        results = compressor.run(filenames)
+        errors = [x for x in results if "error" in x]
+        if errors:
+            raise IOError("{} file(s) could not be converted".format(len(errors)))
+        return results
+
+    if misc.on_cluster("tars-") and options.unlock is False:
+        if options.cluster is None:
+            raise ValueError("You are on TARS (Institut Pasteur). You " +
+                " must use --cluster option to provide the scheduler " +
+                " options (typically ' --cluster 'sbatch --qos normal' )")
+
     # Create the config file locally
+    from sequana import Module, SequanaConfig
     module = Module("compressor")
 
     with TempFile(suffix=".yaml", dir=".") as temp:
@@ -83,9 +83,18 @@ class LaneMerger(Common):
     This script works at the sampleID level. Even though there are found
     in subsirectories, at the end we store everything in a flat structure.
 
+    By default, the compressed lane files are concatenated as they are (a
+    sequence of gzip members is a valid gzip file) after checking their
+    gzip headers (BGZF blocks are all checked; plain gzip files are fully
+    decompressed if *check_gzip* is set); samples are merged in parallel
+    (*jobs*). If *normalize* is set, files are decompressed and compressed
+    again with pigz in scripts submitted to the cluster (if sbatch is
+    available).
+
     """
     def __init__(self, pattern="*/*fastq.gz", outdir="merging", threads=4,
-                 queue=None, lanes=[], force=False):
+                 queue=None, lanes=[], force=False, normalize=False, jobs=4,
+                 check_gzip=False):
         super(LaneMerger, self).__init__(pattern, lanes)
 
         self._outdir = None
@@ -93,6 +102,9 @@ class LaneMerger(Common):
         self.threads = threads
         self.queue = queue
         self.force = force
+        self.normalize = normalize
+        self.jobs = jobs
+        self.check_gzip = check_gzip
 
         print("Number of samples: {}".format(len(self.sampleIDs)))
 
@@ -125,23 +137,46 @@ class LaneMerger(Common):
             msg = msg.format(name, R1, R2, self.Nlanes, self.Nlanes, self.Nlanes)
             raise ValueError(msg)
 
-    def get_pigz_cmd(self, sampleID, RX):
+    def get_lane_filenames(self, sampleID, RX):
+        """Return the lane files of a sample sorted by lane"""
         assert RX in ['R1', 'R2']
-        params = {"thread": self.threads, "sampleID": sampleID, "RX": RX}
-
         names = [x for x in self.filenames if x.startswith(sampleID) and RX in x]
 
         print("  Found {} files for sample {} ({})".format(len(names), sampleID, RX))
         msg = "For sample ID {}, found non unique sample names {} ?".format(sampleID, names)
         assert len(set(names)) == self.Nlanes, msg
-        params['name'] = sampleID.split("/")[-1]
-        params['outdir'] = self.outdir
 
         # IMPORTANT TO SORT the filenames so that L1 follows L2 for R1 and R2
         # files
-        params['filenames'] = " ".join(sorted(names))
+        return sorted(names)
+
+    def get_output_filename(self, sampleID, RX):
+        name = sampleID.split("/")[-1]
+        return "{}/{}_{}_001.fastq".format(self.outdir, name, RX)
+
+    def merge(self, sampleID):
+        """Concatenate the compressed lane files of a sample (R1 and R2)"""
+        from sequana.bgzf import concatenate_gzip
+
+        READS = ['R1']
+        if self.is_paired(sampleID) is True:
+            READS += ['R2']
+
+        outputs = []
+        for RX in READS:
+            output = self.get_output_filename(sampleID, RX) + ".gz"
+            if os.path.exists(output) and self.force is False:
+                raise IOError("{} exists already".format(output))
+            print("  Merging {} ({} case)".format(sampleID, RX))
+            concatenate_gzip(self.get_lane_filenames(sampleID, RX), output,
+                             full_check=self.check_gzip)
+            outputs.append(output)
+        return outputs
 
-        output = "{outdir}/{name}_{RX}_001.fastq".format(**params)
+    def get_pigz_cmd(self, sampleID, RX):
+        params = {"thread": self.threads, "sampleID": sampleID, "RX": RX}
+        params['filenames'] = " ".join(self.get_lane_filenames(sampleID, RX))
+        output = self.get_output_filename(sampleID, RX)
 
         if os.path.exists(output + ".gz") and self.force is False:
             raise IOError("{} exists already".format(output))
@@ -156,6 +191,20 @@ class LaneMerger(Common):
         return cmd
 
     def run(self, dry_run=False):
+        if self.normalize:
+            self._run_pigz(dry_run=dry_run)
+            return
+
+        if dry_run:
+            self.processes = ["dryrun" for name in self.sampleIDs]
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max(1, self.jobs)) as executor:
+            # consume the results to raise errors if any
+            self.processes = list(executor.map(self.merge, self.sampleIDs))
+
+    def _run_pigz(self, dry_run=False):
         import os
 
         processes = []
@@ -258,6 +307,16 @@ class Options(argparse.ArgumentParser):
             help="just create the script but do not launch them")
         self.add_argument("--force", action="store_true",
             help="overwrite the output file if it exists")
+        self.add_argument("--jobs", dest="jobs", type=int, default=4,
+            help="number of samples merged at the same time")
+        self.add_argument("--normalize", action="store_true",
+            help="""decompress and compress again the files with pigz (using
+scripts submitted to the cluster if sbatch is available). By default, the
+compressed files are concatenated""")
+        self.add_argument("--check-gzip", action="store_true",
+            help="""decompress the lane files (without writing anything) to
+check them before the concatenation. By default, only the gzip headers are
+checked (and the blocks of BGZF files)""")
 
 
 def main(args=None):
@@ -273,7 +332,9 @@ def main(args=None):
         options = user_options.parse_args(args[1:])
 
     c = LaneMerger(pattern=options.pattern, outdir=options.outdir,
-            queue=options.queue, lanes=options.lanes, force=options.force)
+            threads=options.threads, queue=options.queue, lanes=options.lanes,
+            force=options.force, normalize=options.normalize, jobs=options.jobs,
+            check_gzip=options.check_gzip)
     c.run(dry_run=options.dry_run)
 
 
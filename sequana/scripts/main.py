@@ -60,6 +60,9 @@ def main(**kwargs):
     help="filename where to save results. to be used with --head, --tail")
 
 @click.option("--count-reads", is_flag=True)
+@click.option("--cache", is_flag=True,
+    help="""with --count-reads, save the statistics of the files next to
+them (.sequana_stats.json) and use them next time""")
 @click.option("--head", type=click.INT,
     help='number of reads to extract from the head')
 @click.option("--merge", is_flag=True)
@@ -85,7 +88,10 @@ def fastq(**kwargs):
     if kwargs['count_reads']:
         for filename in filenames:
             f = FastQ(filename)
-            Nreads = f.count_reads()
+            if kwargs['cache']:
+                Nreads = f.get_stats(cache=True).n_reads
+            else:
+                Nreads = f.count_reads()
             Nlines = Nreads * 4
             print(f"Number of reads in {filename}: {Nreads}")
             print(f"Number of lines in {filename}: {Nlines}")
@@ -189,10 +195,13 @@ command""")
     help="""to run only kegg patways enrichment""")
 @click.option("--enrichment-kegg-pathways-directory", type=click.Path(),
     default=None,
-    help="""a place where to find the pathways for each organism""")
+    help="""a place where to find the pathways for each organism (directory of JSON files or a gene set store file)""")
 @click.option("--enrichment-kegg-background", type=click.INT,
     default=None,
     help="""a background for kegg enrichment. If None, set to number of genes found in KEGG""")
+@click.option("--fastq-cache", is_flag=True,
+    help="""save the statistics of the FastQ files next to them
+(.sequana_stats.json) and use them next time""")
 @common_logger
 def summary(**kwargs):
     """Create a HTML report for various sequana out
@@ -290,7 +299,8 @@ def summary(**kwargs):
         from sequana.fastq import FastQ
         from sequana import FastQC
         for filename in names:
-            ff = FastQC(filename, max_sample=1e6, verbose=False)
+            ff = FastQC(filename, max_sample=1e6, verbose=False,
+                        cache=kwargs["fastq_cache"])
             stats = ff.get_stats()
             print(stats)
     elif module == "bam": 
@@ -25,7 +25,7 @@ import subprocess
 from easydev.console import purple
 
 from sequana.scripts.tools import SequanaOptions
-from sequana.bamtools import SAM
+from sequana.scripts.bam_splitter import split_alignments
 from sequana import FastQ
 from sequana import logger
 logger.name = "sequana.substractor"
@@ -74,6 +74,12 @@ another file\n""" % prog
                             default="minimap2", choices=["bwa", "minimap2"],
                             required=False, help="mapper minimap2 or bwa")
 
+        self.add_argument("--streaming", dest="streaming",
+                            action="store_true",
+                            help="""pipe the mappers output and the unmapped reads
+from one reference to the next (no intermediate SAM/FastQ files). Only counts are
+kept""")
+
         self.add_threads(self)
         self.add_version(self)
         self.add_level(self)
@@ -94,10 +100,15 @@ class Substractor(object):
             os.mkdir(outdir)
 
         # this may be used later on for other mapper or methodology
+        # mapper_args is used in streaming mode (SAM written on stdout)
         if mapper == "minimap2":
             self.mapper_cmd = "minimap2 -x map-pb -t {} {} {} -a > {}"
+            self.mapper_args = ["minimap2", "-x", "map-pb", "-t", "{threads}",
+                "{reference}", "{input}", "-a"]
         elif mapper =="bwa" :
             self.mapper_cmd = "bwa mem -M -t {} {} {} > {}"
+            self.mapper_args = ["bwa", "mem", "-M", "-t", "{threads}",
+                "{reference}", "{input}"]
  
         f = FastQ(self.infile)
         self.L = len(f)
@@ -152,49 +163,175 @@ class Substractor(object):
         logger.info("all mapped and unmapped files: {}. Input was {}".format(
             MAPPED + results['unmapped'], self.L))
 
-    def splitter_mapped_unmapped(self, filename, prefix):
+    def run_streaming(self, output_filename):
+        """Remove the reads mapped on all references without intermediate files
+
+        All mappers are started at once. The SAM output of each mapper is
+        read from a pipe; the unmapped reads are sent to the next mapper
+        through a named pipe (FIFO) and the unmapped reads of the last
+        mapper are saved in *output_filename*. Only the counts are kept.
+
+        :return: list of counts (mapped, unmapped, bad) for each reference
+        """
+        import tempfile
+        import threading
+
+        for reference in self.references:
+            assert reference.endswith(".fa") or reference.endswith(".fasta")
+
+        tmpdir = tempfile.mkdtemp(dir=self.outdir)
+        fifos = []
+        for i in range(1, len(self.references)):
+            fifos.append(os.path.join(tmpdir, "stage_{}.fastq".format(i)))
+            os.mkfifo(fifos[-1])
+        inputs = [self.infile] + fifos
+        outputs = fifos + [output_filename]
+
+        processes = []
+        logs = []
+        try:
+            for reference, infile in zip(self.references, inputs):
+                cmd = [x.format(threads=self.threads, reference=reference,
+                    input=infile) for x in self.mapper_args]
+                logger.info("Removing {}. Mapping starting".format(reference))
+                logger.info(" ".join(cmd))
+                tag = os.path.basename(reference).replace(".fa", "").replace(".fasta", "")
+                logs.append(open("{}/mapping_{}.log".format(self.outdir, tag[0:8]), "w"))
+                processes.append(subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                    stderr=logs[-1]))
+
+            results = [None] * len(processes)
+            errors = []
+
+            def consume(i):
+                try:
+                    # the next mapper is the reader of the FIFO
+                    reader = processes[i + 1] if i + 1 < len(processes) else None
+                    with self._open_output(outputs[i], reader) as fout:
+                        results[i] = self._split_stream(processes[i].stdout, fout)
+                except Exception as err:
+                    errors.append(err)
+                    # unblock the other stages
+                    for process in processes:
+                        process.kill()
+
+            threads = [threading.Thread(target=consume, args=(i,))
+                       for i in range(len(processes))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for reference, process in zip(self.references, processes):
+                if process.wait() != 0:
+                    errors.append(RuntimeError("Mapping on {} failed".format(reference)))
+            if errors:
+                raise errors[0]
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+            for log in logs:
+                log.close()
+            for fifo in fifos:
+                os.remove(fifo)
+            os.rmdir(tmpdir)
+
+        for reference, result in zip(self.references, results):
+            logger.info("{}: {} mapped. {} reads remaining".format(
+                reference, result['mapped'], result["unmapped"]))
+        logger.info("Your final file: {} with {} reads".format(
+            output_filename, results[-1]['unmapped']))
+        MAPPED = sum(result["mapped"] for result in results)
+        logger.info("all mapped and unmapped files: {}. Input was {}".format(
+            MAPPED + results[-1]['unmapped'], self.L))
+        return results
+
+    def _open_output(self, filename, reader=None):
+        # Opening a FIFO blocks until the reader opens it. If the reader (next
+        # mapper) died, we would wait forever so we poll it.
+        if reader is None:
+            return open(filename, "wb")
+        import time
+        import errno
+        while True:
+            try:
+                fd = os.open(filename, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as err:
+                if err.errno != errno.ENXIO:
+                    raise
+                if reader.poll() is not None:
+                    raise RuntimeError("Mapper reading {} stopped".format(filename))
+                time.sleep(0.05)
+        os.set_blocking(fd, True)
+        return os.fdopen(fd, "wb")
+
+    def _split_stream(self, stream, fout, batch_size=10000):
+        # parse the SAM output of a mapper and save the unmapped reads
+        categories = self._get_categories()
+        histogram = [0] * 4096
+        buffer = []
+        for line in stream:
+            if line.startswith(b"@"):
+                continue
+            fields = line.split(b"\t", 11)
+            flag = int(fields[1])
+            histogram[flag] += 1
+            if categories[flag] == "unmapped":
+                buffer.append(b"@%s\n%s\n+\n%s\n" % (fields[0], fields[9],
+                    fields[10].rstrip(b"\n")))
+                if len(buffer) >= batch_size:
+                    fout.write(b"".join(buffer))
+                    buffer.clear()
+        fout.write(b"".join(buffer))
+        return self._get_counts(histogram, categories)
+
+    def _get_categories(self):
         # helpful resources:
         # https://broadinstitute.github.io/picard/explain-flags.html
+        categories = []
+        for flag in range(4096):
+            if flag & (2048 + 1024 + 256):
+                # suppl, PCR duplicate or secondary alignment; dropped
+                categories.append(None)
+            elif flag & 16 or flag == 0:
+                categories.append("mapped")
+            elif flag & 4:
+                categories.append("unmapped")
+            else:
+                categories.append(None)
+        return categories
+
+    def _get_counts(self, flags, categories):
+        results = {"flags": flags, "mapped": 0, "unmapped": 0, "bad": 0}
+        for flag, count in enumerate(flags):
+            if count == 0:
+                continue
+            if categories[flag] is not None:
+                results[categories[flag]] += int(count)
+            elif flag & (2048 + 1024 + 256):
+                results["bad"] += int(count)
+            else:
+                logger.warning("{} flag not handled".format(flag))
+        return results
+
+    def splitter_mapped_unmapped(self, filename, prefix):
         logger.info("Creating 2 files (mapped and unmapped reads)")
-        data = SAM(filename)
-
-        results = {
-            "flags": [],
-            "mapped": 0,
-            "unmapped": 0,
-            "bad":0
-        }
+        categories = self._get_categories()
+
         logger.info("Please wait while creating output files")
+        outputs = {}
+        try:
+            for name in ["mapped", "unmapped"]:
+                outputs[name] = open("{}/{}.{}.fastq".format(
+                    self.outdir, prefix, name), "wb")
+            flags = split_alignments(filename, outputs, categories,
+                threads=self.threads)
+        finally:
+            for output in outputs.values():
+                output.close()
 
-        with open("{}/{}.unmapped.fastq".format(self.outdir, prefix), "w") as fnosirv:
-            with open("{}/{}.mapped.fastq".format(self.outdir, prefix), "w") as fsirv:
-                for a in data:
-                    if a.flag & 2048: # suppl
-                        # a bad read, we can just drop it
-                        results['bad']+=1
-                    elif a.flag & 1024: # PCR duplicate
-                        results['bad']+=1
-                    elif a.flag & 256: # secondary alignment
-                        results["bad"] += 1
-                    elif a.flag &16: # mapped
-                        read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                        assert len(a.query_sequence) == len(a.qual)
-                        fsirv.write(read)
-                        results["mapped"] += 1
-                    elif a.flag & 4: # unmapped
-                        read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                        assert len(a.query_sequence) == len(a.qual)
-                        fnosirv.write(read)
-                        results["unmapped"] += 1
-                    elif a.flag == 0: # mapped
-                        read = "@{}\n{}\n+\n{}\n".format(a.qname, a.query_sequence, a.qual)
-                        assert len(a.query_sequence) == len(a.qual)
-                        fsirv.write(read)
-                        results["mapped"] += 1
-                    else:
-                        logger.warning("{} flag not handled".format(a.flag))
-                    results["flags"].append(a.flag)
-        return results
+        return self._get_counts(flags, categories)
 
 
 def main(args=None):
@@ -234,7 +371,10 @@ def main(args=None):
     # call the entire machinery here
     sub = Substractor(options.input, references, options.outdir, 
         options.mapper, options.threads)
-    sub.run(options.outfile)
+    if options.streaming:
+        sub.run_streaming(options.outfile)
+    else:
+        sub.run(options.outfile)
 
 
 if __name__ == "__main__":
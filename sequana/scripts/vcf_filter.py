@@ -16,6 +16,7 @@
 ##############################################################################
 """Extract head of a zipped or unzipped FastQ file"""
 from sequana.vcf_filter import VCF
+from sequana.vcf_batch_filter import VCFBatchFilter
 
 import sys
 import argparse
@@ -95,6 +96,13 @@ class Options(argparse.ArgumentParser, SequanaOptions):
 
     Note that you must use quotes to surround the filter values.
 
+    Input VCF compressed with bgzip and indexed with tabix (.tbi) are
+    filtered contig by contig on several processes with --threads. Outputs
+    with the .gz extension are compressed with bgzip:
+
+        sequana_vcf_filter --input test.vcf.gz --quality 40 --threads 8
+                --output remaining.vcf.gz --output-filtered filtered.vcf.gz
+
         """
         super(Options, self).__init__(usage=usage, prog=prog,
                 epilog=epilog,
@@ -137,6 +145,11 @@ class Options(argparse.ArgumentParser, SequanaOptions):
         self.add_argument("--output-filtered", dest="output_filtered_filename",
                             default="filtered.vcf", type=str)
 
+        self.add_argument("--threads", dest="threads", type=int, default=1,
+            help="""number of processes. If greater than 1, variants are
+                filtered by batches (see
+                sequana.vcf_batch_filter module)""")
+
         self.add_argument('--level', dest="level",
             default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
 
@@ -158,10 +171,8 @@ def main(args=None):
     elif len(args) == 1 or "--help" in args:
         user_options.parse_args(["prog", "--help"])
     elif len(args) == 2:
-        class SimpleOpt():
-            pass
-        options = SimpleOpt()
-        options.input_filename = args[1]
+        # input filename only; other options are set to their default value
+        options = user_options.parse_args(["--input", args[1]])
     else:
         options = user_options.parse_args(args[1:])
 
@@ -169,22 +180,25 @@ def main(args=None):
     # set the level
     logger.level = options.level
 
-    vcf = VCF(options.input_filename)
-    try:
-        vcf.vcf.filter_dict['QUAL'] =  options.quality
-    except:
-        vcf.vcf.filter_dict = {}
-        vcf.vcf.filter_dict['QUAL'] =  options.quality
-
-    vcf.vcf.apply_indel_filter = options.apply_indel_filter
-    vcf.vcf.apply_dp4_filter = options.apply_dp4_filter
-    vcf.vcf.apply_af1_filter = options.apply_af1_filter
-    vcf.vcf.dp4_minimum_depth = options.minimum_depth
-    vcf.vcf.dp4_minimum_depth_strand = options.minimum_depth_strand
-    vcf.vcf.dp4_minimum_ratio = options.minimum_ratio
-    vcf.vcf.minimum_af1 = options.minimum_af1
-    vcf.vcf.filter_dict['INFO'] = {}
-    vcf.vcf.filter_dict['QUAL'] =  options.quality
+    if options.threads > 1:
+        vcf = VCFBatchFilter(options.input_filename)
+    else:
+        vcf = VCF(options.input_filename).vcf
+        try:
+            vcf.filter_dict['QUAL'] =  options.quality
+        except:
+            vcf.filter_dict = {}
+            vcf.filter_dict['QUAL'] =  options.quality
+
+    vcf.apply_indel_filter = options.apply_indel_filter
+    vcf.apply_dp4_filter = options.apply_dp4_filter
+    vcf.apply_af1_filter = options.apply_af1_filter
+    vcf.dp4_minimum_depth = options.minimum_depth
+    vcf.dp4_minimum_depth_strand = options.minimum_depth_strand
+    vcf.dp4_minimum_ratio = options.minimum_ratio
+    vcf.minimum_af1 = options.minimum_af1
+    vcf.filter_dict['INFO'] = {}
+    vcf.filter_dict['QUAL'] =  options.quality
 
 
     for this in options.filter:
@@ -195,13 +209,18 @@ def main(args=None):
                 key, value = this.split(sign, 1)
                 key = key.strip()
                 value = sign.strip() + value.strip()
-                vcf.vcf.filter_dict['INFO'][key] = value
+                vcf.filter_dict['INFO'][key] = value
                 break
 
 
-    logger.info(vcf.vcf.filter_dict)
+    logger.info(vcf.filter_dict)
 
-    res = vcf.vcf.filter_vcf(options.output_filename,
+    if isinstance(vcf, VCFBatchFilter):
+        res = vcf.filter_vcf(options.output_filename,
+                       output_filtered=options.output_filtered_filename,
+                       threads=options.threads)
+    else:
+        res = vcf.filter_vcf(options.output_filename,
                        output_filtered=options.output_filtered_filename)
 
     print()
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Startup benchmark of the Sequana standalone applications
+
+Each application is started in a fresh Python interpreter with **--help** and
+with a small canned run on the test data shipped with sequana. For each run,
+we record the wall time, the time spent importing the module of the
+application, the number of imported modules and the peak memory (RSS).
+Results can be saved in JSON format and compared to thresholds so that
+startup regressions (e.g. new top-level imports) are caught::
+
+    python -m sequana.startup_benchmark --output startup.json
+    python -m sequana.startup_benchmark --save-thresholds thresholds.json
+    python -m sequana.startup_benchmark --thresholds thresholds.json
+
+The last command exits with an error if a threshold is exceeded. Times,
+memory and even the number of modules depend on the machine and on the
+Python version, so a threshold file has one section per Python version
+(e.g. "3.7"); versions without section are not checked. The thresholds of
+the (opt-in) startup job are in test/data/startup_thresholds.json. Run the
+following command with each Python version to check, on an idle machine;
+the margin is a factor 3 on times and memory and 1.2 on the number of
+modules::
+
+    python -m sequana.startup_benchmark --save-thresholds \\
+        test/data/startup_thresholds.json --tolerance 3 --modules-tolerance 1.2
+
+The unit tests only check that the applications import fewer modules than
+the whole package (see :meth:`StartupBenchmark.get_package_modules`).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["StartupBenchmark", "ENTRY_POINTS"]
+
+
+#: applications to benchmark. For each console script, the module providing
+#: the main function and a small canned run on the test data shipped with
+#: sequana (see :func:`canned_run`). In the arguments, {tmpdir} is replaced by
+#: a temporary directory and {data:name} by the path of a sequana test file.
+#: Canned runs that need third-party programs are skipped if these programs
+#: are not installed.
+ENTRY_POINTS = {
+    "sequana": ("sequana.scripts.main", {
+        "args": ["fastq", "{data:test.fastq}", "--count-reads"]}),
+    "sequana_coverage": ("sequana.scripts.coverage", {
+        "args": ["--input", "{data:JB409847.bed}", "--output-directory",
+                 "{tmpdir}/coverage", "--no-html", "--no-multiqc",
+                 "--window-median", "3001"]}),
+    "sequana_taxonomy": ("sequana.scripts.taxonomy", {
+        "args": ["--file1", "{data:test.fastq.gz}", "--databases",
+                 "{env:SEQUANA_KRAKEN_DB}", "--output-directory",
+                 "{tmpdir}/taxonomy", "--thread", "1"],
+        "requires": ["kraken", "env:SEQUANA_KRAKEN_DB"]}),
+    "sequana_vcf_filter": ("sequana.scripts.vcf_filter", {
+        "args": ["--input", "{data:test_vcf_mpileup_4dot1.vcf}",
+                 "--quality", "0", "--output", "{tmpdir}/out.vcf",
+                 "--output-filtered", "{tmpdir}/filtered.vcf"]}),
+    "sequana_bam_splitter": ("sequana.scripts.bam_splitter", {
+        "args": ["--input", "{data:test.bam}", "--output-directory",
+                 "{tmpdir}"]}),
+    "sequana_compressor": ("sequana.scripts.compressor", {
+        "args": ["--source", "fastq.gz", "--target", "fastq.bz2"],
+        "files": {"A_R1_001.fastq.gz": "test.fastq.gz"}}),
+    "sequana_substractor": ("sequana.scripts.substractor", {
+        "args": ["--input", "{data:test.fastq.gz}", "--reference",
+                 "{data:measles.fa}", "--mapper", "minimap2",
+                 "--output-directory", "{tmpdir}/substractor",
+                 "--streaming"],
+        "requires": ["minimap2"]}),
+    "sequana_mapping": ("sequana.scripts.mapping", {
+        "args": ["--file1", "{data:test.fastq.gz}", "--reference",
+                 "{tmpdir}/measles.fa", "--thread", "1"],
+        "files": {"measles.fa": "measles.fa"},
+        "requires": ["bwa", "samtools"]}),
+    "sequana_lane_merging": ("sequana.scripts.lane_merging", {
+        "args": ["--lanes", "1", "2", "--pattern", "{tmpdir}/*/*fastq.gz",
+                 "--output-directory", "{tmpdir}/merging", "--jobs", "1"],
+        "files": {"A/A_L001_R1_001.fastq.gz": "test.fastq.gz",
+                  "A/A_L002_R1_001.fastq.gz": "test.fastq.gz"}}),
+    "sequana_start_pipeline": ("sequana.scripts.start_pipeline", {
+        # the template is downloaded from github
+        "args": ["--name", "startup", "--force"],
+        "requires": ["git", "network"]}),
+}
+
+# Run in the child interpreter. The main function is called with sys.argv set
+# as if the console script was called; SystemExit (e.g. --help) is expected.
+_driver = """
+import sys, json, time, resource
+output, module, argv = sys.argv[1], sys.argv[2], sys.argv[3:]
+sys.argv = argv
+t0 = time.perf_counter()
+mod = __import__(module, fromlist=["main"])
+import_time = time.perf_counter() - t0
+try:
+    mod.main()
+except SystemExit as err:
+    if err.code not in (None, 0):
+        raise
+# on Linux, ru_maxrss includes the peak of the parent before exec
+# (e.g. pytest), whereas VmHWM is the peak of this interpreter only
+try:
+    with open("/proc/self/status") as fin:
+        rss = [int(x.split()[1]) for x in fin if x.startswith("VmHWM:")][0]
+except (OSError, IndexError):
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024.
+with open(output, "w") as fout:
+    json.dump({"import_time": import_time, "modules": len(sys.modules),
+               "peak_rss": rss / 1024.}, fout)
+"""
+
+# Import the package and all its exported names (the cost of the eager
+# imports of previous versions)
+_package_driver = """
+import sys, json
+import sequana
+for name in sequana.__all__:
+    getattr(sequana, name)
+with open(sys.argv[1], "w") as fout:
+    json.dump({"modules": len(sys.modules)}, fout)
+"""
+
+
+def _get_python_version():
+    return "{}.{}".format(*sys.version_info[:2])
+
+
+class StartupBenchmark(object):
+    """Measure the startup of the Sequana standalone applications
+
+    ::
+
+        from sequana.startup_benchmark import StartupBenchmark
+        sb = StartupBenchmark(["sequana_vcf_filter"], repeat=3)
+        results = sb.run()
+        sb.to_json("startup.json")
+
+    Each result is a dictionary with the application name, the scenario
+    (*help* or *run*), the command line, the wall time and the import time (in
+    seconds, best of *repeat* runs), the number of imported modules and the
+    peak RSS (in Mb).
+
+    """
+    #: measurements compared to the thresholds
+    metrics = ("wall_time", "import_time", "modules", "peak_rss")
+
+    def __init__(self, names=None, repeat=3, timeout=300):
+        """.. rubric:: constructor
+
+        :param list names: names of the applications to benchmark (keys of
+            :data:`ENTRY_POINTS`). Defaults to all of them.
+        :param int repeat: number of runs per command. The best time is kept.
+        :param int timeout: timeout of each run in seconds.
+        """
+        if names is None:
+            names = list(ENTRY_POINTS.keys())
+        for name in names:
+            if name not in ENTRY_POINTS:
+                raise ValueError("Unknown application {}. Use one of {}".format(
+                    name, list(ENTRY_POINTS.keys())))
+        self.names = names
+        self.repeat = repeat
+        self.timeout = timeout
+        self.results = []
+
+    def _get_args(self, args, tmpdir):
+        from sequana import sequana_data
+        output = []
+        for arg in args:
+            if arg.startswith("{data:"):
+                arg = sequana_data(arg[6:-1])
+            elif arg.startswith("{env:"):
+                arg = os.environ[arg[5:-1]]
+            output.append(arg.replace("{tmpdir}", tmpdir))
+        return output
+
+    def _get_missing(self, canned):
+        # requirements of a canned run that are not available
+        import shutil
+        missing = []
+        for requirement in canned.get("requires", []):
+            if requirement == "network":
+                if os.environ.get("SEQUANA_STARTUP_NETWORK") is None:
+                    missing.append("network (set SEQUANA_STARTUP_NETWORK)")
+            elif requirement.startswith("env:"):
+                if os.environ.get(requirement[4:]) is None:
+                    missing.append("environment variable " + requirement[4:])
+            elif shutil.which(requirement) is None:
+                missing.append(requirement)
+        return missing
+
+    def _prepare(self, canned, tmpdir):
+        # copy the input files of a canned run in the temporary directory
+        import shutil
+        from sequana import sequana_data
+        for target, source in canned.get("files", {}).items():
+            target = os.path.join(tmpdir, target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy(sequana_data(source), target)
+
+    def run_command(self, name, args, canned=None):
+        """Run an application several times and return the best measurements
+
+        :param name: name of the application
+        :param args: arguments of the command line
+        :param dict canned: input files to copy in the working directory of
+            the command (a temporary directory), see :data:`ENTRY_POINTS`
+        """
+        module, _ = ENTRY_POINTS[name]
+        best = None
+        for _ in range(self.repeat):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                if canned:
+                    self._prepare(canned, tmpdir)
+                output = os.path.join(tmpdir, "startup.json")
+                cmd = [sys.executable, "-c", _driver, output, module, name]
+                cmd += self._get_args(args, tmpdir)
+                t0 = time.perf_counter()
+                subprocess.run(cmd, stdout=subprocess.DEVNULL, cwd=tmpdir,
+                    stderr=subprocess.DEVNULL, timeout=self.timeout, check=False)
+                wall_time = time.perf_counter() - t0
+                if os.path.exists(output) is False:
+                    raise RuntimeError("{} {} failed".format(name, " ".join(args)))
+                with open(output) as fin:
+                    result = json.load(fin)
+            result["wall_time"] = wall_time
+            if best is None:
+                best = result
+            else:
+                for key in self.metrics:
+                    best[key] = min(best[key], result[key])
+        return best
+
+    def get_package_modules(self):
+        """Return the number of modules imported with the whole package
+
+        That is sequana and all the names it exports. An application that
+        imports as many modules does not benefit from the lazy imports.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "package.json")
+            subprocess.run([sys.executable, "-c", _package_driver, output],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                cwd=tmpdir, timeout=self.timeout, check=True)
+            with open(output) as fin:
+                return json.load(fin)["modules"]
+
+    def run(self):
+        """Benchmark all applications (--help and canned run)
+
+        Canned runs whose requirements are missing are skipped (a warning is
+        emitted).
+        """
+        self.results = []
+        for name in self.names:
+            _, canned = ENTRY_POINTS[name]
+            scenarios = [("help", ["--help"], None)]
+            missing = self._get_missing(canned)
+            if missing:
+                logger.warning("{} canned run skipped. Missing: {}".format(
+                    name, ", ".join(missing)))
+            else:
+                scenarios.append(("run", canned["args"], canned))
+            for scenario, args, this in scenarios:
+                result = {"name": name, "scenario": scenario,
+                          "command": " ".join([name] + args)}
+                result.update(self.run_command(name, args, this))
+                logger.info("{command}: {wall_time:.2f}s, {modules} modules, "
+                            "{peak_rss:.0f}Mb".format(**result))
+                self.results.append(result)
+        return self.results
+
+    def to_json(self, filename):
+        """Save the results in JSON format"""
+        import platform
+        data = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": self.repeat,
+            "results": self.results,
+        }
+        with open(filename, "w") as fout:
+            json.dump(data, fout, indent=2)
+
+    def get_thresholds(self, tolerance=1.5, modules_tolerance=None):
+        """Return thresholds from the current results
+
+        :param float tolerance: the measurements are multiplied by this factor
+        :param float modules_tolerance: factor applied to the number of
+            modules (defaults to *tolerance*). Counts do not depend on the
+            machine and can use a tighter factor than times.
+        :return: dictionary with keys "<name> <scenario>" and values a
+            dictionary with maximum values for each metric.
+        """
+        if modules_tolerance is None:
+            modules_tolerance = tolerance
+        thresholds = {}
+        for result in self.results:
+            key = "{} {}".format(result["name"], result["scenario"])
+            thresholds[key] = {metric: round(result[metric] * (
+                modules_tolerance if metric == "modules" else tolerance), 3)
+                for metric in self.metrics}
+        return thresholds
+
+    def save_thresholds(self, filename, tolerance=1.5, modules_tolerance=None):
+        """Save the thresholds of the current Python version in a JSON file
+
+        The sections of the other Python versions are kept if the file
+        exists. See :meth:`get_thresholds` for the parameters.
+        """
+        data = {}
+        if os.path.exists(filename) and os.path.getsize(filename):
+            with open(filename) as fin:
+                data = json.load(fin)
+        data[_get_python_version()] = self.get_thresholds(tolerance,
+                                                          modules_tolerance)
+        with open(filename, "w") as fout:
+            json.dump(data, fout, indent=2, sort_keys=True)
+
+    def check(self, thresholds, metrics=None):
+        """Compare the results to thresholds
+
+        :param thresholds: a dictionary as returned by :meth:`get_thresholds`
+            or a JSON file saved with :meth:`save_thresholds`, in which case
+            the section of the current Python version is used. Metrics that
+            are not provided are not checked.
+        :param list metrics: metrics to check (defaults to all of them)
+        :return: list of error messages (empty if all thresholds are met)
+        """
+        if isinstance(thresholds, str):
+            with open(thresholds) as fin:
+                data = json.load(fin)
+            version = _get_python_version()
+            if version not in data:
+                logger.warning("No thresholds for Python {} in {}. Not "
+                               "checked".format(version, thresholds))
+            thresholds = data.get(version, {})
+        if metrics is None:
+            metrics = self.metrics
+
+        errors = []
+        for result in self.results:
+            key = "{} {}".format(result["name"], result["scenario"])
+            for metric, maximum in thresholds.get(key, {}).items():
+                if metric in metrics and result[metric] > maximum:
+                    errors.append("{}: {} is {} (threshold {})".format(
+                        key, metric, round(result[metric], 3), maximum))
+        return errors
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="sequana_startup_benchmark"):
+        usage = """%s
+
+        Measure the startup time of the Sequana applications:
+
+            python -m sequana.startup_benchmark --output startup.json
+            python -m sequana.startup_benchmark --thresholds thresholds.json
+        """ % prog
+        super(Options, self).__init__(usage=usage, prog=prog,
+                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+        self.add_argument("--names", nargs="+", default=None,
+            choices=list(ENTRY_POINTS.keys()),
+            help="applications to benchmark (default to all)")
+        self.add_argument("--repeat", type=int, default=3,
+            help="number of runs for each command (best time is kept)")
+        self.add_argument("--output", default=None,
+            help="where to save the results (JSON)")
+        self.add_argument("--thresholds", default=None,
+            help="JSON file with the thresholds. Exits with an error if a threshold is exceeded")
+        self.add_argument("--metrics", nargs="+", default=None,
+            choices=StartupBenchmark.metrics,
+            help="metrics compared to the thresholds (default to all)")
+        self.add_argument("--save-thresholds", default=None,
+            help="save thresholds computed from this run in the section of "
+                 "the current Python version (see --tolerance)")
+        self.add_argument("--tolerance", type=float, default=1.5,
+            help="factor applied to the measurements when saving thresholds")
+        self.add_argument("--modules-tolerance", type=float, default=None,
+            help="factor applied to the number of modules when saving "
+                 "thresholds (default to --tolerance)")
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[:]
+    options = Options().parse_args(args[1:])
+    logger.level = "INFO"
+
+    sb = StartupBenchmark(options.names, repeat=options.repeat)
+    sb.run()
+
+    if options.output:
+        sb.to_json(options.output)
+    if options.save_thresholds:
+        sb.save_thresholds(options.save_thresholds, options.tolerance,
+                           options.modules_tolerance)
+    if options.thresholds:
+        errors = sb.check(options.thresholds, options.metrics)
+        for error in errors:
+            logger.error(error)
+        if errors:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -19,12 +19,16 @@
 """Statistical tools"""
 
 from sequana.lazy import numpy as np
-from sequana.lazy import pandas as pd
 from sequana import logger
 logger.name = __name__
 
 
-__all__ = ["moving_average", "evenness"]
+__all__ = ["moving_average", "evenness", "N50", "L50", "LengthHistogram"]
+
+
+# integer data with values up to this bound (and this number of times the
+# number of values) are counted with np.bincount instead of being sorted
+MAX_BINCOUNT = 10000000
 
 
 def moving_average(data, n):
@@ -43,14 +47,20 @@ def moving_average(data, n):
 
     """
     ret = np.cumsum(data, dtype=float)
-    ret[n:] = ret[n:] - ret[:-n]
-    ma = ret[n - 1:] / n
-    return ma
+    ret[n:] -= ret[:-n].copy()
+    ret = ret[n - 1:]
+    ret /= n
+    return ret
 
 
-def evenness(data):
+def evenness(data, counts=None):
     """Return Evenness of the coverage
 
+    :param data: the coverage (NaN are ignored) or, if *counts* is
+        provided, the distinct coverage values
+    :param counts: number of positions with each value of *data*
+        (histogram of the coverage, e.g. :attr:`LengthHistogram.counts`)
+
     :Reference: Konrad Oexle, Journal of Human Genetics 2016, Evaulation
         of the evenness score in NGS.
 
@@ -65,42 +75,173 @@ def evenness(data):
         E = 1 - (n - sum(D2) / C) / N
 
     """
-    coverage = pd.Series(data)
-
-    coverage = coverage.dropna()
-
-    C = float(round(coverage.mean()))
-    D2 = coverage[coverage<=C]
-    if len(D2) == 0:
+    if counts is None and np.issubdtype(np.asarray(data).dtype, np.integer):
+        # integer coverage is summarised by its histogram
+        data, counts = _get_histogram(data)
+    values = np.asarray(data, dtype=float)
+    if counts is None:
+        values = values[~np.isnan(values)]
+        counts = np.ones(len(values), dtype=np.int64)
+    else:
+        counts = np.asarray(counts, dtype=np.int64)
+        keep = ~np.isnan(values)
+        values, counts = values[keep], counts[keep]
+
+    N = counts.sum()
+    C = float(np.round((values * counts).sum() / N))
+    below = values <= C
+    n = counts[below].sum()
+    if n == 0:
         return 1
     else:
-
-        return 1. - (len(D2) - sum(D2) / C) / len(coverage)
-
-
-def N50(data):
+        return 1. - (n - (values[below] * counts[below]).sum() / C) / N
+
+
+def _get_histogram(data):
+    # distinct (sorted) values of the data and their number of occurrences
+    data = np.asarray(data)
+    if data.ndim != 1:
+        data = data.ravel()
+    if len(data) and np.issubdtype(data.dtype, np.integer) and data.min() >= 0:
+        top = int(data.max())
+        if top <= max(MAX_BINCOUNT, 10 * len(data)):
+            counts = np.bincount(data, minlength=1)
+            values = np.nonzero(counts)[0]
+            return values, counts[values]
+    return np.unique(data, return_counts=True)
+
+
+def _get_N50_position(values, counts):
+    # index of the N50 in values and number of items before it (sorted data)
+    values = np.asarray(values)
+    counts = np.asarray(counts, dtype=np.int64)
+    if np.issubdtype(values.dtype, np.integer):
+        cdata = np.cumsum(values.astype(np.int64) * counts)
+    else:
+        cdata = np.cumsum(values * counts)
+    total = cdata[-1]
+    # first item whose cumulative sum exceeds half of the total
+    j = int(np.argmax(2 * cdata > total))
+    if not 2 * cdata[j] > total:
+        # all values are zero (as np.argmax on an array of False)
+        return 0, 0
+    previous = cdata[j - 1] if j else 0
+    k = (total - 2 * previous) // (2 * values[j])
+    return j, int(counts[:j].sum() + k)
+
+
+def N50(data, counts=None):
     """Return the N50 value given a list of unsorted/sorted contigs
 
     Once the list of contigs is sorted, the N50 is the contig length for which at
     least half of the nucleotides in the assembly belongs to contigs with the N50
     length or longer.
 
+    :param data: lengths of the contigs (any order) or, if *counts* is
+        provided, the distinct lengths
+    :param counts: number of contigs of each length of *data*
+
+    Non negative integer lengths are counted with :func:`numpy.bincount`
+    rather than sorted. See also :class:`LengthHistogram` to compute the N50
+    of several files without concatenating their lengths.
     """
-    data = np.sort(data)
-    cdata = np.cumsum(data)
-    return data[np.argmax(cdata>cdata[-1]/2)]
+    if counts is None:
+        values, counts = _get_histogram(data)
+    else:
+        values = np.asarray(data)
+    j, pos = _get_N50_position(values, counts)
+    return values[j]
 
 
-def L50(data):
+def L50(data, counts=None):
     """Return the smallest number of contigs whose length sum produces N50
 
     ::
 
-        >>> data =
+        >>> data = [2, 2, 2, 3, 3, 4, 8, 8]
         >>> L50(data)
-        3
+        2
+
+    Parameters are the same as in :func:`N50`.
+    """
+    if counts is None:
+        values, counts = _get_histogram(data)
+    else:
+        values = np.asarray(data)
+    j, pos = _get_N50_position(values, counts)
+    return int(np.sum(counts)) - pos
+
+
+class LengthHistogram(object):
+    """Mergeable histogram of lengths (contigs, reads)
+
+    Lengths are stored as distinct values and their number of occurrences so
+    that statistics of several files (or shards of a file) can be combined
+    without keeping the raw lengths::
+
+        from sequana.stats import LengthHistogram
+        h1 = LengthHistogram([100, 200, 200])
+        h2 = LengthHistogram([1000])
+        h = h1 + h2
+        h.N50(), h.L50(), h.get_stats()
+
     """
-    data = np.sort(data)
-    cdata = np.cumsum(data)
-    pos = np.argmax(cdata>cdata[-1]/2)
-    return len(data) - pos
+    def __init__(self, data=None, counts=None):
+        """.. rubric:: constructor
+
+        :param data: lengths or, if *counts* is provided, distinct lengths
+        :param counts: number of occurrences of each length of *data*
+        """
+        self.values = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        if data is not None:
+            self.update(data, counts=counts)
+
+    def update(self, data, counts=None):
+        """Add lengths (or a histogram of lengths) to the histogram"""
+        if counts is None:
+            values, counts = _get_histogram(data)
+        else:
+            values = np.asarray(data)
+            counts = np.asarray(counts, dtype=np.int64)
+        if len(self.values) == 0:
+            self.values, self.counts = values, counts.astype(np.int64)
+            return self
+        values = np.concatenate([self.values, values])
+        counts = np.concatenate([self.counts, counts])
+        self.values, inverse = np.unique(values, return_inverse=True)
+        self.counts = np.zeros(len(self.values), dtype=np.int64)
+        np.add.at(self.counts, inverse, counts)
+        return self
+
+    def __add__(self, other):
+        result = LengthHistogram(self.values, self.counts)
+        return result.update(other.values, counts=other.counts)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def _get_total(self):
+        return (self.values * self.counts).sum()
+    total = property(_get_total, doc="sum of all lengths")
+
+    def N50(self):
+        """Return the N50 (see :func:`N50`)"""
+        return N50(self.values, counts=self.counts)
+
+    def L50(self):
+        """Return the L50 (see :func:`L50`)"""
+        return L50(self.values, counts=self.counts)
+
+    def evenness(self):
+        """Return the evenness (see :func:`evenness`)"""
+        return evenness(self.values, counts=self.counts)
+
+    def get_stats(self):
+        """Return number of items, total, mean, min, max, N50 and L50"""
+        if len(self) == 0:
+            return {"N": 0, "total_length": 0}
+        return {"N": len(self), "total_length": self.total,
+                "mean_length": self.total / len(self),
+                "min_length": self.values[0], "max_length": self.values[-1],
+                "N50": self.N50(), "L50": self.L50()}
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Strandness of RNA-seq data sets
+
+The strand of the reads is compared to the strand of the genes they overlap.
+For a strand-specific protocol, most reads are explained by one combination
+(e.g. reads on the same strand as the gene) whereas both combinations are
+equally likely for a non strand-specific protocol (see also
+:meth:`sequana.bamtools.SAMBAMbase.infer_strandness`).
+
+The genes are indexed once and can be used for all samples of a project::
+
+    from sequana.strandness import infer_strandness
+    df = infer_strandness(["A.bam", "B.bam"], "genes.bed", jobs=4)
+
+"""
+import pysam
+
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana.bamtools import get_regions
+from sequana.bed import merge_intervals
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["GeneStrandIndex", "StrandnessCounts", "get_strandness_counts",
+           "infer_strandness"]
+
+
+# strand of the genes overlapping a read (bit field)
+NONE, PLUS, MINUS, BOTH = 0, 1, 2, 3
+
+
+class GeneStrandIndex(object):
+    """Index of the strand of genes for fast overlap queries
+
+    ::
+
+        from sequana import sequana_data
+        from sequana.strandness import GeneStrandIndex
+        index = GeneStrandIndex(sequana_data("hg38_chr18.bed"))
+        index.query("chr18", [7567400], [7567500])
+
+    For each contig, the genes of each strand are merged into disjoint
+    sorted intervals so that an overlap query is two binary searches. Queries
+    are made for arrays of reads at once.
+
+    The annotation is read with :class:`~sequana.bed.BED` or
+    :class:`~sequana.gff3.GFF3`; with *cache* set to True, their columnar
+    table is saved in a sidecar file and the index of the same annotation is
+    built again without parsing the file.
+
+    """
+    def __init__(self, filename, cache=False):
+        """.. rubric:: constructor
+
+        :param filename: a BED file (columns 1, 2, 3 and 6 are used) or a
+            GFF file (features of type gene only; columns 1, 4, 5 and 7)
+        :param cache: use the sidecar file of the annotation table (see
+            :meth:`sequana.bed.BED.get_table`)
+        """
+        self.filename = filename
+        self._index = {}
+        if filename.endswith(".bed"):
+            self._read_bed(filename, cache)
+        elif filename.endswith((".gff", ".gff3")):
+            self._read_gff(filename, cache)
+        else:
+            raise ValueError("reference must be a BED or GFF file (.bed, .gff)")
+
+    def _add(self, chrom, starts, ends, strands):
+        strands = np.asarray(strands).astype(str)
+        self._index[chrom] = tuple(
+            merge_intervals(starts[strands == strand], ends[strands == strand])
+            for strand in "+-")
+
+    def _read_bed(self, filename, cache):
+        from sequana.bed import BED
+        bed = BED(filename)
+        df = bed.get_table(cache=cache)
+        if bed._invalid:
+            # not a 12-column BED file (e.g. 6 columns)
+            self._read_bed_lines(filename)
+            return
+        strands = df["strand"].values
+        for chrom, (starts, ends, rows) in bed.get_sorted_transcripts().items():
+            self._add(chrom, starts, ends, strands[rows])
+
+    def _read_bed_lines(self, filename):
+        data = {}
+        with open(filename, "r") as fin:
+            for i, line in enumerate(fin):
+                if line.startswith(("#", "track", "browser")):
+                    continue
+                fields = line.split()
+                if len(fields) == 0:
+                    continue
+                if len(fields) < 6:
+                    logger.warning("invalid format on line {}: {}".format(i + 1, line))
+                    continue
+                data.setdefault(fields[0], []).append(
+                    (int(fields[1]), int(fields[2]), fields[5]))
+
+        for chrom, genes in data.items():
+            self._add(chrom, np.array([x[0] for x in genes], dtype=np.int64),
+                      np.array([x[1] for x in genes], dtype=np.int64),
+                      [x[2] for x in genes])
+
+    def _read_gff(self, filename, cache):
+        from sequana.gff3 import GFF3
+        df = GFF3(filename).get_table(cache=cache)
+        df = df[df["type"] == "gene"]
+        starts, ends = df["start"].values, df["stop"].values
+        strands = df["strand"].values
+        for chrom, rows in df.groupby(df["seqid"].astype(str)).indices.items():
+            self._add(chrom, starts[rows], ends[rows], strands[rows])
+
+    def _get_contigs(self):
+        return sorted(self._index.keys())
+    contigs = property(_get_contigs, doc="list of indexed contigs")
+
+    def _overlap(self, intervals, starts, ends):
+        # intervals are disjoint and sorted; the last one starting before the
+        # end of the query is the only candidate (ends are sorted too)
+        istarts, iends = intervals
+        if len(istarts) == 0:
+            return np.zeros(len(starts), dtype=bool)
+        i = np.searchsorted(istarts, ends, side="left") - 1
+        return (i >= 0) & (iends[np.maximum(i, 0)] > starts)
+
+    def query(self, chrom, starts, ends):
+        """Return the strand of the genes overlapping intervals
+
+        :param str chrom: the contig name
+        :param starts: array of start positions (included)
+        :param ends: array of end positions (excluded)
+        :return: array with :data:`NONE` (0) if no gene overlaps the
+            interval, :data:`PLUS` (1) or :data:`MINUS` (2) if all genes are
+            on the same strand and :data:`BOTH` (3) otherwise.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if chrom not in self._index:
+            return np.zeros(len(starts), dtype=np.int8)
+        plus, minus = self._index[chrom]
+        return (self._overlap(plus, starts, ends) * PLUS +
+                self._overlap(minus, starts, ends) * MINUS).astype(np.int8)
+
+
+class StrandnessCounts(object):
+    """Count of reads for each combination of read and gene strands
+
+    The *paired* counts are stored in a 2x2x2 array (read 1/2, read strand
+    +/-, gene strand +/-) and the *single* counts in a 2x2 array (read
+    strand, gene strand). Reads overlapping genes on both strands are counted
+    as *undetermined*.
+    """
+    def __init__(self):
+        self.paired = np.zeros((2, 2, 2), dtype=np.int64)
+        self.single = np.zeros((2, 2), dtype=np.int64)
+        self.undetermined = np.zeros(2, dtype=np.int64)
+
+    def __add__(self, other):
+        counts = StrandnessCounts()
+        counts.paired = self.paired + other.paired
+        counts.single = self.single + other.single
+        counts.undetermined = self.undetermined + other.undetermined
+        return counts
+
+    def __len__(self):
+        return int(self.paired.sum() + self.single.sum() + self.undetermined.sum())
+
+    def add(self, paired, read2, reverse, genes):
+        """Add reads (boolean arrays and gene strands from :meth:`GeneStrandIndex.query`)"""
+        found = genes != NONE
+        paired, read2, reverse, genes = (paired[found], read2[found],
+                                         reverse[found], genes[found])
+        both = genes == BOTH
+        self.undetermined += np.bincount(paired[both].astype(int), minlength=2)
+        # 0 for genes on + strand, 1 for genes on - strand
+        gene = (genes == MINUS).astype(int)
+        read = reverse.astype(int)
+        keep = ~both & paired
+        np.add.at(self.paired, (read2[keep].astype(int), read[keep], gene[keep]), 1)
+        keep = ~both & ~paired
+        np.add.at(self.single, (read[keep], gene[keep]), 1)
+
+    def get_strandness(self):
+        """Return protocol and fractions of reads explained by the strandness
+
+        :return: list with the protocol (Paired-end, Singled-end or Mixture),
+            the fraction of reads explained by "1++,1--,2+-,2-+" (or "++,--"
+            for single-end data), the fraction explained by "1+-,1-+,2++,2--"
+            (or "+-,-+") and the fraction that could not be explained.
+        """
+        npaired = self.paired.sum() + self.undetermined[1]
+        nsingle = self.single.sum() + self.undetermined[0]
+        if npaired > 0 and nsingle == 0:
+            P = self.paired
+            spec1 = (P[0, 0, 0] + P[0, 1, 1] + P[1, 0, 1] + P[1, 1, 0]) / float(npaired)
+            spec2 = (P[0, 0, 1] + P[0, 1, 0] + P[1, 0, 0] + P[1, 1, 1]) / float(npaired)
+            return ["Paired-end", float(spec1), float(spec2), float(1 - spec1 - spec2)]
+        elif nsingle > 0 and npaired == 0:
+            S = self.single
+            spec1 = (S[0, 0] + S[1, 1]) / float(nsingle)
+            spec2 = (S[0, 1] + S[1, 0]) / float(nsingle)
+            return ["Singled-end", float(spec1), float(spec2), float(1 - spec1 - spec2)]
+        return ["Mixture", "NA", "NA", "NA"]
+
+
+def _collect(alignments, names, index, counts, mapq, quota, start=None, end=None):
+    # add the alignments that pass the filters to the counts and return the
+    # number of reads overlapping a gene. Strands of genes are queried by
+    # batches of reads.
+    data = {"tid": [], "start": [], "end": [], "paired": [], "read2": [],
+            "reverse": []}
+
+    def flush():
+        tids = np.array(data["tid"], dtype=np.int64)
+        starts = np.array(data["start"], dtype=np.int64)
+        ends = np.array(data["end"], dtype=np.int64)
+        genes = np.zeros(len(tids), dtype=np.int8)
+        for tid in np.unique(tids):
+            rows = tids == tid
+            genes[rows] = index.query(names[tid], starts[rows], ends[rows])
+        counts.add(np.array(data["paired"], dtype=bool),
+                   np.array(data["read2"], dtype=bool),
+                   np.array(data["reverse"], dtype=bool), genes)
+        for values in data.values():
+            del values[:]
+        return int((genes != NONE).sum())
+
+    used = 0
+    for aln in alignments:
+        if aln.is_qcfail or aln.is_duplicate or aln.is_secondary or \
+                aln.is_unmapped or aln.mapping_quality < mapq:
+            continue
+        # with fetch(), reads starting before the region are also returned
+        if start is not None and aln.reference_start < start:
+            continue
+        if end is not None and aln.reference_start >= end:
+            break
+        data["tid"].append(aln.reference_id)
+        data["start"].append(aln.reference_start)
+        # the aligned length of the read is used (not the reference span)
+        data["end"].append(aln.reference_start + aln.query_alignment_length)
+        data["paired"].append(aln.is_paired)
+        data["read2"].append(aln.is_read2)
+        data["reverse"].append(aln.is_reverse)
+        # the number of reads overlapping genes is only known after the
+        # queries; use small batches close to the quota
+        if len(data["tid"]) >= min(10000, max(100, quota - used)):
+            used += flush()
+            if used >= quota:
+                return used
+    if data["tid"]:
+        used += flush()
+    return used
+
+
+def get_strandness_counts(filename, index, max_entries=200000, mapq=30,
+                          n_regions=100):
+    """Return the :class:`StrandnessCounts` of a BAM file
+
+    If the BAM file is indexed, reads are sampled over *n_regions* regions
+    spread over the genome (proportionally to the number of mapped reads of
+    each contig) using random access. Otherwise, the first reads of the file
+    are used.
+
+    :param index: a :class:`GeneStrandIndex`
+    :param int max_entries: approximate number of reads overlapping genes
+        to use
+    """
+    counts = StrandnessCounts()
+    with pysam.AlignmentFile(filename) as bam:
+        names = bam.references
+        if bam.has_index():
+            regions = get_regions(bam, n_regions)
+            quota = max(1, max_entries // max(1, len(regions)))
+            for contig, start, end in regions:
+                _collect(bam.fetch(contig, start, end), names, index, counts,
+                         mapq, quota, start=start, end=end)
+        else:
+            logger.warning("{} is not indexed. Reads are taken from the start "
+                           "of the file".format(filename))
+            _collect(bam, names, index, counts, mapq, max_entries)
+    return counts
+
+
+def _get_strandness(args):
+    # used by the pool of processes of infer_strandness
+    filename, index, kwargs = args
+    return get_strandness_counts(filename, index, **kwargs).get_strandness()
+
+
+def infer_strandness(filenames, reference, max_entries=200000, mapq=30,
+                     n_regions=100, jobs=1, tolerance=0.1, cache=False):
+    """Return the strandness of several BAM files
+
+    :param list filenames: BAM files (e.g. one per sample)
+    :param reference: a BED/GFF file or a :class:`GeneStrandIndex`. The
+        index is built once and shared by all BAM files.
+    :param int jobs: number of BAM files processed at the same time
+    :param float tolerance: used to guess the strand of each sample
+    :param cache: use the sidecar file of the annotation (see
+        :class:`GeneStrandIndex`)
+    :return: a dataframe with one row per BAM file and the protocol, the
+        fractions of reads explained by each strandness (see
+        :meth:`StrandnessCounts.get_strandness`), and the guessed strand in
+        the featureCounts convention: 0 (unstranded), 1 (stranded), 2
+        (reversely stranded) or None if undecided.
+    """
+    if isinstance(reference, GeneStrandIndex):
+        index = reference
+    else:
+        index = GeneStrandIndex(reference, cache=cache)
+    kwargs = {"max_entries": max_entries, "mapq": mapq, "n_regions": n_regions}
+    tasks = [(filename, index, kwargs) for filename in filenames]
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(_get_strandness, tasks))
+    else:
+        results = [_get_strandness(task) for task in tasks]
+
+    df = pd.DataFrame(results, index=filenames,
+                      columns=["protocol", "strand_1", "strand_2", "undetermined"])
+    strands = []
+    for value in df["strand_1"]:
+        if value == "NA":
+            strands.append(None)
+        elif value > 1 - tolerance:
+            strands.append(1)
+        elif value < tolerance:
+            strands.append(2)
+        elif 0.5 - tolerance < value < 0.5 + tolerance:
+            strands.append(0)
+        else:
+            strands.append(None)
+    df["strand"] = strands
+    return df
@@ -17,8 +17,10 @@
 
 import os
 import re
+from collections import Counter
 from sequana import sequana_config_path
-import pandas as pd
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
 from sequana import logger
 from functools import wraps
 logger.name = __name__
@@ -28,6 +30,10 @@ from easydev import TempFile
 __all__ = ['NCBITaxonomy', 'Taxonomy']
 
 
+# number of records written at once in the flat files
+CHUNK_SIZE = 500000
+
+
 class NCBITaxonomy():
     """
 
@@ -54,7 +60,7 @@ class NCBITaxonomy():
                 wget(nodes, fout_nodes.name)
                 self.df_nodes = pd.read_csv(fout_nodes.name, sep="|", header=None)
         for i, _type in enumerate(self.df_nodes.dtypes):
-            if _type == "O":
+            if not pd.api.types.is_numeric_dtype(_type):
                 self.df_nodes[i] = self.df_nodes[i].str.strip('\t')
         """
         tax_id                  -- node id in GenBank taxonomy database
@@ -95,42 +101,130 @@ class NCBITaxonomy():
                 self.df_names = pd.read_csv(fout_names.name, sep="|", header=None)
 
         for i, _type in enumerate(self.df_names.dtypes):
-            if _type == "O":
+            if not pd.api.types.is_numeric_dtype(_type):
                 self.df_names[i] = self.df_names[i].str.strip('\t')
         del self.df_names[4]
         self.df_names.columns = ['taxid', 'name', 'unique_name', 'key']
         self.df_names.set_index("taxid", inplace=True)
 
     def create_taxonomy_file(self, filename="taxonomy.dat"):
-        logger.info("Please wait while creating the output file. "
-            "This may take a few minutes")
-        from easydev import Progress
-        pb = Progress(len(self.df_nodes))
-        count = 0
-        df_names = self.df_names.query("key == 'scientific name'").copy()
+        """Save the nodes and their scientific names in a flat file
+
+        The nodes are joined with their scientific names in one go and
+        written by chunks (see :meth:`Taxonomy.load_records` for the format).
+        """
+        logger.info("Please wait while creating the output file. ")
+        df_names = self.df_names.query("key == 'scientific name'")
+        df_names = df_names[~df_names.index.duplicated()]
+        df = self.df_nodes[["parent", "rank"]].join(df_names["name"])
+        df["name"] = df["name"].fillna("")
         with open(filename, "w") as fout:
+            for i in range(0, len(df), CHUNK_SIZE):
+                chunk = df.iloc[i:i + CHUNK_SIZE]
+                fout.write(_format_records(chunk.index, chunk["parent"],
+                           chunk["rank"], chunk["name"]))
+
+
+def _format_records(ids, parents, ranks, names):
+    # flat file records of several taxons in a single string
+    records = ("{:26s}: ".format("ID") + pd.Series(ids).astype(str).values +
+        "\n{:26s}: ".format("PARENT ID") + pd.Series(parents).astype(str).values +
+        "\n{:26s}: ".format("RANK") + pd.Series(ranks).astype(str).values +
+        "\n{:26s}: ".format("SCIENTIFIC NAME") + pd.Series(names).astype(str).values +
+        "\n//\n")
+    return "".join(records)
 
-            for taxid in self.df_nodes.index:
-                row = self.df_nodes.loc[taxid]
-                fout.write("ID                        : {}\n".format(taxid))
-                fout.write("PARENT ID                 : {}\n".format(row.parent))
-                fout.write("RANK                      : {}\n".format(row['rank']))
-
-                #names = df_names.loc[taxid]
-                #print(
-                fout.write("{:26s}: {}\n".format("SCIENTIFIC NAME", df_names.loc[taxid, "name"]))
-                """    len(names)
-                    for k,v in zip(names['key'], names['name']):
-                        if k.upper() in ['SCIENTIFIC NAME', 'SYNONYM']:
-                            fout.write("{:26s}: {}\n".format(k.upper(), v))
-                except:
-                    k, v = names['key'], names['name']
-                    fout.write("{:26s}: {}\n".format(k.upper(), v))
-                """
-                fout.write("//\n")
-                count += 1
-                pb.animate(count)
 
+class TaxonRecords(object):
+    """Taxon records of a :class:`Taxonomy` stored as columns
+
+    This is a read-only mapping between taxon identifiers and records. The
+    identifiers, parents, ranks and scientific names are stored in arrays
+    (sorted by identifier) and the record of a taxon is a dictionary created
+    on demand with the keys id, parent, rank and scientific_name::
+
+        records = TaxonRecords([1, 2], [1, 131567], ["no rank", "superkingdom"],
+                               ["root", "Bacteria"])
+        records[2]["scientific_name"]
+
+    """
+    def __init__(self, ids, parents, ranks, names):
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="mergesort")
+        self.ids = ids[order]
+        self.parents = np.asarray(parents, dtype=np.int64)[order]
+        # few distinct ranks; stored once and referred to by their code
+        labels = {}
+        codes = [labels.setdefault(rank, len(labels)) for rank in ranks]
+        self.rank_labels = np.array(list(labels), dtype=object)
+        self.rank_codes = np.array(codes, dtype=np.int16)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+
+    def _get_ranks(self):
+        return self.rank_labels[self.rank_codes]
+    ranks = property(_get_ranks, doc="rank of each taxon")
+
+    def get_rank_mask(self, rank):
+        """Return a boolean array selecting the taxons of a given rank"""
+        codes = np.nonzero(self.rank_labels == rank)[0]
+        if len(codes) == 0:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self.rank_codes == codes[0]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _get_position(self, taxid):
+        try:
+            taxid = int(taxid)
+        except (TypeError, ValueError):
+            return None
+        i = np.searchsorted(self.ids, taxid)
+        if i < len(self.ids) and self.ids[i] == taxid:
+            return i
+        return None
+
+    def __contains__(self, taxid):
+        return self._get_position(taxid) is not None
+
+    def __getitem__(self, taxid):
+        i = self._get_position(taxid)
+        if i is None:
+            raise KeyError(taxid)
+        return {"id": int(self.ids[i]), "parent": int(self.parents[i]),
+                "rank": self.rank_labels[self.rank_codes[i]],
+                "scientific_name": self.names[i]}
+
+    def get(self, taxid, default=None):
+        try:
+            return self[taxid]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return (int(x) for x in self.ids)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (self[x] for x in self.ids)
+
+    def items(self):
+        return ((int(x), self[x]) for x in self.ids)
+
+    def to_flat_file(self, filename, taxons=None, mode="w"):
+        """Save the records (or a subset of taxons) in the flat file format"""
+        if taxons is None:
+            selection = np.arange(len(self.ids))
+        else:
+            selection = np.searchsorted(self.ids, np.asarray(taxons, dtype=np.int64))
+        with open(filename, mode) as fout:
+            for i in range(0, len(selection), CHUNK_SIZE):
+                rows = selection[i:i + CHUNK_SIZE]
+                fout.write(_format_records(self.ids[rows], self.parents[rows],
+                           self.rank_labels[self.rank_codes[rows]],
+                           self.names[rows]))
 
 
 def load_taxons(f):
@@ -274,6 +368,8 @@ class Taxonomy(object):
 
         ftp://ncbi.nlm.nih.gov/pub/taxonomy/
 
+        Records are parsed in a single pass and stored as columns in a
+        :class:`TaxonRecords` (the raw text of the records is not kept).
         """
         self.download_taxonomic_file(overwrite=overwrite)
         self.records = {}
@@ -283,32 +379,20 @@ class Taxonomy(object):
             self.load()
 
         with open(self.database) as f:
-            data = f.read().strip()
-
-        # This is fast. tried parse package, much slower. cost of progress bar
-        # is not important. 
-        data = data.split("//\n") # the sep is //\n
-        self._child_match = re.compile(r'ID\s+\:\s*(\d+)\s*')
-        self._parent_match = re.compile(r'PARENT ID\s+\:\s*(\d+)\s*')
-        self._rank_match = re.compile(r'RANK\s+\:\s*([^\n]+)\s*')
-        self._name_match = re.compile(r'SCIENTIFIC NAME\s+\:\s*([^\n]+)\s*')
-
-        from easydev import Progress
-        pb = Progress(len(data))
+            data = f.read()
 
+        # All records are parsed at once. Other fields (e.g. GC ID in the EBI
+        # flat file) may be found between the rank and the scientific name
         logger.info('Loading all taxon records.')
-        for i, record in enumerate(data[0:]):
-            dd = {'raw': record}
-            dd['id'] = int(self._child_match.search(record).group(1))
-            dd['parent'] = int(self._parent_match.search(record).group(1))
-            dd['scientific_name'] = self._name_match.search(record).group(1)
-            dd['rank'] = self._rank_match.search(record).group(1)
-            self.records[dd["id"]] = dd
-            if self.verbose:
-                pb.animate(i+1)
-        if self.verbose:
-            print()
-           
+        records = re.findall(r"^ID[ \t]*:[ \t]*(\d+)[ \t]*\n"
+            r"PARENT ID[ \t]*:[ \t]*(\d+)[ \t]*\n"
+            r"RANK[ \t]*:[ \t]*([^\n]*)\n(?:(?!//)[^\n]*\n)*?"
+            r"SCIENTIFIC NAME[ \t]*:[ \t]*([^\n]*)$", data, re.MULTILINE)
+        del data
+        ids, parents, ranks, names = zip(*records) if records else ([],) * 4
+        del records
+        self.records = TaxonRecords(np.array(ids, dtype=np.int64),
+            np.array(parents, dtype=np.int64), ranks, names)
 
     def find_taxon(self, taxid, mode="ncbi"):
         taxid = str(taxid)
@@ -438,24 +522,23 @@ class Taxonomy(object):
 
     @load_taxons
     def get_ranks(self):
-        return  Counter([x['rank'] for x in self.records.values()])
+        counts = np.bincount(self.records.rank_codes,
+                             minlength=len(self.records.rank_labels))
+        return Counter(dict(zip(self.records.rank_labels, counts.tolist())))
 
     @load_taxons
     def get_record_for_given_rank(self, rank):
-        return [x for x in self.records.values() if x['rank'] == rank]
+        ids = self.records.ids[self.records.get_rank_mask(rank)]
+        return [self.records[x] for x in ids]
 
     @load_taxons
     def get_names_for_given_rank(self, rank):
-        data = [x for x in self.records.values() if x['rank'] == rank]
-        return [x['scientific_name'] for x in data]
+        return list(self.records.names[self.records.get_rank_mask(rank)])
 
     @load_taxons
     def get_children(self, taxon):
-        taxon = str(taxon)
-        children = [self.records[k] for k in self.records.keys()
-                if self.records[k]['parent'] == taxon]
-        children = [child['id'] for child in children]
-        return children
+        children = self.records.ids[self.records.parents == int(taxon)]
+        return [int(x) for x in children if x != int(taxon)]
 
     @load_taxons
     def get_family_tree(self, taxon):
@@ -475,7 +558,7 @@ class Taxonomy(object):
         return self.records[iden]
 
     @load_taxons
-    def __getitem__(self, iden):
+    def __len__(self):
         return len(self.records)
 
     def append_existing_database(self, filename):
@@ -495,14 +578,8 @@ class Taxonomy(object):
             tax = Taxonomy()
             tax.append_existing_database("taxonomy.dat")
         """
-        tax = Taxonomy(filename)
+        tax = Taxonomy(filename, online=False)
         tax.load_records()
         self.load_records()
-        toadd = []
-        for record in tax.records.keys():
-            if record not in self.records:
-                toadd.append(record)
-
-        with open(self.database, "a") as fout:
-            for record in toadd:
-                fout.write(tax.records[record]['raw']+"//\n")
+        toadd = np.setdiff1d(tax.records.ids, self.records.ids)
+        tax.records.to_flat_file(self.database, taxons=toadd, mode="a")
@@ -14,17 +14,197 @@
 #  documentation: http://sequana.readthedocs.io
 #
 ##############################################################################
-import pandas as pd
-
-
+import os
 
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
 from sequana.lazy import pylab
 from sequana import logger
 
 logger.name = __name__
 
 
-__all__ = ["TRF"]
+__all__ = ["TRF", "read_trf", "trf_to_parquet"]
+
+
+COLUMNS = ['sequence_name', 'start', 'end', 'period_size', 'CNV',
+    'size_consensus', 'percent_matches', 'percent_indels', 'score', 'A', 'C',
+    'G', 'T', 'entropy', 'seq1', 'seq2']
+
+# types of the 15 columns of the data lines
+_DTYPES = [np.int64, np.int64, np.int64] + [float] * 10 + [object, object]
+
+
+def _get_blocks(filename, N):
+    # split a file into about N blocks of bytes that start with a
+    # "Sequence:" line (or the start of the file)
+    size = os.path.getsize(filename)
+    starts = [0]
+    with open(filename, "rb") as fin:
+        for i in range(1, N):
+            position = max(size * i // N, starts[-1])
+            fin.seek(position)
+            if position:
+                fin.readline()
+            while True:
+                position = fin.tell()
+                line = fin.readline()
+                if not line or line.startswith(b"Sequence:"):
+                    break
+            if position > starts[-1] and position < size:
+                starts.append(position)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _read_lines(filename, start=0, end=None):
+    # lines of a block of bytes of a file; a block starts at the beginning
+    # of a line
+    if start == 0 and end is None:
+        with open(filename, "r") as fin:
+            for line in fin:
+                yield line
+        return
+    with open(filename, "rb") as fin:
+        fin.seek(start)
+        position = start
+        for line in fin:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line.decode()
+
+
+def _to_frame(rows, names, motifs=None, period_size=None, min_cnv=None):
+    # typed dataframe of a list of rows (filtered)
+    columns = list(zip(*rows)) if rows else [()] * 15
+    data = {"sequence_name": pd.Categorical(names)}
+    for name, dtype, values in zip(COLUMNS[1:], _DTYPES, columns):
+        data[name] = np.array(values, dtype=dtype)
+    df = pd.DataFrame(data, columns=COLUMNS)
+    # the period size is stored as float for back compatibility
+    df["period_size"] = df["period_size"].astype(float)
+    df["length"] = df["end"] - df["start"] + 1
+
+    keep = np.ones(len(df), dtype=bool)
+    if motifs is not None:
+        keep &= df["seq1"].isin(motifs).values
+    if period_size is not None:
+        keep &= df["period_size"].isin(np.atleast_1d(period_size)).values
+    if min_cnv is not None:
+        keep &= (df["CNV"] >= min_cnv).values
+    if not keep.all():
+        df = df[keep].reset_index(drop=True)
+        df["sequence_name"] = df["sequence_name"].cat.remove_unused_categories()
+    return df
+
+
+def _read_trf(lines, chunksize=100000, max_seq_length=20, motifs=None,
+              period_size=None, min_cnv=None):
+    rows = []
+    names = []
+    sequence_name = None
+    count = 0
+    empty = True
+    for line in lines:
+        if line.startswith('Sequence:'):
+            sequence_name = line.split()[1].strip()
+            count += 1
+            if count % 100000 == 0:
+                logger.info("scanned {} sequences".format(count))
+            continue
+        this_data = line.split()
+        # headers (of concatenated files) and parameters are ignored
+        if len(this_data) == 15 and sequence_name is not None:
+            this_data[14] = this_data[14][0:max_seq_length]
+            rows.append(this_data)
+            names.append(sequence_name)
+            if len(rows) == chunksize:
+                yield _to_frame(rows, names, motifs, period_size, min_cnv)
+                rows = []
+                names = []
+                empty = False
+    # at least one (possibly empty) chunk
+    if rows or empty:
+        yield _to_frame(rows, names, motifs, period_size, min_cnv)
+
+
+def read_trf(filename, chunksize=100000, max_seq_length=20, motifs=None,
+             period_size=None, min_cnv=None, start=0, end=None):
+    """Read the output of TRF by chunks of typed dataframes
+
+    ::
+
+        from sequana import sequana_data
+        from sequana.trf import read_trf
+        for df in read_trf(sequana_data("test_trf1.dat"), chunksize=1000):
+            print(len(df))
+
+    The file is read line by line. Each chunk has the columns described in
+    :meth:`TRF.scandata`; sequence names are categorical and the second
+    sequence is truncated to *max_seq_length* characters.
+
+    :param int chunksize: number of repeats per chunk (before filtering)
+    :param list motifs: keep only the repeats whose consensus pattern (seq1)
+        is in this list
+    :param period_size: keep only the repeats with that period size (or a
+        list of period sizes)
+    :param float min_cnv: keep only the repeats with at least this copy number
+    :param int start: read the file from this byte (beginning of a line)
+    :param int end: stop reading the file at this byte
+    """
+    lines = _read_lines(filename, start, end)
+    return _read_trf(lines, chunksize=chunksize, max_seq_length=max_seq_length,
+        motifs=motifs, period_size=period_size, min_cnv=min_cnv)
+
+
+def _concat(chunks):
+    # concatenate chunks keeping the sequence names categorical
+    from pandas.api.types import union_categoricals
+    chunks = list(chunks)
+    chunks = [x for x in chunks if len(x)] or chunks[:1]
+    if len(chunks) == 1:
+        return chunks[0]
+    names = union_categoricals([x["sequence_name"] for x in chunks])
+    df = pd.concat([x.drop(columns="sequence_name") for x in chunks],
+                   ignore_index=True)
+    df.insert(0, "sequence_name", names)
+    return df
+
+
+def _read_block(args):
+    # used by the pool of processes of TRF.scandata
+    filename, start, end, kwargs = args
+    return _concat(read_trf(filename, start=start, end=end, **kwargs))
+
+
+def trf_to_parquet(filename, output, chunksize=1000000, **kwargs):
+    """Convert the output of TRF into a Parquet file (requires pyarrow)
+
+    Repeats are written by chunks (see :func:`read_trf` for the parameters)
+    so that files of any size can be converted. The Parquet file can be
+    loaded with :class:`TRF`.
+
+    :return: number of repeats written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    N = 0
+    try:
+        for df in read_trf(filename, chunksize=chunksize, **kwargs):
+            df["sequence_name"] = df["sequence_name"].astype(str).astype(object)
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                writer = pq.ParquetWriter(output, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=writer.schema,
+                                             preserve_index=False)
+            writer.write_table(table)
+            N += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return N
 
 
 class TRF():   # pragma: no cover
@@ -56,12 +236,29 @@ class TRF():   # pragma: no cover
         query = "length>100 and period_size==3 and entropy>0 and C>20 and A>20 and G>20"
         t.df.query(query)
 
+    Large outputs (e.g. a whole genome) are read by chunks and can be filtered
+    while reading (see :meth:`scandata`). Outputs of several sequences
+    concatenated in a single file can be read in parallel using *jobs*. The
+    dataframe can be converted once in a Parquet file (see
+    :func:`trf_to_parquet`) that is loaded much faster.
+
     """
-    def __init__(self, filename, verbose=False):
+    def __init__(self, filename, verbose=False, jobs=1, **kwargs):
+        """.. rubric:: constructor
+
+        :param str filename: output of TRF, a Parquet file (.parquet) or a
+            CSV file saved from :attr:`df`
+        :param int jobs: number of blocks of the file read in parallel
+        :param kwargs: filters of :meth:`scandata`
+        """
         self.filename = filename
+        if filename.endswith(".parquet"):
+            self.df = pd.read_parquet(filename)
+            self.df["sequence_name"] = self.df["sequence_name"].astype("category")
+            return
         try:
             # input can be the output of TRF or our trf dataframe
-            self.df = self.scandata(verbose=verbose)
+            self.df = self.scandata(verbose=verbose, jobs=jobs, **kwargs)
         except:
             self.df = pd.read_csv(filename)
 
@@ -71,7 +268,8 @@ class TRF():   # pragma: no cover
         msg += "Number of entries: {}".format(len(self.df))
         return msg
 
-    def scandata(self, verbose=True, max_seq_length=20):
+    def scandata(self, verbose=True, max_seq_length=20, jobs=1, motifs=None,
+                 period_size=None, min_cnv=None, chunksize=100000):
         """scan output of trf and returns a dataframe
 
         The format of the output file looks like::
@@ -96,58 +294,32 @@ class TRF():   # pragma: no cover
         The dataframe stores a row for each sequence and each pattern found. For
         instance, from the example above you will obtain 3 rows, two for the
         first sequence, and one for the second sequence.
+
+        Repeats are read by chunks and the sequence names are stored as
+        categories. Repeats can be filtered while reading with the
+        *motifs*, *period_size* and *min_cnv* parameters (see
+        :func:`read_trf`). With *jobs* > 1, the file is split into blocks of
+        sequences read in a pool of processes.
         """
-        fin = open(self.filename, "r")
-
-        data = []
-
-        sequence_name = None
-        # skip lines until we reach "Sequence"
-        while sequence_name is None:
-            line = fin.readline()
-            if line.startswith("Sequence:"):
-                sequence_name = line.split()[1].strip()
-
-        # now we read the rest of the file
-        count = 0
-        # If we concatenate several files, we also want to ignore the header
-        for line in fin.readlines():
-            if line.startswith('Sequence:'):
-                sequence_name = line.split()[1].strip()
-                count += 1
-                if count % 100000 == 0:
-                    logger.info("scanned {} sequences".format(count))
-                #logger.info("scanned {} sequences".format(count))
-            else:
-                this_data = line.split()
-                if len(this_data) == 15:
-                    this_data[14] = this_data[14][0:max_seq_length]
-                    data.append([sequence_name] + this_data)
-        fin.close()
-
-        df = pd.DataFrame(data)
-        df.columns = ['sequence_name', 'start', 'end', 'period_size', 'CNV',
-            'size_consensus', 'percent_matches', 'percent_indels', 'score', 'A', 'C', 'G',
-            'T', 'entropy', 'seq1', 'seq2']
-
-        df = df.astype({"start": 'int64', "end": 'int64', "period_size": 'int64'})
-        df = df.astype({
-            'A': 'float',
-            'C': 'float',
-            'G': 'float',
-            'T': 'float',
-            'percent_matches': float,
-            'percent_indels': float,
-            'size_consensus': float,
-            'score': 'float',
-            'CNV': 'float',
-            'entropy': 'float',
-            'period_size': 'float'
-            })
-        df['length'] = df['end'] - df['start'] + 1
-
-
-        return df
+        kwargs = {"max_seq_length": max_seq_length, "motifs": motifs,
+                  "period_size": period_size, "min_cnv": min_cnv,
+                  "chunksize": chunksize}
+        with open(self.filename, "r") as fin:
+            # the output of trf starts with a header (or a sequence)
+            if "Tandem Repeats Finder" not in fin.readline():
+                fin.seek(0)
+                if fin.readline().startswith("Sequence:") is False:
+                    raise ValueError("{} is not a TRF output".format(self.filename))
+
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            blocks = [(self.filename, start, end, kwargs) for start, end in
+                      _get_blocks(self.filename, 4 * jobs)]
+            with ProcessPoolExecutor(jobs) as executor:
+                chunks = list(executor.map(_read_block, blocks))
+        else:
+            chunks = read_trf(self.filename, **kwargs)
+        return _concat(chunks)
 
     def hist_cnvs(self, bins=50, CNVmin=10, motif=['CAG', 'AGC', 'GCA'],
             color="r", log=True):
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2020 - Sequana Development Team
+#
+#  File author(s):
+#      Thomas Cokelaer <thomas.cokelaer@pasteur.fr>
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  website: https://github.com/sequana/sequana
+#  documentation: http://sequana.readthedocs.io
+#
+##############################################################################
+"""Batched and parallel filtering of VCF files
+
+Contrary to :mod:`sequana.vcf_filter` and :mod:`sequana.freebayes_vcf_filter`
+that filter one PyVCF record at a time, variants are read here by batches of
+lines and the filters are evaluated on whole columns (QUAL, INFO fields) with
+numpy.
+
+If the input VCF is compressed with bgzip and indexed with tabix, contigs are
+filtered in parallel. Otherwise, batches of lines are dispatched to the
+processes. In both cases, the output is written in the input order. If the
+output filename ends in .gz, it is compressed with bgzip.
+"""
+import os
+import io
+import re
+import csv
+import gzip
+import shutil
+import tempfile
+import multiprocessing
+
+from sequana.lazy import numpy as np
+from sequana.lazy import pandas as pd
+
+from sequana import logger
+logger.name = __name__
+
+
+__all__ = ["VCFBatchFilter"]
+
+
+class VCFBatchFilter(object):
+    """Filter VCF files by batches of variants, possibly in parallel
+
+    Filters follow the conventions of
+    :class:`~sequana.vcf_filter.VCF_mpileup_4dot1` (filter_dict and the DP4,
+    AF1, INDEL filters)::
+
+        from sequana.vcf_batch_filter import VCFBatchFilter
+        v = VCFBatchFilter("variants.vcf.gz")
+        v.filter_dict['QUAL'] = 50
+        v.filter_dict['INFO']['DP'] = "<30|>1000"
+        v.filter_dict['INFO']['DP4[2]'] = "<4"
+        v.apply_indel_filter = True
+        v.filter_vcf("output.vcf.gz", threads=8)
+
+    A filter on a INFO tag removes the variants that agree with the filter.
+    Variants where the tag is missing are kept.
+
+    Filters of :class:`~sequana.freebayes_vcf_filter.VCF_freebayes` can be
+    used as well by setting the :attr:`freebayes_params` attribute::
+
+        v.freebayes_params = {"freebayes_score": 200, "frequency": 0.8,
+            "min_depth": 10, "forward_depth": 3, "reverse_depth": 3,
+            "strand_ratio": 0.2}
+
+    Each filter is evaluated on arrays of QUAL, DP, allele frequency, strand
+    balance, etc. for *chunksize* variants at once. For bgzipped VCF files
+    indexed with tabix (.tbi file next to the VCF), each contig is filtered
+    in a separate process.
+    """
+    def __init__(self, filename, chunksize=100000):
+        """.. rubric:: constructor
+
+        :param str filename: a VCF file, compressed with bgzip or not.
+        :param int chunksize: number of variants evaluated at once.
+        """
+        if not os.path.exists(filename):
+            logger.error("FileNotFoundError: {} not found".format(filename))
+            raise FileNotFoundError(filename)
+        self.filename = filename
+        self.chunksize = chunksize
+
+        # same filters and defaults as in VCF_mpileup_4dot1
+        self.filter_dict = {"QUAL": -1, "INFO": {}}
+        self.apply_dp4_filter = False
+        self.apply_af1_filter = False
+        self.apply_indel_filter = False
+        self.dp4_minimum_depth = 4
+        self.dp4_minimum_depth_strand = 2
+        self.dp4_minimum_ratio = 0.75
+        self.minimum_af1 = 0.95
+
+        # same filters as VCF_freebayes.filters_params. None to ignore them
+        self.freebayes_params = None
+
+        self._header = None
+
+    def _is_indexed(self):
+        return self.filename.endswith(".gz") and \
+            os.path.exists(self.filename + ".tbi")
+    is_indexed = property(_is_indexed,
+        doc="True if the VCF is compressed with bgzip and indexed with tabix")
+
+    def _open(self):
+        if self.filename.endswith(".gz"):
+            return gzip.open(self.filename, "rt")
+        return open(self.filename, "r")
+
+    def _get_header(self):
+        if self._header is None:
+            header = []
+            with self._open() as fin:
+                for line in fin:
+                    if not line.startswith("#"):
+                        break
+                    header.append(line)
+            self._header = header
+        return self._header
+    header = property(_get_header, doc="list of header lines")
+
+    def _get_samples(self):
+        for line in self.header:
+            if line.startswith("#CHROM"):
+                return line.rstrip("\n").split("\t")[9:]
+        return []
+    samples = property(_get_samples, doc="list of samples")
+
+    def get_regions(self):
+        """Return the contigs found in the tabix index"""
+        import pysam
+        with pysam.TabixFile(self.filename) as tabix:
+            return list(tabix.contigs)
+
+    def filter_batch(self, lines):
+        """Return a boolean array, True for the lines to keep
+
+        :param list lines: list of VCF data lines (no header)
+        """
+        if len(lines) == 0:
+            return np.array([], dtype=bool)
+        df = pd.read_csv(io.StringIO("".join(lines)), sep="\t", header=None,
+            usecols=range(8), names=range(8), dtype=str,
+            quoting=csv.QUOTE_NONE, keep_default_na=False)
+        alt = df[4]
+        qual = pd.to_numeric(df[5], errors="coerce").values
+        info = df[7]
+        keep = np.ones(len(df), dtype=bool)
+        polymorphic = (alt.str.strip() != ".").values
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.filter_dict.get("QUAL", -1) != -1:
+                keep &= ~(qual < self.filter_dict["QUAL"])
+
+            if self.apply_indel_filter:
+                keep &= ~info.str.contains(r"(?:^|;)INDEL(?:;|$)").values
+
+            if self.apply_dp4_filter:
+                keep &= self._get_dp4_status(info, polymorphic)
+
+            if self.apply_af1_filter:
+                af1 = get_info(info, "AF1")
+                invalid = np.where(polymorphic, af1 < self.minimum_af1,
+                                   af1 > 1 - self.minimum_af1)
+                keep &= ~invalid
+
+            for key, value in self.filter_dict.get("INFO", {}).items():
+                if key.startswith("sum("):
+                    # e.g. sum(DP4[2],DP4[3]) or sum(DP4[2]+DP4[3])
+                    values = np.zeros(len(df))
+                    for name, index in re.findall(r"(\w+)\[(\d+)\]", key):
+                        values = values + get_info(info, name, int(index))
+                else:
+                    name, index = key, 0
+                    if "[" in key:
+                        if "]" not in key:
+                            raise ValueError("Found invalid filter %s" % key)
+                        name, index = key.split("[", 1)
+                        name = name.strip()
+                        index = int(index.replace("]", "").strip())
+                    values = get_info(info, name, index)
+                filtered = _compare(values, value)
+                # PV4 is not relevant for non polymorphic sites
+                if key == "PV4":
+                    filtered &= polymorphic
+                keep &= ~filtered
+
+            if self.freebayes_params:
+                keep &= self._get_freebayes_status(info, qual)
+        return keep
+
+    def _get_dp4_status(self, info, polymorphic):
+        # vectorised version of VCF_mpileup_4dot1.is_valid_dp4
+        dp4 = [get_info(info, "DP4", i) for i in range(4)]
+        ref_forward, ref_reverse, alt_forward, alt_reverse = dp4
+        forward = ref_forward + alt_forward
+        reverse = ref_reverse + alt_reverse
+
+        depth_forward = np.where(polymorphic, alt_forward, ref_forward)
+        depth_reverse = np.where(polymorphic, alt_reverse, ref_reverse)
+        ratio_forward = np.where(forward > 0, depth_forward / forward, 0)
+        ratio_reverse = np.where(reverse > 0, depth_reverse / reverse, 0)
+
+        valid = (depth_forward + depth_reverse >= self.dp4_minimum_depth) & \
+            (depth_forward >= self.dp4_minimum_depth_strand) & \
+            (depth_reverse >= self.dp4_minimum_depth_strand) & \
+            (ratio_forward >= self.dp4_minimum_ratio) & \
+            (ratio_reverse >= self.dp4_minimum_ratio)
+        # variants without DP4 are valid
+        return valid | np.isnan(ref_forward)
+
+    def _get_freebayes_status(self, info, qual):
+        # vectorised version of VCF_freebayes._filter_line
+        params = {"freebayes_score": 0, "frequency": 0, "min_depth": 0,
+            "forward_depth": 0, "reverse_depth": 0, "strand_ratio": 0}
+        params.update(self.freebayes_params)
+
+        depth = get_info(info, "DP")
+        keep = ~(qual < params["freebayes_score"])
+        keep &= ~(depth <= params["min_depth"])
+        if len(self.samples) > 1:
+            return keep
+
+        forward = get_info(info, "SRF") + _get_info_sum(info, "SAF")
+        reverse = get_info(info, "SRR") + _get_info_sum(info, "SAR")
+        keep &= ~(forward <= params["forward_depth"])
+        keep &= ~(reverse <= params["reverse_depth"])
+
+        frequency = get_info(info, "AO") / depth
+        keep &= ~(frequency < params["frequency"])
+
+        keep &= ~(strand_balance(get_info(info, "SAF"),
+                  get_info(info, "SAR")) < params["strand_ratio"])
+        return keep
+
+    def _filter_lines(self, lines, fout, fout_filtered=None):
+        keep = self.filter_batch(lines)
+        for line, status in zip(lines, keep):
+            if status:
+                fout.write(line)
+            elif fout_filtered:
+                fout_filtered.write(line)
+        return len(lines), int(keep.sum())
+
+    def filter_vcf(self, output, output_filtered=None, threads=1):
+        """Filter the VCF file and save the variants that pass the filters
+
+        :param str output: output VCF filename. Compressed with bgzip if the
+            extension is .gz
+        :param str output_filtered: if provided, filtered variants are
+            saved in this file.
+        :param int threads: number of processes
+        :return: a dictionary with the number of variants (N), the number of
+            filtered and unfiltered variants.
+        """
+        if self.is_indexed:
+            N, unfiltered = self._filter_regions(output, output_filtered,
+                                                 threads)
+        else:
+            if threads > 1:
+                logger.warning("{} is not indexed with tabix. Batches of "
+                    "variants will be filtered in parallel but read by a "
+                    "single process".format(self.filename))
+            N, unfiltered = self._filter_chunks(output, output_filtered,
+                                                threads)
+        return {"N": N, "filtered": N - unfiltered, "unfiltered": unfiltered}
+
+    def read_chunks(self):
+        """Yield lists of *chunksize* data lines (header excluded)"""
+        chunk = []
+        with self._open() as fin:
+            for line in fin:
+                if line.startswith("#") or not line.strip():
+                    continue
+                chunk.append(line if line.endswith("\n") else line + "\n")
+                if len(chunk) == self.chunksize:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def _filter_chunks(self, output, output_filtered, threads):
+        N = unfiltered = 0
+        fout = _Writer(output)
+        fout_filtered = _Writer(output_filtered) if output_filtered else None
+        for this in (fout, fout_filtered):
+            if this:
+                this.write("".join(self.header))
+
+        pool = multiprocessing.Pool(threads) if threads > 1 else None
+        try:
+            if pool:
+                chunks = pool.imap(_filter_chunk, ((self, x) for x in
+                                   self.read_chunks()))
+            else:
+                chunks = (_filter_chunk((self, x)) for x in self.read_chunks())
+            for lines, keep in chunks:
+                N += len(lines)
+                unfiltered += int(keep.sum())
+                for line, status in zip(lines, keep):
+                    if status:
+                        fout.write(line)
+                    elif fout_filtered:
+                        fout_filtered.write(line)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            fout.close()
+            if fout_filtered:
+                fout_filtered.close()
+        return N, unfiltered
+
+    def _filter_regions(self, output, output_filtered, threads):
+        regions = self.get_regions()
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output)))
+        try:
+            tasks = []
+            for i, region in enumerate(regions):
+                part = os.path.join(tmpdir, "{}.part".format(i))
+                part_filtered = part + ".filtered" if output_filtered else None
+                tasks.append((self, region, part, part_filtered,
+                              _is_bgzip(output)))
+
+            if threads > 1:
+                pool = multiprocessing.Pool(threads)
+                try:
+                    results = pool.map(_filter_region, tasks, chunksize=1)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [_filter_region(task) for task in tasks]
+
+            # Parts are compressed independently. BGZF blocks (or plain text)
+            # can be concatenated as is, in the order of the index
+            for filename, index in [(output, 2), (output_filtered, 3)]:
+                if filename is None:
+                    continue
+                with _Writer(filename) as fout:
+                    fout.write("".join(self.header))
+                with open(filename, "ab") as fout:
+                    for task in tasks:
+                        with open(task[index], "rb") as fin:
+                            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        N = sum(x[0] for x in results)
+        unfiltered = sum(x[1] for x in results)
+        return N, unfiltered
+
+
+class _Writer(object):
+    """Write text in a plain or bgzip file depending on the extension"""
+    def __init__(self, filename, compress=None):
+        if compress is None:
+            compress = _is_bgzip(filename)
+        if compress:
+            import pysam
+            self._handle = pysam.BGZFile(filename, "wb")
+        else:
+            self._handle = open(filename, "wb")
+
+    def write(self, text):
+        self._handle.write(text.encode())
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _is_bgzip(filename):
+    return filename.endswith(".gz")
+
+
+def _filter_chunk(args):
+    engine, lines = args
+    return lines, engine.filter_batch(lines)
+
+
+def _filter_region(args):
+    engine, region, part, part_filtered, compress = args
+    import pysam
+    N = unfiltered = 0
+    fout = _Writer(part, compress)
+    fout_filtered = _Writer(part_filtered, compress) if part_filtered else None
+    try:
+        with pysam.TabixFile(engine.filename) as tabix:
+            lines = []
+            for line in tabix.fetch(region):
+                lines.append(line + "\n")
+                if len(lines) == engine.chunksize:
+                    n, u = engine._filter_lines(lines, fout, fout_filtered)
+                    N, unfiltered = N + n, unfiltered + u
+                    lines = []
+            n, u = engine._filter_lines(lines, fout, fout_filtered)
+            N, unfiltered = N + n, unfiltered + u
+    finally:
+        fout.close()
+        if fout_filtered:
+            fout_filtered.close()
+    return N, unfiltered
+
+
+def get_info(info, key, index=0):
+    """Extract a numeric INFO tag from a Series of INFO strings
+
+    For tags with several values (e.g. DP4=1,2,3,4), only the value at
+    position *index* is returned. Missing values are set to NaN.
+    """
+    values = _extract_info(info, key)
+    values = values.str.split(",").str[index]
+    return pd.to_numeric(values, errors="coerce").values.astype(float)
+
+
+def get_info_matrix(info, key):
+    """Extract all values of a numeric INFO tag as a 2D array
+
+    One row per variant, one column per value (e.g., one per alternate
+    allele for the freebayes AO tag). Missing values are set to NaN.
+    """
+    values = _extract_info(info, key).str.split(",", expand=True)
+    if values.empty:
+        return np.full((len(info), 1), np.nan)
+    values = values.apply(pd.to_numeric, errors="coerce")
+    return values.values.astype(float)
+
+
+def _extract_info(info, key):
+    return info.str.extract(r"(?:^|;){}=([^;]*)".format(re.escape(key)),
+                            expand=False)
+
+
+def _get_info_sum(info, key):
+    """Sum of the values of an INFO tag (e.g. SAF=1,2 gives 3)"""
+    values = get_info_matrix(info, key)
+    total = np.nansum(values, axis=1)
+    total[np.isnan(values).all(axis=1)] = np.nan
+    return total
+
+
+def _compare(values, threshold):
+    """Vectorised version of VCF_mpileup_4dot1._filter_info_field"""
+    threshold = threshold.strip()
+    if "&" in threshold:
+        exp1, exp2 = threshold.split("&", 1)
+        return _compare(values, exp1) & _compare(values, exp2)
+    if "|" in threshold:
+        exp1, exp2 = threshold.split("|", 1)
+        return _compare(values, exp1) | _compare(values, exp2)
+
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid="ignore"):
+        if threshold.startswith("<="):
+            return values <= float(threshold[2:])
+        elif threshold.startswith("<"):
+            return values < float(threshold[1:])
+        elif threshold.startswith(">="):
+            return values >= float(threshold[2:])
+        elif threshold.startswith(">"):
+            return values > float(threshold[1:])
+    return np.zeros(len(values), dtype=bool)
+
+
+def strand_balance(forward, reverse):
+    """Vectorised strand ratio between forward and reverse counts
+
+    Same as :func:`sequana.freebayes_vcf_filter.strand_ratio` on arrays: the
+    ratio forward / (forward + reverse) folded into [0, 0.5]. Zero if there
+    is no count.
+    """
+    forward = np.asarray(forward, dtype=float)
+    reverse = np.asarray(reverse, dtype=float)
+    total = forward + reverse
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(total > 0, forward / total, 0)
+    return np.where(ratio > 0.5, 1 - ratio, ratio)
@@ -59,6 +59,20 @@ def test_compressor_args(mocker):
             assert True
 
 
+def test_compressor_unlock():
+    # --unlock is an option of the snakemake workflow only
+    # (the workflow is set up with sequana.Module)
+    with patch("sequana.Module", side_effect=RuntimeError("snakemake")), \
+            patch("sequana.compressor.Compressor") as engine:
+        try:
+            compressor.main([prog, "--source", "fastq.gz", "--target",
+                             "fastq.bz2", "--unlock"])
+            assert False
+        except RuntimeError as err:
+            assert str(err) == "snakemake"
+        assert engine.called is False
+
+
 def test_compressor_bad_extension():
     try:
         compressor.main([prog, "--source", "fastq.txt", "--target", "fastq.txt"])
@@ -29,6 +29,15 @@ def test_analysis():
     df = lane_merging.main([prog, '--pattern', dirname + "/test_L00?_R?_001*fastq.gz", 
         "--lanes", "1", "2", "--force", "--output-directory", directory.name ])
 
+    # lanes are concatenated
+    import gzip
+    data = b""
+    for lane in [1, 2]:
+        with gzip.open(dirname + "/test_L00{}_R1_001.fastq.gz".format(lane)) as fin:
+            data += fin.read()
+    with gzip.open(directory.name + "/test_R1_001.fastq.gz") as fin:
+        assert fin.read() == data
+
 
 
 def test_help():
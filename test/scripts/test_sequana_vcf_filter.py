@@ -17,3 +17,15 @@ def test_input():
 
             assert res == {'filtered': 209, 'N': 573, 'unfiltered': 364}
 
+
+
+def test_threads():
+    filename = sequana_data('JB409847.vcf')
+
+    with TempFile(suffix=".vcf.gz") as fout1:
+        with TempFile() as fout2:
+            res = vcf_filter.main([prog, '--input', filename, "--quality", "10",
+                "--filter", "DP<10", "--threads", "2",
+                "--output", fout1.name,
+                "--output-filtered", fout2.name])
+            assert res == {'filtered': 28, 'N': 64, 'unfiltered': 36}
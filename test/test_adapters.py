@@ -292,3 +292,37 @@ adapters_Nextera_2_fwd.fa
 
 
 
+
+
+def test_adapter_scanner():
+    from sequana.adapters import AdapterScanner
+    scanner = AdapterScanner(sequana_data("adapters_Nextera_fwd.fa"))
+    assert len(scanner.adapters) == 65
+
+    # the transposase revcomp at position 20 of the read
+    hits = scanner.find("ACGT" * 5 + "CTGTCTCTTATACACATCTGACGCTGCCGACGA")
+    assert hits[0] == ('Nextera_transposase_seq_1|name:transposase_seq_1',
+                       'revcomp', 20)
+    assert scanner.find("ACGT" * 10) == []
+
+    N = scanner.scan(sequana_data("test_1_1000.fastq.gz"))
+    assert N == 250 and scanner.N == 250
+    hits = scanner.get_hits()
+    assert hits.loc["Universal_Adapter|name:universal", "revcomp"] == 32
+    assert hits.loc["Universal_Adapter|name:universal", "percentage"] == 12.8
+    profiles = scanner.get_profiles("revcomp", cumulative=False)
+    assert profiles["Universal_Adapter|name:universal"].sum() == 32
+    profiles = scanner.get_profiles("both")
+    assert profiles["Universal_Adapter|name:universal"].iloc[-1] == 12.8
+    scanner.plot_profiles()
+
+    # several processes and small batches give the same results
+    other = AdapterScanner(sequana_data("adapters_Nextera_fwd.fa"), jobs=2,
+                           batch_size=100)
+    other.scan(sequana_data("test_1_1000.fastq.gz"))
+    assert (other.get_hits() == hits).all().all()
+
+    # full adapters
+    scanner = AdapterScanner(sequana_data("adapters_Nextera_fwd.fa"), k=None)
+    scanner.scan(sequana_data("test_1_1000.fastq.gz"), max_reads=10)
+    assert scanner.N == 10
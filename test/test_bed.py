@@ -1,4 +1,5 @@
 from sequana import BED, sequana_data
+from sequana.bed import merge_intervals
 
 
 
@@ -25,15 +26,45 @@ def test_wrong_file():
     except:
         assert False
 
-
-    # This function uses _get_line that returns {} if a line is incorrectly
-    # constructed (12 columns). Previous try/except uses get_exons that simply
-    # fails
+    # lines that do not have 12 columns are skipped by get_table, on which
+    # get_CDS_exons relies (whereas get_exons fails)
+    assert len(b.get_table()) == 1
     b.get_CDS_exons()
 
 
-    assert b._get_line("1 2 3") == {}
 
 
+def test_bed_table(tmpdir):
+    import shutil
+    filename = str(tmpdir.join("test.bed"))
+    shutil.copy(sequana_data("hg38_chr18.bed"), filename)
+    b = BED(filename)
+    df = b.get_table(cache=True)
+    assert len(df) == 2777
+    offsets, starts, ends = b.get_blocks()
+    assert len(offsets) == 2778
+    assert offsets[-1] == len(starts) == len(ends) == 32640
+    # exons of the first transcript
+    assert starts[0] == 7567315 and ends[0] == 7567891
+    assert list(b.get_exons()[0]) == ["chr18", 7567315, 7567891]
+
+    exons = b.get_sorted_exons(merge=True)["chr18"]
+    assert (exons[0][1:] > exons[1][:-1]).all()
+    transcripts = b.get_sorted_transcripts()["chr18"]
+    assert (transcripts[0][1:] >= transcripts[0][:-1]).all()
+    assert len(b.get_overlaps("chr18", 7567316, 7567316)) > 0
+
+    # second time, the table is read from the sidecar
+    other = BED(filename)
+    assert len(other.get_table(cache=True)) == 2777
+    assert other.get_exons() == b.get_exons()
+    assert other.get_CDS_exons() == b.get_CDS_exons()
 
 
+def test_merge_intervals():
+    # overlapping and adjacent intervals are merged
+    starts, ends = merge_intervals([10, 0, 30, 5], [20, 10, 40, 8])
+    assert list(starts) == [0, 30]
+    assert list(ends) == [20, 40]
+    starts, ends = merge_intervals([], [])
+    assert len(starts) == len(ends) == 0
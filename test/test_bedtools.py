@@ -172,6 +172,29 @@ def test_chromosome():
     chrom.run(4001)
     chrom.plot_rois(3000, 8000) 
 
+def test_rois_annotation_table():
+    import pandas as pd
+    from sequana.bedtools import FilteredGenomeCov
+    from sequana.genbank import GenBank
+    bed = bedtools.GenomeCov(sequana_data('JB409847.bed'),
+                             sequana_data('JB409847.gbk'))
+    chrom = bed[0]
+    chrom.running_median(n=501, circular=True)
+    chrom.compute_zscore()
+    rois = chrom.get_rois()
+
+    gbk = GenBank(sequana_data('JB409847.gbk'))
+    df = gbk.get_table()
+    # features of another contig must be ignored
+    other = df.copy()
+    other["seqid"] = "other"
+    df = pd.concat([df, other], ignore_index=True)
+    for features in (gbk, df):
+        filtered = FilteredGenomeCov(rois.rawdf, rois.thresholds, features)
+        assert filtered.df.equals(rois.df)
+        filtered.merge_rois_into_cnvs()
+
+
 def test_gc_content():
     bed = sequana_data('JB409847.bed')
     fasta = sequana_data('JB409847.fasta')
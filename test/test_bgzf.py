@@ -0,0 +1,138 @@
+import gzip
+import os
+
+from sequana.bgzf import BGZFWriter, BLOCK_SIZE
+from easydev import TempFile
+
+
+def test_bgzf():
+    data = b"".join(b"@read%d\nACGTACGTTT\n+\nIIIIIIIIII\n" % i for i in range(50000))
+    for threads in [1, 3]:
+        with TempFile(suffix=".gz") as fout:
+            with BGZFWriter(fout.name, threads=threads) as writer:
+                writer.write(data[:1000])
+                writer.write(data[1000:].decode())
+            with gzip.open(fout.name) as fin:
+                assert fin.read() == data
+
+    # incompressible data and empty file
+    with TempFile(suffix=".gz") as fout:
+        random = os.urandom(BLOCK_SIZE * 3)
+        with BGZFWriter(fout.name, threads=2) as writer:
+            writer.write(random)
+        with gzip.open(fout.name) as fin:
+            assert fin.read() == random
+
+        with BGZFWriter(fout.name) as writer:
+            pass
+        with gzip.open(fout.name) as fin:
+            assert fin.read() == b""
+
+
+def test_bgzf_pysam():
+    import pysam
+    with TempFile(suffix=".gz") as fout:
+        with BGZFWriter(fout.name, threads=2) as writer:
+            writer.write(b"hello\n" * 100000)
+        with pysam.BGZFile(fout.name, "rb") as fin:
+            assert fin.read() == b"hello\n" * 100000
+
+
+def test_bz2():
+    import bz2
+    from sequana.bgzf import BZ2Writer
+    data = b"".join(b"@read%d\nACGTACGTTT\n+\nIIIIIIIIII\n" % i for i in range(100000))
+    with TempFile(suffix=".bz2") as fout:
+        with BZ2Writer(fout.name, threads=3) as writer:
+            writer.write(data)
+        with bz2.open(fout.name) as fin:
+            assert fin.read() == data
+
+
+def test_concatenate(tmpdir):
+    from sequana.bgzf import check_gzip, concatenate_gzip, is_bgzf
+    data1 = b"@read1\nACGT\n+\nIIII\n" * 50000
+    data2 = b"@read2\nTTTT\n+\nIIII\n" * 10
+
+    # plain gzip files (one made of two members)
+    file1 = str(tmpdir.join("1.gz"))
+    with open(file1, "wb") as fout:
+        fout.write(gzip.compress(data1) + gzip.compress(data2))
+    file2 = str(tmpdir.join("2.gz"))
+    with open(file2, "wb") as fout:
+        fout.write(gzip.compress(data2))
+    assert check_gzip(file1, full=True) == 2
+    # plain gzip files are not decompressed by default
+    assert check_gzip(file1) is None
+    output = str(tmpdir.join("out.gz"))
+    concatenate_gzip([file1, file2], output)
+    with gzip.open(output) as fin:
+        assert fin.read() == data1 + data2 + data2
+
+    # BGZF files: a single EOF block is kept
+    for filename, data in [(file1, data1), (file2, data2)]:
+        with BGZFWriter(filename, threads=2) as writer:
+            writer.write(data)
+    assert check_gzip(file1) > 1
+    concatenate_gzip([file1, file2], output)
+    assert is_bgzf(output)
+    assert check_gzip(output) == check_gzip(file1) + check_gzip(file2) - 1
+    with gzip.open(output) as fin:
+        assert fin.read() == data1 + data2
+
+    # truncated files are rejected
+    for filename in [file1, file2]:
+        with open(filename, "rb") as fin:
+            data = fin.read()
+        with open(filename, "wb") as fout:
+            fout.write(data[:-30])
+        try:
+            check_gzip(filename)
+            assert False
+        except IOError:
+            assert True
+    with open(file1, "wb") as fout:
+        fout.write(gzip.compress(data1)[:-10])
+    try:
+        concatenate_gzip([file1, file2], output, full_check=True)
+        assert False
+    except IOError:
+        assert True
+    with open(file2, "wb") as fout:
+        fout.write(b"not a gzip file" * 10)
+    try:
+        check_gzip(file2)
+        assert False
+    except IOError:
+        assert True
+
+
+def test_concatenate_fallback(tmpdir):
+    # copy_file_range or sendfile may not be available (e.g. EXDEV, macOS)
+    from unittest.mock import patch
+    from sequana.bgzf import concatenate_gzip
+    data1 = b"@read1\nACGT\n+\nIIII\n" * 50000
+    data2 = b"@read2\nTTTT\n+\nIIII\n" * 10
+    file1 = str(tmpdir.join("1.gz"))
+    file2 = str(tmpdir.join("2.gz"))
+    output = str(tmpdir.join("out.gz"))
+    with open(file1, "wb") as fout:
+        fout.write(gzip.compress(data1))
+    with open(file2, "wb") as fout:
+        fout.write(gzip.compress(data2))
+
+    def fail(*args, **kwargs):
+        raise OSError(18, "Invalid cross-device link")
+
+    for functions in (["copy_file_range"], ["copy_file_range", "sendfile"]):
+        patches = [patch("os." + x, side_effect=fail, create=True)
+                   for x in functions]
+        for this in patches:
+            this.start()
+        try:
+            concatenate_gzip([file1, file2], output)
+        finally:
+            for this in patches:
+                this.stop()
+        with gzip.open(output) as fin:
+            assert fin.read() == data1 + data2
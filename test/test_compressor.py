@@ -0,0 +1,51 @@
+import os
+import shutil
+
+from sequana.compressor import Compressor, checksum
+from sequana import sequana_data, FastQ
+
+
+def test_compressor(tmpdir):
+    filename = sequana_data("test.fastq.gz")
+    expected = checksum(filename)
+    shutil.copy(filename, str(tmpdir.join("a.fastq.gz")))
+    tmpdir.mkdir("sub")
+    shutil.copy(filename, str(tmpdir.join("sub", "b.fastq.gz")))
+
+    c = Compressor("fastq.gz", "fastq.bz2", jobs=2, threads=2)
+    assert len(c.find_files(str(tmpdir))) == 1
+    filenames = c.find_files(str(tmpdir), recursive=True)
+    assert len(filenames) == 2
+    results = c.run(filenames)
+    assert [x["md5"] for x in results] == [expected[0]] * 2
+
+    for source, target in [("fastq.bz2", "fastq"), ("fastq", "fastq.gz")]:
+        c = Compressor(source, target, jobs=2, threads=2)
+        c.run(c.find_files(str(tmpdir), recursive=True))
+
+    assert sorted(os.listdir(str(tmpdir))) == ["a.fastq.gz", "sub"]
+    assert checksum(str(tmpdir.join("sub", "b.fastq.gz"))) == expected
+    assert FastQ(str(tmpdir.join("a.fastq.gz"))) == FastQ(filename)
+
+
+def test_compressor_errors(tmpdir, monkeypatch):
+    try:
+        Compressor("fastq.gz", "fq.bz2")
+        assert False
+    except ValueError:
+        assert True
+    try:
+        Compressor("fastq.gz", "fastq.gz")
+        assert False
+    except ValueError:
+        assert True
+
+    # a corrupted output must be removed and the input kept
+    filename = str(tmpdir.join("a.fastq.gz"))
+    shutil.copy(sequana_data("test.fastq.gz"), filename)
+    import sequana.compressor
+    monkeypatch.setattr(sequana.compressor, "checksum", lambda x, threads: (0, 0))
+    c = Compressor("fastq.gz", "fastq.bz2")
+    results = c.run([filename])
+    assert "error" in results[0]
+    assert os.listdir(str(tmpdir)) == ["a.fastq.gz"]
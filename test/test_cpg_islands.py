@@ -0,0 +1,50 @@
+import random
+
+from sequana.cpg_islands import CpG, CpGIslands, find_cpg_islands
+from sequana import sequana_data
+from easydev import TempFile
+
+
+def _get_sequence():
+    random.seed(0)
+    background = "".join(random.choice("AATTCG") for _ in range(5000))
+    island = "".join(random.choice("CG") for _ in range(300))
+    return background[:2000] + island + background[2000:]
+
+
+def test_cpg():
+    sequence = _get_sequence()
+    df = CpG(sequence)
+    assert df.start.min() == 1863
+    assert (df.end - df.start == 199).all()
+    assert (df.gc > 50).all()
+    assert len(CpG("ACGT")) == 0
+
+
+def test_find_cpg_islands():
+    sequence = _get_sequence()
+    df = find_cpg_islands(sequence)
+    assert len(df) == 1
+    island = df.iloc[0]
+    assert island.start == 1862 and island.end == 2462
+    subseq = sequence[int(island.start):int(island.end)]
+    assert island.cpg == subseq.count("CG")
+    assert island.gc == (subseq.count("C") + subseq.count("G")) / 600.
+
+    # same results computing windows by chunks
+    assert df.equals(find_cpg_islands(sequence, chunk_size=333))
+    assert len(find_cpg_islands(sequence, min_length=1000)) == 0
+    assert len(find_cpg_islands("ACGT")) == 0
+
+
+def test_cpg_islands():
+    cpg = CpGIslands(sequana_data("measles.fa"), min_gc=0.45, min_obs_exp=0.3)
+    df = cpg.run()
+    assert list(df.columns[0:3]) == ["chr", "start", "end"]
+    assert cpg.run(jobs=2).equals(df)
+    with TempFile(suffix=".bed") as fh:
+        cpg.to_bed(fh.name)
+        with open(fh.name) as fin:
+            assert len(fin.readlines()) == len(df)
+    index = cpg.get_index()
+    assert len(index) == len(df)
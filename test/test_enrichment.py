@@ -50,3 +50,29 @@ def test_panther():
     #with TempFile(suffix=".png") as fout:
     #    pe.save_chart(df, filename=fout.name)
     # too slow
+
+
+def test_ke_store(tmpdir):
+    # fully offline: pathways and background come from the store
+    from sequana.kegg_store import KeggGeneSetStore
+    pathways = {
+        "eco00010": {"NAME": "Glycolysis - Escherichia coli",
+                     "GENE": {"b2388": "glk; glucokinase",
+                              "b4025": "pgi; glucose-6-phosphate isomerase"}},
+        "eco00020": {"NAME": "Citrate cycle",
+                     "GENE": {"b0720": "gltA; citrate synthase"}}
+    }
+    filename = str(tmpdir.join("eco.kegg"))
+    KeggGeneSetStore.from_pathways(pathways, "eco", background=4000).save(filename)
+
+    RNADIFF_DIR = sequana_data("rnadiff") + "/rnadiff_onecond_1"
+    ke = KeggPathwayEnrichment(RNADIFF_DIR, "eco", log2_fc=1,
+        preload_directory=filename)
+    assert ke.background == 4000
+    assert ke.gene_sets["eco00010"] == ["glk", "pgi"]
+    assert ke.pathways["eco00010"]["NAME"] == "Glycolysis"
+    assert ke.find_pathways_by_gene("pgi") == ["eco00010"]
+    assert ke._kegg is None
+
+    ke.export_pathways_to_store(filename)
+    assert KeggGeneSetStore(filename).gene_sets == ke.gene_sets
@@ -162,3 +162,73 @@ def test_fastqc():
     assert stats['G'][0] == 5768
 
 
+
+
+def test_fastq_stats(tmpdir):
+    import shutil
+    filename = str(tmpdir.join("test.fastq"))
+    shutil.copy(data, filename)
+    # no sidecar unless requested
+    stats = fastq.FastQStats.from_file(filename)
+    sidecar = fastq.FastQStats.get_cache_filename(filename)
+    assert os.path.exists(sidecar) is False
+    stats = fastq.FastQStats.from_file(filename, cache=True)
+    assert stats.n_reads == 250
+    assert stats.total_bp == 25250
+    assert stats.base_counts["A"] == 6952
+    assert stats.min_read_length == stats.max_read_length == 101
+    assert stats.get_summary().loc[0, "n_reads"] == 250
+
+    # the sidecar is used as long as the file does not change
+    assert os.path.exists(sidecar)
+    assert fastq.FastQStats.read_cache(filename).to_dict() == stats.to_dict()
+    assert fastq.FastQ(filename).count_reads() == 250
+    os.utime(filename, ns=(1, 1))
+    assert fastq.FastQStats.read_cache(filename) is None
+
+    # no cache or cache in another directory
+    directory = tmpdir.mkdir("cache")
+    fastq.FastQStats.from_file(filename, cache=True,
+                               cache_directory=str(directory))
+    assert len(directory.listdir()) == 1
+    assert fastq.FastQStats.read_cache(filename, str(directory)) is not None
+
+    # merging (e.g. lanes)
+    merged = fastq.FastQStats.from_files([filename, datagz], cache=False)
+    assert merged.n_reads == 500
+    assert merged.base_counts["A"] == 2 * 6952
+    assert merged.gc_content == stats.gc_content
+    assert len(merged.filenames) == 2
+
+
+def test_fastq_stats_gc():
+    # same GC content whether all reads are used (FastQStats) or not
+    qc = fastq.FastQC(data, verbose=False)
+    full = qc.get_stats()
+    qc = fastq.FastQC(data, max_sample=249, verbose=False)
+    sampled = qc._get_stats()
+    assert qc.max_sample == 249
+    assert abs(full["GC content"][0] - sampled["GC content"][0]) < 1
+    qc = fastq.FastQC(data, verbose=False)
+    assert abs(full["GC content"][0] - qc._get_stats()["GC content"][0]) < 1e-9
+
+
+def test_fastqc_cache(tmpdir):
+    import shutil
+    filename = str(tmpdir.join("test.fastq"))
+    shutil.copy(data, filename)
+    assert len(fastq.FastQ(filename).get_lengths()) == 250
+
+    # statistics of all reads are saved once and used instead of the file
+    qc = fastq.FastQC(filename, max_sample=100, verbose=False, cache=True)
+    assert os.path.exists(fastq.FastQStats.get_cache_filename(filename))
+    assert qc.N == 250
+    assert qc.get_stats().loc[0, "n_reads"] == 250
+    assert qc.get_stats().loc[0, "total bases"] == 25250
+    qc.histogram_sequence_lengths()
+    lengths = fastq.FastQ(filename).get_lengths(cache=True)
+    assert lengths == sorted(fastq.FastQ(filename).get_lengths())
+
+    qc = fastq.FastQC(filename, max_sample=100, verbose=False)
+    assert qc.N == 250
+    qc.histogram_sequence_lengths()
@@ -14,3 +14,21 @@ def test_FindMotif():
 
     fm.plot_alignment(sequana_data("test_measles.bam"), "CAG", window=30)
 
+
+
+def test_window_counts():
+    from sequana.find_motif import get_window_counts
+    seq = "AAACAGCAGCAGTTCAGCAGCAGCAGA"
+    for motif in ["CAG", "CAGCAG", "AA"]:
+        for window in [1, 5, 12, 30]:
+            assert list(get_window_counts(seq, motif, window)) == \
+                [seq[i:i+window].count(motif) for i in range(len(seq))]
+
+
+def test_find_motif_jobs():
+    fm = FindMotif()
+    bamfile = sequana_data("test_measles.bam")
+    df1 = fm.find_motif_bam(bamfile, motif="CAG", local_threshold=1)
+    df2 = fm.find_motif_bam(bamfile, motif="CAG", local_threshold=1, jobs=2)
+    assert df1.equals(df2)
+    assert list(df1.columns) == ["query_name", "hit", "length", "start", "end"]
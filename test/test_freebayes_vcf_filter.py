@@ -2,7 +2,7 @@ import filecmp
 
 from easydev import TempFile
 from sequana import sequana_data
-from sequana.freebayes_vcf_filter import VCF_freebayes
+from sequana.freebayes_vcf_filter import VCF_freebayes, Variant, Filtered_freebayes
 
 
 def test_vcf_filter():
@@ -30,3 +30,25 @@ def test_to_csv():
     filter_v = v.filter_vcf(filter_dict)
     with TempFile(suffix='.csv') as ft:
         filter_v.to_csv(ft.name)
+
+
+def test_to_csv_chunks():
+    filter_dict = {'freebayes_score': 20, 'frequency': 0.5, 'min_depth': 5,
+                   'forward_depth': 1, 'reverse_depth': 1, 'strand_ratio': 0.1}
+    v = VCF_freebayes(sequana_data('JB409847.vcf'))
+    filter_v = v.filter_vcf(filter_dict)
+    assert len(filter_v.df) == 38
+    assert "freebayes_score" in filter_v.df.columns
+
+    # the data frame is the same as the one built from Variant objects
+    v.rewind()
+    variants = [Variant(x) for x in v if v._filter_line(x)]
+    assert len(variants) == len(filter_v.variants)
+    v.rewind()
+    df = Filtered_freebayes(variants, v).df
+    assert df.astype(str).equals(filter_v.df.astype(str))
+
+    with TempFile(suffix='.csv') as ft1, TempFile(suffix='.csv') as ft2:
+        filter_v.to_csv(ft1.name)
+        v.to_csv(ft2.name, filter_dict, chunksize=10)
+        assert filecmp.cmp(ft1.name, ft2.name, shallow=False)
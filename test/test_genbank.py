@@ -0,0 +1,30 @@
+import os
+import shutil
+
+from sequana.genbank import GenBank
+from sequana import sequana_data
+from easydev import TempFile
+
+
+def test_genbank_table():
+    gbk = GenBank(sequana_data("JB409847.gbk"))
+    df = gbk.get_table()
+    assert set(df.seqid) == {"JB409847"}
+    assert "CDS" in gbk.get_types()
+
+    hits = gbk.get_overlaps("JB409847", 3553, 4252)
+    assert "PROKKA_00004" in list(hits.locus_tag)
+    query, rows = gbk.get_index().batch_overlap("JB409847",
+        [17045, 3553], [17048, 4252])
+    assert list(rows[query == 1]) == list(hits.index)
+    # only the source feature covers the first interval
+    assert list(df.iloc[rows[query == 0]].type) == ["source"]
+
+
+def test_genbank_table_cache():
+    with TempFile(suffix=".gbk") as fout:
+        shutil.copy(sequana_data("JB409847.gbk"), fout.name)
+        df = GenBank(fout.name).get_table(cache=True)
+        df2 = GenBank(fout.name).get_table(cache=True)
+        assert df.equals(df2)
+        os.remove(fout.name + ".sequana.npz")
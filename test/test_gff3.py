@@ -2,6 +2,7 @@
 from sequana.gff3 import GFF3
 from sequana import sequana_data
 from easydev import TempFile
+import os
 
 def test_gff():
     gff = GFF3(sequana_data('test_small.gff3'))
@@ -20,3 +21,51 @@ def test_gff_rnadiff():
         assert df1.Length.sum() == 31755 
 
 
+
+
+def test_gff_table():
+    gff = GFF3(sequana_data('saccer3_truncated.gff'))
+    df = gff.get_table()
+    assert df.start.dtype == "int64"
+    assert "gene" in df.type.cat.categories
+    IDs = gff.get_attribute("ID")
+    assert list(IDs.fillna("NA")) == list(gff.get_df().ID.fillna("NA"))
+
+    # overlap queries
+    hits = gff.get_overlaps("chrI", 1, 62)
+    assert set(hits.stop) == {230218, 801, 62}
+    query, rows = gff.get_index().batch_overlap("chrI", [1, 100000], [62, 100010])
+    assert list(query) == [0, 0, 0, 1]
+    assert len(gff.get_index().overlap("unknown", 1, 100)) == 0
+
+
+def test_feature_index():
+    from sequana.annotations import FeatureIndex
+    # a long feature spanning the contig and short ones
+    index = FeatureIndex(["c"] * 4, [1, 10, 50, 48], [1000, 20, 60, 49])
+    query, rows = index.batch_overlap("c", [15, 49, 500], [15, 55, 500])
+    assert list(query) == [0, 0, 1, 1, 1, 2]
+    assert list(rows) == [0, 1, 0, 3, 2, 0]
+    assert len(index) == 4
+
+
+def test_gff_table_cache():
+    import shutil
+    with TempFile(suffix=".gff") as fout:
+        shutil.copy(sequana_data('saccer3_truncated.gff'), fout.name)
+        df = GFF3(fout.name).get_table(cache=True)
+        df2 = GFF3(fout.name).get_table(cache=True)
+        assert df.equals(df2)
+        os.remove(fout.name + ".sequana.npz")
+
+
+def test_gff_table_cache_empty():
+    # a header-only file gives an empty table, also when read from the sidecar
+    with TempFile(suffix=".gff") as fout:
+        with open(fout.name, "w") as fh:
+            fh.write("##gff-version 3\n")
+        df = GFF3(fout.name).get_table(cache=True)
+        df2 = GFF3(fout.name).get_table(cache=True)
+        assert len(df) == len(df2) == 0
+        assert list(df.columns) == list(df2.columns)
+        os.remove(fout.name + ".sequana.npz")
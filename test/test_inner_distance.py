@@ -0,0 +1,57 @@
+import shutil
+
+import pysam
+
+from sequana import sequana_data
+from sequana.inner_distance import (ExonIndex, get_inner_distances,
+    get_inner_distance_histogram)
+
+
+bedfile = sequana_data("hg38_chr18.bed")
+bamfile = sequana_data("test_hg38_chr18.bam")
+
+
+def test_exon_index():
+    index = ExonIndex(bedfile)
+    assert index.contigs == ["CHR18"]
+    # first exon is [7567315, 7567891)
+    assert list(index.exonic_length("CHR18", [7567300, 7567315, 0],
+        [7567320, 7567891, 100])) == [5, 576, 0]
+    assert list(index.exonic_length("CHR1", [0], [100])) == [0]
+    assert list(index.same_transcript("CHR18", [7567320, 0], [7567400, 10])) \
+        == [True, False]
+    assert list(index.same_transcript("CHR1", [0], [10])) == [False]
+
+
+def test_exon_index_cache(tmpdir):
+    import os
+    filename = str(tmpdir.join("genes.bed"))
+    shutil.copy(bedfile, filename)
+    ExonIndex(filename, cache=True)
+    assert os.path.exists(filename + ".sequana.npz")
+    index = ExonIndex(filename, cache=True)
+    assert list(index.exonic_length("CHR18", [7567315], [7567891])) == [576]
+
+
+def test_inner_distances(tmpdir):
+    df = get_inner_distances(bamfile, bedfile)
+    assert len(df) == 382
+    assert 1436 < df.val.mean() < 1437
+    assert set(df.desc) <= {"sameChrom=No", "readPairOverlap",
+        "sameTranscript=No,dist=genomic", "unknownChromosome,dist=genomic",
+        "sameTranscript=Yes,sameExon=Yes,dist=mRNA",
+        "sameTranscript=Yes,sameExon=No,dist=mRNA",
+        "sameTranscript=Yes,nonExonic=Yes,dist=genomic"}
+
+    counts, bins = get_inner_distance_histogram(df, -250, 250, 5)
+    assert len(bins) == 101
+    assert counts.sum() == ((df.val >= -250) & (df.val <= 250)).sum()
+
+    # regions of an indexed BAM file
+    filename = str(tmpdir.join("test.bam"))
+    shutil.copy(bamfile, filename)
+    pysam.index(filename)
+    other = get_inner_distances(filename, ExonIndex(bedfile), jobs=2,
+                                sample_size=None)
+    assert sorted(other.read_names) == sorted(df.read_names)
+    assert other.val.sum() == df.val.sum()
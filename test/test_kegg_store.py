@@ -0,0 +1,77 @@
+import os
+import json
+
+from sequana.kegg_store import KeggGeneSetStore
+from easydev import TempFile
+
+
+pathways = {
+    "eco00010": {
+        "ENTRY": "eco00010 Pathway",
+        "NAME": ["Glycolysis / Gluconeogenesis - Escherichia coli K-12 MG1655"],
+        "CLASS": "Metabolism; Carbohydrate metabolism",
+        "DBLINKS": {"GO": "0006096 0006094"},
+        "GENE": {"b2388": "glk; glucokinase [KO:K00845] [EC:2.7.1.2]",
+                 "b4025": "pgi; glucose-6-phosphate isomerase [KO:K01810]"},
+    },
+    "eco00020": {
+        "NAME": "Citrate cycle (TCA cycle) - Escherichia coli K-12 MG1655",
+        "GENE": {"b4025": "pgi; glucose-6-phosphate isomerase [KO:K01810]",
+                 "b0720": "gltA; citrate synthase [KO:K01647]",
+                 "b9999": "no name"},
+    },
+    "eco00030": {"NAME": "Empty pathway"},
+}
+
+
+def _check(store):
+    assert len(store) == 3
+    assert store.organism == "eco"
+    assert store.background == 4000
+    assert len(store.gene_ids) == 4
+    assert store.gene_sets == {
+        "eco00010": ["glk", "pgi"],
+        "eco00020": ["pgi", "gltA", "b9999"]}
+    assert store.pathways["eco00010"]["NAME"] == "Glycolysis / Gluconeogenesis"
+    assert store.pathways["eco00010"]["DBLINKS"] == {"GO": "0006096 0006094"}
+    assert store.pathways["eco00020"]["GENE"]["b0720"] == "gltA; citrate synthase [KO:K01647]"
+    assert "GENE" not in store.pathways["eco00030"]
+    assert store.find_pathways("b4025") == ["eco00010", "eco00020"]
+    assert store.find_pathways(["b0720", "unknown"]) == ["eco00020"]
+    assert list(store.get_gene_indices("eco00030")) == []
+
+
+def test_store():
+    store = KeggGeneSetStore.from_pathways(pathways, organism="eco", background=4000)
+    _check(store)
+
+    with TempFile(suffix=".kegg") as fout:
+        store.save(fout.name)
+        store = KeggGeneSetStore(fout.name)
+        _check(store)
+        assert "3 pathways" in str(store)
+
+        # a wrong version must be rejected
+        store.version = 2
+        store.save(fout.name)
+        try:
+            KeggGeneSetStore(fout.name)
+            assert False
+        except ValueError:
+            assert True
+
+    with TempFile(suffix=".json") as fout:
+        try:
+            KeggGeneSetStore(fout.name)
+            assert False
+        except ValueError:
+            assert True
+
+
+def test_store_from_json(tmpdir):
+    directory = tmpdir.mkdir("eco")
+    for key, data in pathways.items():
+        with open(os.path.join(str(directory), key + ".json"), "w") as fout:
+            json.dump(data, fout)
+    store = KeggGeneSetStore.from_json_directory(str(directory), background=4000)
+    _check(store)
@@ -0,0 +1,19 @@
+from sequana.kraken_builder import TaxonIndex
+
+
+def test_taxon_index(tmpdir):
+    filename = tmpdir.join("gi_taxid_nucl.dmp")
+    filename.write("1\t10\n5\t50\n3\t30\n")
+    index = TaxonIndex(str(filename))
+    assert len(index) == 3
+    assert list(index.get_taxons([5, 1, 2, 3, 100])) == [50, 10, 32644, 30, 32644]
+    # the index is reused
+    assert tmpdir.join("gi_taxid_nucl.dmp.keys.npy").exists()
+    index = TaxonIndex(str(filename))
+    assert list(index.get_taxons([3])) == [30]
+
+    filename = tmpdir.join("nucl_gb.accession2taxid")
+    filename.write("accession\taccession.version\ttaxid\tgi\n"
+                   "NC_2\tNC_2.1\t20\t5\nAB_1\tAB_1.3\t10\t4\n")
+    index = TaxonIndex(str(filename))
+    assert list(index.get_taxons(["AB_1.3", "NC_2.1", "AB_1"])) == [10, 20, 32644]
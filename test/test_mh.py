@@ -1,3 +1,5 @@
+import numpy as np
+
 from sequana.mh import MetropolisHasting
 
 
@@ -15,3 +17,20 @@ def test_mh():
     m.check(bins=100)
     m.diagnostics(bins=100)
 
+
+
+def test_mh_chains():
+    m = MetropolisHasting()
+    m.Xtarget = [0, 10, 20, 30, 40]
+    m.Ytarget = [0, 1, 2, 1, 0]
+    vec = m.simulate(20000, burning=1000, chains=100, seed=1)
+    assert len(vec) == 20000
+    assert vec.min() >= 0 and vec.max() <= 40
+    assert abs(vec.mean() - 20) < 0.5
+    assert m.proposed == 100 * 210
+    assert 0 < m.accepted < m.proposed
+    assert m.aprob_histogram.sum() == m.proposed
+    # reproducible
+    assert (m.simulate(1000, seed=2) == m.simulate(1000, seed=2)).all()
+    # reflection on the boundaries
+    assert list(m._reflect(np.array([0, 10, 40, -5, 45]))) == [0, 10, 40, 5, 35]
@@ -50,3 +50,35 @@ def test_others():
     # inverse here
     assert phred.quality_sanger_to_quality_solexa(64) < 64
     assert phred.quality_sanger_to_quality_solexa(64) > 63.99
+
+
+def test_quality_batch():
+    import array
+    import numpy as np
+    batch = phred.QualityBatch(["IIIII", "II#", ""])
+    assert len(batch) == 3
+    assert list(batch[1]) == [40, 40, 2]
+    assert batch.mean_qualities[0] == 40
+    assert np.isnan(batch.mean_qualities[2])
+    assert abs(batch.mean_error_probabilities[0] - 1e-4) < 1e-12
+    assert batch.mean_quality == 35.25
+    assert batch.to_matrix().shape == (3, 5)
+    assert batch.to_matrix()[1, 3] == 255
+    assert [len(x) for x in batch.to_list()] == [5, 3, 0]
+    assert batch.get_histogram()[40] == 7
+
+    histogram = batch.get_position_histogram()
+    assert histogram.shape == (5, 94)
+    assert histogram[2, 2] == 1 and histogram[2, 40] == 1
+    quantiles = batch.get_position_quantiles()
+    assert quantiles.loc[2, 0.5] == 2 and quantiles.loc[2, 0.9] == 40
+
+    # bytes, buffers and pysam-like arrays
+    other = phred.QualityBatch.from_buffer(b"IIIII\nII#\n\n")
+    assert (other.values == batch.values).all()
+    assert list(other.lengths) == [5, 3, 0]
+    other = phred.QualityBatch([b"IIIII", b"II#"])
+    assert (other.values == batch.values).all()
+    other = phred.QualityBatch([array.array("B", [40, 40]), [2]])
+    assert list(other.values) == [40, 40, 2]
+    assert phred.QualityBatch(["`"], offset=64).values[0] == 32
@@ -0,0 +1,60 @@
+import pytest
+
+from sequana.salmon import Salmon, get_counts_matrix, get_gene_annotation
+
+
+gff_data = """##gff-version 3
+chr1\tsrc\tgene\t1\t100\t.\t+\t.\tID=gene1;Name=A
+chr1\tsrc\tmRNA\t1\t100\t.\t+\t.\tID=rna1;Parent=gene1
+chr1\tsrc\tgene\t201\t300\t.\t-\t.\tID=gene2;Name=B
+chr1\tsrc\tgene\t401\t450\t.\t+\t.\tID=gene3;Name=C
+chr2\tsrc\tgene\t11\t60\t.\t+\t.\tID=gene3;Name=C
+"""
+
+quant_data = """Name\tLength\tEffectiveLength\tTPM\tNumReads
+gene1\t100\t80\t10\t12.6
+gene2\t98\t80\t5\t3
+gene3\t101\t80\t1\t7
+rna1\t100\t80\t0\t4
+"""
+
+
+def test_salmon(tmpdir):
+    gff = tmpdir.join("test.gff")
+    gff.write(gff_data)
+    quant = tmpdir.join("quant.sf")
+    quant.write(quant_data)
+
+    annotation = get_gene_annotation(str(gff))
+    assert annotation.loc["gene3", "Chr"] == "chr1;chr2"
+    assert annotation.loc["gene3", "Length"] == 100
+
+    s = Salmon(str(quant))
+    df = s.get_feature_counts(str(gff))
+    assert list(df.Geneid) == ["gene1", "gene2", "gene3"]
+    assert list(df[str(quant)]) == [12, 3, 7]
+
+    output = tmpdir.join("feature_counts.txt")
+    s.save_feature_counts(str(output), str(gff))
+    from sequana.featurecounts import FeatureCount
+    assert list(FeatureCount(str(output)).df.iloc[:, 0]) == [12, 3, 7]
+
+    # lengths must agree
+    quant.write(quant_data.replace("gene2\t98", "gene2\t50"))
+    with pytest.raises(ValueError):
+        Salmon(str(quant)).get_feature_counts(str(gff))
+
+
+def test_counts_matrix(tmpdir):
+    gff = tmpdir.join("test.gff")
+    gff.write(gff_data)
+    tmpdir.mkdir("A").join("quant.sf").write(quant_data)
+    tmpdir.mkdir("B").join("quant.sf").write(quant_data.replace("gene3", "other"))
+    filenames = [str(tmpdir.join(x, "quant.sf")) for x in "AB"]
+
+    df = get_counts_matrix(filenames, str(gff), jobs=2)
+    assert list(df.columns) == ["A", "B"]
+    assert df.index.name == "Geneid"
+    assert df.loc["gene3"].tolist() == [7, 0]
+    df = get_counts_matrix(filenames, str(gff), sample_names=["a", "b"])
+    assert list(df.columns) == ["a", "b"]
@@ -16,3 +16,28 @@ def test_sequana_data():
         assert False 
 
     sequana_data("Hm2_GTGAAA_L005_R1_001.fastq.gz", "data")
+
+
+def test_lazy_exports():
+    import sequana
+    from sequana import FastA
+    assert FastA.__module__ == "sequana.fasta"
+    assert "BAM" in dir(sequana)
+    try:
+        sequana.dummy
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_import_time():
+    # guard against heavy dependencies being imported by "import sequana"
+    import json
+    import subprocess
+    import sys
+    cmd = "import sys, json, sequana; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.check_output([sys.executable, "-c", cmd])
+    modules = set(json.loads(output.decode().strip().split("\n")[-1]))
+    for name in ["pysam", "pandas", "numpy", "snakemake", "matplotlib",
+                 "scipy", "sequana.bamtools", "sequana.snaketools"]:
+        assert name not in modules, name
@@ -0,0 +1,70 @@
+from sequana.startup_benchmark import StartupBenchmark, main
+from easydev import TempFile
+import json
+import sys
+
+
+def test_startup_benchmark():
+    sb = StartupBenchmark(["sequana_bam_splitter"], repeat=1)
+    results = sb.run()
+    assert [x["scenario"] for x in results] == ["help", "run"]
+    for result in results:
+        assert result["wall_time"] > 0
+        assert result["modules"] > 0
+        assert result["peak_rss"] > 0
+
+    thresholds = sb.get_thresholds(tolerance=2)
+    assert sb.check(thresholds) == []
+    thresholds["sequana_bam_splitter help"]["modules"] = 1
+    assert len(sb.check(thresholds)) == 1
+
+    with TempFile(suffix=".json") as fout:
+        sb.to_json(fout.name)
+        data = json.load(open(fout.name))
+        assert len(data["results"]) == 2
+
+    try:
+        StartupBenchmark(["dummy"])
+        assert False
+    except ValueError:
+        assert True
+
+
+def test_main():
+    with TempFile(suffix=".json") as fout:
+        main(["prog", "--names", "sequana_lane_merging", "--repeat", "1",
+              "--save-thresholds", fout.name, "--tolerance", "10",
+              "--modules-tolerance", "1.5"])
+        version = "{}.{}".format(*sys.version_info[:2])
+        assert json.load(open(fout.name))[version]["sequana_lane_merging run"]
+        main(["prog", "--names", "sequana_lane_merging", "--repeat", "1",
+              "--thresholds", fout.name, "--metrics", "modules"])
+
+    # thresholds are per Python version; other versions are not checked
+    sb = StartupBenchmark(["sequana_bam_splitter"], repeat=1)
+    sb.run()
+    with TempFile(suffix=".json") as fout:
+        with open(fout.name, "w") as fh:
+            json.dump({"2.7": {"sequana_bam_splitter help": {"modules": 1}}}, fh)
+        assert sb.check(fout.name) == []
+        sb.save_thresholds(fout.name)
+        data = json.load(open(fout.name))
+        assert len(data) == 2
+        assert sb.check(fout.name) == []
+        thresholds = sb.get_thresholds()
+        thresholds["sequana_bam_splitter help"]["modules"] = 1
+        assert len(sb.check(thresholds)) == 1
+        assert sb.check(thresholds, metrics=["wall_time"]) == []
+
+
+def test_package_modules():
+    # the applications must not import the whole package (lazy imports).
+    # Only the number of modules is checked; times and memory are checked
+    # by the opt-in startup job (see the startup_benchmark module)
+    sb = StartupBenchmark(["sequana_vcf_filter", "sequana_compressor",
+                           "sequana_lane_merging"], repeat=1)
+    results = sb.run()
+    assert [x["scenario"] for x in results] == ["help", "run"] * 3
+    package = sb.get_package_modules()
+    for result in results:
+        assert result["modules"] < package * 0.6, result["command"]
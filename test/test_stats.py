@@ -8,3 +8,31 @@ def test_ma():
 def test_evenness():
     assert evenness([1,1,1,1,4,4,4,4]) == 0.75
     assert evenness([1,1,1,1]) == 1
+
+
+def test_N50():
+    import numpy as np
+    from sequana.stats import N50, L50, LengthHistogram
+    data = [2, 2, 2, 3, 3, 4, 8, 8]
+    assert N50(data) == 8
+    assert L50(data) == 2
+    # same with histogram input
+    assert N50([2, 3, 4, 8], counts=[3, 2, 1, 2]) == 8
+    assert L50([2, 3, 4, 8], counts=[3, 2, 1, 2]) == 2
+    # float lengths are sorted
+    assert N50(np.array(data, dtype=float)) == 8
+
+    # merged shards give the statistics of the concatenated lengths
+    lengths = np.random.randint(1, 10000, 10000)
+    h = LengthHistogram(lengths[:3000]) + LengthHistogram(lengths[3000:])
+    assert len(h) == 10000
+    assert h.total == lengths.sum()
+    assert h.N50() == N50(lengths)
+    assert h.L50() == L50(lengths)
+    stats = h.get_stats()
+    assert stats["max_length"] == lengths.max()
+
+
+def test_evenness_histogram():
+    assert evenness([1, 4], counts=[4, 4]) == 0.75
+    assert evenness([1., 1., float("nan")]) == 1
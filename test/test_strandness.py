@@ -0,0 +1,55 @@
+import pysam
+
+from sequana import sequana_data
+from sequana.strandness import (GeneStrandIndex, get_strandness_counts,
+    infer_strandness, PLUS, MINUS, NONE)
+
+
+bedfile = sequana_data("hg38_chr18.bed")
+bamfile = sequana_data("test_hg38_chr18.bam")
+
+
+def test_index():
+    index = GeneStrandIndex(bedfile)
+    assert index.contigs == ["chr18"]
+    assert list(index.query("chr18", [7567400, 0], [7567500, 10])) == [PLUS, NONE]
+    assert list(index.query("chr1", [0], [10])) == [NONE]
+    # interval end is excluded
+    assert index.query("chr18", [7567300], [7567315])[0] == NONE
+    assert index.query("chr18", [7567300], [7567316])[0] == PLUS
+
+    index = GeneStrandIndex(sequana_data("saccer3_truncated.gff"))
+    assert len(index.contigs)
+
+
+def test_index_cache(tmpdir):
+    import os
+    import shutil
+    filename = str(tmpdir.join("genes.bed"))
+    shutil.copy(bedfile, filename)
+    index = GeneStrandIndex(filename, cache=True)
+    assert os.path.exists(filename + ".sequana.npz")
+    other = GeneStrandIndex(filename, cache=True)
+    assert list(other.query("chr18", [7567400], [7567500])) == [PLUS]
+    assert other.contigs == index.contigs
+
+
+def test_strandness(tmpdir):
+    index = GeneStrandIndex(bedfile)
+    counts = get_strandness_counts(bamfile, index)
+    protocol, spec1, spec2, other = counts.get_strandness()
+    assert protocol == "Paired-end"
+    assert spec1 > 0.94 and spec2 < 0.06
+
+    # sorted and indexed BAM: reads are sampled over the genome
+    sorted_bam = str(tmpdir.join("sorted.bam"))
+    pysam.sort("-o", sorted_bam, bamfile)
+    pysam.index(sorted_bam)
+    counts = get_strandness_counts(sorted_bam, index, max_entries=100,
+                                   n_regions=10)
+    assert 0 < len(counts) < len(get_strandness_counts(sorted_bam, index))
+    assert get_strandness_counts(sorted_bam, index).get_strandness()[1] > 0.94
+
+    df = infer_strandness([bamfile, sorted_bam], bedfile, jobs=2)
+    assert list(df["strand"]) == [1, 1]
+    assert (df["protocol"] == "Paired-end").all()
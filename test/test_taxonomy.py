@@ -5,3 +5,34 @@ def test_taxonomy():
     from sequana.taxonomy import NCBITaxonomy                                                        
     n = NCBITaxonomy("https://raw.githubusercontent.com/sequana/data/master/kraken_toydb/taxonomy/names.dmp", "https://raw.githubusercontent.com/sequana/data/master/kraken_toydb/taxonomy/nodes.dmp")
     n.create_taxonomy_file("taxo.dat")           
+
+
+def test_taxonomy_file(tmpdir):
+    from sequana.taxonomy import NCBITaxonomy
+    nodes = tmpdir.join("nodes.dmp")
+    nodes.write("1\t|\t1\t|\tno rank\t|\t\t|\t8\t|\t0\t|\t1\t|\t0\t|\t0\t|\t0\t|\t0\t|\t0\t|\t\t|\n"
+                "2\t|\t1\t|\tsuperkingdom\t|\t\t|\t0\t|\t0\t|\t11\t|\t0\t|\t0\t|\t0\t|\t0\t|\t0\t|\t\t|\n"
+                "6\t|\t2\t|\tgenus\t|\t\t|\t0\t|\t1\t|\t11\t|\t1\t|\t0\t|\t1\t|\t0\t|\t0\t|\t\t|\n")
+    names = tmpdir.join("names.dmp")
+    names.write("1\t|\tall\t|\t\t|\tsynonym\t|\n"
+                "1\t|\troot\t|\t\t|\tscientific name\t|\n"
+                "2\t|\tBacteria\t|\tBacteria <prokaryotes>\t|\tscientific name\t|\n"
+                "6\t|\tAzorhizobium\t|\t\t|\tscientific name\t|\n")
+    n = NCBITaxonomy(str(names), str(nodes))
+    filename = str(tmpdir.join("taxonomy.dat"))
+    n.create_taxonomy_file(filename)
+    with open(filename) as fin:
+        assert fin.read().startswith("ID                        : 1\n"
+            "PARENT ID                 : 1\nRANK                      : no rank\n"
+            "SCIENTIFIC NAME           : root\n//\n")
+
+    tax = Taxonomy(filename, online=False)
+    tax.download_taxonomic_file = lambda overwrite=False: None
+    tax.load_records()
+    assert len(tax) == 3
+    assert tax[6] == {"id": 6, "parent": 2, "rank": "genus",
+                      "scientific_name": "Azorhizobium"}
+    assert tax.get_lineage(6) == ["root", "Bacteria", "Azorhizobium"]
+    assert tax.get_children(1) == [2]
+    assert tax.get_names_for_given_rank("genus") == ["Azorhizobium"]
+    assert tax.get_ranks()["genus"] == 1
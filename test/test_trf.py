@@ -10,3 +10,34 @@ def test_trf():
     tt.hist_period_size()
     tt.hist_entropy()
     tt.hist_repet_by_sequence()
+
+
+def test_trf_chunks(tmpdir):
+    from sequana.trf import read_trf
+    filename = sequana_data("test_trf1.dat")
+    df = TRF(filename).df
+    assert len(df) == 16
+    assert df.sequence_name.dtype == "category"
+    assert sum(len(x) for x in read_trf(filename, chunksize=5)) == 16
+
+    # filters while reading
+    tt = TRF(filename, motifs=["A"], min_cnv=10)
+    assert len(tt.df) == len(df.query("seq1 == 'A' and CNV >= 10"))
+    tt = TRF(filename, period_size=[1, 2])
+    assert len(tt.df) == len(df.query("period_size in [1, 2]"))
+
+    # blocks of sequences read in parallel
+    tt = TRF(filename, jobs=2)
+    assert list(tt.df.start) == list(df.start)
+    assert list(tt.df.sequence_name) == list(df.sequence_name)
+
+
+def test_trf_parquet(tmpdir):
+    import pytest
+    pytest.importorskip("pyarrow")
+    from sequana.trf import trf_to_parquet
+    filename = sequana_data("test_trf1.dat")
+    output = str(tmpdir.join("trf.parquet"))
+    assert trf_to_parquet(filename, output, chunksize=5) == 16
+    tt = TRF(output)
+    assert list(tt.df.start) == list(TRF(filename).df.start)
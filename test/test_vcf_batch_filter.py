@@ -0,0 +1,50 @@
+import gzip
+
+import pysam
+
+from sequana.vcf_batch_filter import VCFBatchFilter
+from sequana.freebayes_vcf_filter import VCF_freebayes
+from sequana.vcf_filter import VCF_mpileup_4dot1
+from sequana import sequana_data
+from easydev import TempFile
+
+
+def test_filter_dict():
+    filename = sequana_data("JB409847.vcf")
+    for filter_dict in [{"QUAL": 10, "INFO": {"AO": "<5|>20"}},
+                        {"QUAL": -1, "INFO": {"DP": ">10&<20"}}]:
+        v = VCF_mpileup_4dot1(filename, verbose=False)
+        v.filter_dict = filter_dict
+        e = VCFBatchFilter(filename, chunksize=10)
+        e.filter_dict = filter_dict
+        with TempFile() as fout:
+            assert v.filter_vcf(fout.name) == e.filter_vcf(fout.name)
+
+
+def test_freebayes_params():
+    filename = sequana_data("JB409847.vcf")
+    params = {"freebayes_score": 20, "frequency": 0.8, "min_depth": 10,
+              "forward_depth": 3, "reverse_depth": 3, "strand_ratio": 0.2}
+    filtered = VCF_freebayes(filename).filter_vcf(params)
+    expected = [(x.record.CHROM, x.record.POS) for x in filtered.variants]
+
+    e = VCFBatchFilter(filename, chunksize=10)
+    e.freebayes_params = params
+    with TempFile(suffix=".vcf") as fout, TempFile(suffix=".vcf") as fout2:
+        res = e.filter_vcf(fout.name, fout2.name, threads=2)
+        assert res == {"N": 64, "filtered": 36, "unfiltered": 28}
+        with open(fout.name) as fin:
+            data = [x.split()[0:2] for x in fin if not x.startswith("#")]
+        assert [(x, int(y)) for x, y in data] == expected
+
+        # same results with a bgzipped and indexed VCF
+        with TempFile(suffix=".vcf.gz") as fgz, \
+                TempFile(suffix=".vcf.gz") as fout_gz:
+            pysam.tabix_compress(filename, fgz.name, force=True)
+            pysam.tabix_index(fgz.name, preset="vcf", force=True)
+            e = VCFBatchFilter(fgz.name, chunksize=10)
+            e.freebayes_params = params
+            assert e.is_indexed
+            assert e.filter_vcf(fout_gz.name, threads=2) == res
+            with open(fout.name) as fin:
+                assert gzip.open(fout_gz.name, "rt").read() == fin.read()